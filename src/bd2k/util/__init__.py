@@ -2,81 +2,428 @@ from __future__ import absolute_import
 
 import datetime
 import grp
+import os
 import pwd
 from functools import wraps
 
 from threading import Lock
+import weakref
 
 import re
 
+from bd2k.util.cache import Cache, DiskCache, Flight, make_key, now, register
 
-def uid_to_name( uid ):
-    return pwd.getpwuid( uid ).pw_name
 
+def memoize( f=None, maxsize=None, ttl=None, policy='lru', typed=False, freeze=False ):
+    """
+    A decorator that memoizes a function result based on its parameters. For example, this can be
+    used in place of lazy initialization. If the decorating function is invoked by multiple
+    threads, the decorated function may be called more than once with the same arguments.
 
-def gid_to_name( gid ):
-    return grp.getgrgid( gid ).gr_name
+    By default, every result is kept for the lifetime of the decorated function. Long-running
+    processes should bound the cache with the maxsize and/or ttl arguments. See Cache for their
+    meaning and for the eviction policies. Looking up a memoized result never acquires a lock.
+
+    The decorating function has a cache_info() method that returns statistics about its cache and
+    a cache_clear() method that empties the cache. See also bd2k.util.cache.all_cache_info().
+
+    Results are looked up by the positional and keyword arguments of each call. Pass typed=True
+    to distinguish between arguments that compare equal but are of different types. Pass
+    freeze=True to allow lists, dictionaries and sets as arguments, at the expense of converting
+    them on every call. See bd2k.util.cache.make_key() for details.
+
+    >>> @memoize
+    ... def f( x ):
+    ...     print( 'computing', x )
+    ...     return x * 2
+    >>> f( 1 ), f( 1 )
+    computing 1
+    (2, 2)
+
+    >>> @memoize( maxsize=2 )
+    ... def f( x ):
+    ...     print( 'computing', x )
+    ...     return x * 2
+    >>> f( 1 ), f( 2 ), f( 1 )
+    computing 1
+    computing 2
+    (2, 4, 2)
+
+    Since 1 was used more recently than 2, 2 is evicted to make room for 3:
+
+    >>> f( 3 ), f( 1 ), f( 2 )
+    computing 3
+    computing 2
+    (6, 2, 4)
+    >>> info = f.cache_info( )
+    >>> info.hits, info.misses, info.currsize, info.evictions
+    (2, 4, 2, 2)
+    >>> f.cache_clear( )
+    >>> f( 1 )
+    computing 1
+    2
+
+    >>> @memoize( freeze=True )
+    ... def total( xs, start=0 ):
+    ...     print( 'computing', xs )
+    ...     return sum( xs, start )
+    >>> total( [ 1, 2 ], start=3 ), total( [ 1, 2 ], start=3 )
+    computing [1, 2]
+    (6, 6)
+    """
 
+    # TODO: Recommend that f's arguments be immutable
 
-def name_to_uid( name ):
-    return pwd.getpwnam( name ).pw_uid
+    if f is None:
+        return lambda f: memoize( f, maxsize=maxsize, ttl=ttl, policy=policy, typed=typed,
+                                  freeze=freeze )
 
+    return _memoized( f, Cache( maxsize=maxsize, ttl=ttl, policy=policy ), typed, freeze )
 
-def name_to_gid( name ):
-    return grp.getgrnam( name ).gr_gid
 
+def _memoized( f, cache, typed, freeze ):
+    """
+    Return a function that memoizes the given function in the given cache, a Cache or DiskCache.
+    """
+    get, put = cache.get, cache.put
+    slow = typed or freeze
 
-def memoize( f ):
+    @wraps( f )
+    def new_f( *args, **kwargs ):
+        key = make_key( args, kwargs, typed, freeze ) if kwargs or slow else args
+        try:
+            r = get( key )
+        except KeyError:
+            start = now( )
+            r = f( *args, **kwargs )
+            cache.miss_time += now( ) - start
+            cache.misses += 1
+            put( key, r )
+            return r
+        else:
+            cache.hits += 1
+            return r
+
+    register( new_f, cache )
+    return new_f
+
+
+def sync_memoize( f=None, maxsize=None, ttl=None, policy='lru', typed=False, freeze=False ):
     """
-    A decorator that memoizes a function result based on its parameters. For example, this can be
-    used in place of lazy initialization. If the decorating function is invoked by multiple
-    threads, the decorated function may be called more than once with the same arguments.
+    Like memoize, but guarantees that decorated function is only called once, even when multiple
+    threads are calling the decorating function with multiple parameters. Evicted or expired
+    results will be recomputed, of course.
+
+    Concurrent callers with the same arguments wait for a single invocation of the decorated
+    function and share its result or exception. Callers with different arguments don't block each
+    other. The decorated function may be recursive. If it calls itself with the same arguments,
+    that call is not memoized. Two threads that wait for each other's results, on the other hand,
+    will deadlock.
+
+    >>> @sync_memoize( ttl=60 )
+    ... def f( x ):
+    ...     print( 'computing', x )
+    ...     return x * 2
+    >>> f( 1 ), f( 1 )
+    computing 1
+    (2, 2)
+
+    >>> @sync_memoize
+    ... def fib( n ):
+    ...     return n if n < 2 else fib( n - 1 ) + fib( n - 2 )
+    >>> fib( 100 )
+    354224848179261915075
     """
 
-    # TODO: Recommend that f's arguments be immutable
+    if f is None:
+        return lambda f: sync_memoize( f, maxsize=maxsize, ttl=ttl, policy=policy, typed=typed,
+                                       freeze=freeze )
 
-    memory = { }
+    cache = Cache( maxsize=maxsize, ttl=ttl, policy=policy )
+    get, put = cache.get, cache.put
+    slow = typed or freeze
+    # The computations in progress, by key. Also guards against a caller missing the
+    # cache just before a concurrent computation of the same result lands.
+    flights = { }
+    lock = Lock( )
+
+    def compute( args, kwargs ):
+        start = now( )
+        try:
+            return f( *args, **kwargs )
+        finally:
+            cache.miss_time += now( ) - start
+            cache.misses += 1
 
     @wraps( f )
-    def new_f( *args ):
+    def new_f( *args, **kwargs ):
+        key = make_key( args, kwargs, typed, freeze ) if kwargs or slow else args
         try:
-            return memory[ args ]
+            r = get( key )
         except KeyError:
-            r = f( *args )
-            memory[ args ] = r
+            pass
+        else:
+            cache.hits += 1
+            return r
+        with lock:
+            try:
+                r = get( key )
+            except KeyError:
+                flight = flights.get( key )
+                if flight is None:
+                    flight = flights[ key ] = Flight( )
+                    owned = True
+                else:
+                    owned = False
+            else:
+                cache.hits += 1
+                return r
+        if owned:
+            try:
+                r = compute( args, kwargs )
+            except:
+                flight.crash( )
+                raise
+            else:
+                put( key, r )
+                flight.land( r )
+                return r
+            finally:
+                with lock:
+                    del flights[ key ]
+        elif flight.is_owned( ):
+            # Waiting on ourselves would deadlock
+            return compute( args, kwargs )
+        else:
+            r = flight.wait( )
+            cache.hits += 1
             return r
 
+    register( new_f, cache )
     return new_f
 
 
-def sync_memoize( f ):
+def disk_memoize( path, max_bytes=None, typed=False, freeze=False ):
     """
-    Like memoize, but guarantees that decorated function is only called once, even when multiple
-    threads are calling the decorating function with multiple parameters.
+    A decorator like memoize, but one that keeps results in files below the given directory such
+    that they survive the process and are shared with other processes on the same host. Each
+    decorated function gets its own subdirectory named after the function. Results and arguments
+    must be picklable. Like with memoize, concurrent callers may compute the same result more
+    than once. See DiskCache for the meaning of max_bytes.
+
+    This is only worthwhile for functions that take much longer than reading a file, and only
+    for pure functions, of course. Unpickling a result from an older version of a function is
+    not detected. Clear the cache by invoking cache_clear() or by deleting the directory when a
+    function's results change.
+
+    >>> import shutil, tempfile
+    >>> path = tempfile.mkdtemp( )
+    >>> def f( x ):
+    ...     print( 'computing', x )
+    ...     return x * 2
+    >>> disk_memoize( path )( f )( 1 )
+    computing 1
+    2
+
+    A different process, or in this case a different decorating function, finds the result:
+
+    >>> disk_memoize( path )( f )( 1 )
+    2
+    >>> shutil.rmtree( path )
     """
 
-    # TODO: Think about an f that is recursive
+    def decorator( f ):
+        name = '%s.%s' % (f.__module__, getattr( f, '__qualname__', f.__name__ ))
+        cache = DiskCache( os.path.join( path, name ), max_bytes=max_bytes )
+        return _memoized( f, cache, typed, freeze )
+
+    return decorator
+
 
-    memory = { }
+def memoize_method( f ):
+    """
+    A decorator that memoizes the result of a method based on its parameters, separately for
+    each instance. Unlike memoize, which would keep each instance alive for as long as the method
+    exists, the results are stored in the instance itself and vanish along with it. Like with
+    memoize, concurrent callers may compute the same result more than once, but they will all
+    get the result that was stored first.
+
+    >>> class Foo( object ):
+    ...     @memoize_method
+    ...     def double( self, x ):
+    ...         print( 'computing', x )
+    ...         return x * 2
+    >>> foo = Foo( )
+    >>> foo.double( 1 ), foo.double( 1 ), foo.double( x=1 )
+    computing 1
+    computing 1
+    (2, 2, 2)
+    >>> Foo( ).double( 1 )
+    computing 1
+    2
+
+    The results are kept by the decorator, not in the instance, so they don't show up in the
+    instance's __dict__, aren't pickled along with the instance and aren't shared with copies of
+    it. The decorator only references each instance weakly and discards its results when the
+    instance dies. This requires the instances to support weak references, but not to be
+    hashable. A result referencing its instance will keep the instance alive, though.
+    """
+    # Maps the id() of each instance to a weak reference to that instance and the results for it
+    memos = { }
     lock = Lock( )
 
+    def memo( self ):
+        key = id( self )
+        with lock:
+            entry = memos.get( key )
+            if entry is not None and entry[ 0 ]( ) is self:
+                return entry[ 1 ]
+
+            def forget( ref ):
+                # The id may have been reused by then, only remove the entry for this instance
+                entry = memos.get( key )
+                if entry is not None and entry[ 0 ] is ref:
+                    memos.pop( key, None )
+
+            results = { }
+            memos[ key ] = weakref.ref( self, forget ), results
+            return results
+
     @wraps( f )
-    def new_f( *args ):
+    def new_f( self, *args, **kwargs ):
+        key = make_key( args, kwargs ) if kwargs else args
+        entry = memos.get( id( self ) )
+        if entry is not None and entry[ 0 ]( ) is self:
+            results = entry[ 1 ]
+        else:
+            results = memo( self )
         try:
-            return memory[ args ]
+            return results[ key ]
         except KeyError:
-            # on cache misses, retry with lock held
-            with lock:
-                try:
-                    return memory[ args ]
-                except KeyError:
-                    r = f( *args )
-                    memory[ args ] = r
-                    return r
+            return results.setdefault( key, f( self, *args, **kwargs ) )
 
     return new_f
 
 
+# The user and group databases may be served remotely, via LDAP for example, so lookups are
+# cached. Entries expire such that changes to the databases are eventually picked up. Each of the
+# functions below has a cache_info() method reporting hits and misses.
+
+id_cache_size = 65536
+id_cache_ttl = 300  # seconds
+
+# Bulk lookups with more misses than this will enumerate the entire database
+id_enumeration_threshold = 16
+
+# The keys that the bulk lookups failed to resolve, cached just like the results, so that repeated
+# bulk lookups of unknown keys don't hit the name service or enumerate the database again
+_unknown_uids = Cache( maxsize=id_cache_size, ttl=id_cache_ttl )
+_unknown_gids = Cache( maxsize=id_cache_size, ttl=id_cache_ttl )
+_unknown_user_names = Cache( maxsize=id_cache_size, ttl=id_cache_ttl )
+_unknown_group_names = Cache( maxsize=id_cache_size, ttl=id_cache_ttl )
+
+
+@memoize( maxsize=id_cache_size, ttl=id_cache_ttl )
+def uid_to_name( uid ):
+    return pwd.getpwuid( uid ).pw_name
+
+
+@memoize( maxsize=id_cache_size, ttl=id_cache_ttl )
+def gid_to_name( gid ):
+    return grp.getgrgid( gid ).gr_name
+
+
+@memoize( maxsize=id_cache_size, ttl=id_cache_ttl )
+def name_to_uid( name ):
+    return pwd.getpwnam( name ).pw_uid
+
+
+@memoize( maxsize=id_cache_size, ttl=id_cache_ttl )
+def name_to_gid( name ):
+    return grp.getgrnam( name ).gr_gid
+
+
+def uids_to_names( uids ):
+    """
+    Resolve many user IDs at once, returning a dictionary mapping each given ID to the
+    corresponding user name. IDs without a user are omitted. Cached results are used where
+    possible. If many IDs are missing from the cache, the user database is enumerated once instead
+    of looking up each ID separately. IDs that weren't enumerated, e.g. because the name service
+    doesn't support enumeration, are then looked up separately. IDs without a user are cached,
+    too, for as long as the results, so repeated lookups of such IDs are cheap.
+
+    >>> uids_to_names( [ 0, 0 ] )
+    {0: 'root'}
+    """
+    return _resolve_many( uids, uid_to_name, _unknown_uids, pwd.getpwall,
+                          lambda p: (p.pw_uid, p.pw_name) )
+
+
+def gids_to_names( gids ):
+    """
+    Like uids_to_names() but for group IDs.
+
+    >>> gids_to_names( [ 0 ] )
+    {0: 'root'}
+    """
+    return _resolve_many( gids, gid_to_name, _unknown_gids, grp.getgrall,
+                          lambda g: (g.gr_gid, g.gr_name) )
+
+
+def names_to_uids( names ):
+    """
+    Like uids_to_names() but resolves user names to user IDs.
+
+    >>> names_to_uids( [ 'root', 'no such user, hopefully' ] )
+    {'root': 0}
+    """
+    return _resolve_many( names, name_to_uid, _unknown_user_names, pwd.getpwall,
+                          lambda p: (p.pw_name, p.pw_uid) )
+
+
+def names_to_gids( names ):
+    """
+    Like uids_to_names() but resolves group names to group IDs.
+
+    >>> names_to_gids( [ 'root' ] )
+    {'root': 0}
+    """
+    return _resolve_many( names, name_to_gid, _unknown_group_names, grp.getgrall,
+                          lambda g: (g.gr_name, g.gr_gid) )
+
+
+def _resolve_many( keys, resolve, unknown, enumerate_entries, entry_to_item ):
+    cache = resolve.cache
+    result = { }
+    missing = set( )
+    for key in set( keys ):
+        try:
+            result[ key ] = cache.get( (key,) )
+        except KeyError:
+            try:
+                unknown.get( key )
+            except KeyError:
+                missing.add( key )
+            else:
+                cache.hits += 1
+        else:
+            cache.hits += 1
+    if len( missing ) > id_enumeration_threshold:
+        for entry in enumerate_entries( ):
+            key, value = entry_to_item( entry )
+            if key in missing:
+                missing.remove( key )
+                cache.misses += 1
+                cache.put( (key,), value )
+                result[ key ] = value
+    for key in missing:
+        try:
+            result[ key ] = resolve( key )
+        except KeyError:
+            unknown.put( key, None )
+    return result
+
+
 def properties( obj ):
     """
     Returns a dictionary with one entry per attribute of the given object. The key being the
@@ -178,30 +525,99 @@ _rfc3339_datetime_re = rfc3339_datetime_re( )
 
 def parse_iso_utc( s ):
     """
-    Parses an ISO time with a hard-coded Z for zulu-time (UTC) at the end. Other timezones are
-    not supported.
+    Parses an ISO time, an RFC-3339 date-time to be precise, and converts it to UTC. The time is
+    expected to end in either a Z for zulu-time (UTC) or a numeric offset from UTC. Fractions of
+    a second are truncated to microseconds.
 
     :param str s: the ISO-formatted time
 
     :rtype: datetime.datetime
 
-    :return: an timezone-naive datetime object
+    :return: an timezone-naive datetime object representing the time in UTC
 
     >>> parse_iso_utc('2016-04-27T00:28:04.000Z')
     datetime.datetime(2016, 4, 27, 0, 28, 4)
     >>> parse_iso_utc('2016-04-27T00:28:04Z')
     datetime.datetime(2016, 4, 27, 0, 28, 4)
+    >>> parse_iso_utc('2016-04-27T00:28:04.5-08:30')
+    datetime.datetime(2016, 4, 27, 8, 58, 4, 500000)
+    >>> parse_iso_utc('2016-04-27T00:28:04.1234567+01:00')
+    datetime.datetime(2016, 4, 26, 23, 28, 4, 123456)
     >>> parse_iso_utc('2016-04-27T00:28:04X')
     Traceback (most recent call last):
     ...
     ValueError: Not a valid ISO datetime in UTC: 2016-04-27T00:28:04X
+    >>> parse_iso_utc('2016-13-27T00:28:04Z')
+    Traceback (most recent call last):
+    ...
+    ValueError: month must be in 1..12
     """
     m = _rfc3339_datetime_re.match( s )
     if not m:
         raise ValueError( 'Not a valid ISO datetime in UTC: ' + s )
     else:
-        fmt = '%Y-%m-%dT%H:%M:%S' + ('.%f' if m.group( 7 ) else '') + 'Z'
-        return datetime.datetime.strptime( s, fmt )
+        return _datetime_from_match( m )
+
+
+def parse_iso_utc_many( strings, datetime64=False ):
+    """
+    Like parse_iso_utc() but parses an iterable of ISO times at once, a list or a NumPy array of
+    strings, for example.
+
+    :param strings: the ISO-formatted times
+
+    :param bool datetime64: If False, return a list of datetime objects. If True, return a NumPy
+           array of datetime64 values with a resolution of one microsecond. This requires NumPy
+           to be installed.
+
+    >>> parse_iso_utc_many( [ '2016-04-27T00:28:04Z', '2016-04-27T00:28:04.25+02:00' ] )
+    [datetime.datetime(2016, 4, 27, 0, 28, 4), datetime.datetime(2016, 4, 26, 22, 28, 4, 250000)]
+    >>> parse_iso_utc_many( [ '2016-04-27T00:28:04Z', 'bla' ] )
+    Traceback (most recent call last):
+    ...
+    ValueError: Not a valid ISO datetime in UTC: bla
+    """
+    match = _rfc3339_datetime_re.match
+    from_match = _datetime_from_match
+    result = [ ]
+    append = result.append
+    for s in strings:
+        m = match( s )
+        if not m:
+            raise ValueError( 'Not a valid ISO datetime in UTC: ' + s )
+        append( from_match( m ) )
+    if datetime64:
+        import numpy
+        result = numpy.array( result, dtype='datetime64[us]' )
+    return result
+
+
+_zero = datetime.timedelta( 0 )
+
+
+# There are only so many syntactically valid offsets
+@memoize
+def _utc_offset( tz ):
+    """
+    Convert the time zone group of an RFC-3339 date-time to a timedelta.
+    """
+    if tz == 'Z':
+        return _zero
+    else:
+        offset = datetime.timedelta( hours=int( tz[ 1:3 ] ), minutes=int( tz[ 4:6 ] ) )
+        return -offset if tz[ 0 ] == '-' else offset
+
+
+def _datetime_from_match( m ):
+    """
+    Construct a datetime in UTC directly from the groups of an RFC-3339 date-time match, avoiding
+    the relatively expensive strptime().
+    """
+    year, month, day, hour, minute, second, fraction, tz = m.groups( )
+    t = datetime.datetime( int( year ), int( month ), int( day ),
+                           int( hour ), int( minute ), int( second ),
+                           int( fraction[ :6 ].ljust( 6, '0' ) ) if fraction else 0 )
+    return t if tz == 'Z' else t - _utc_offset( tz )
 
 
 def strict_bool( s ):
@@ -0,0 +1,162 @@
+"""
+Counterparts of some of the utilities in bd2k.util for use with asyncio. This module requires
+Python 3.7 or newer.
+"""
+from __future__ import absolute_import
+
+import asyncio
+import logging
+import sys
+from contextlib import asynccontextmanager
+from functools import wraps
+
+from bd2k.util.cache import Cache, make_key, now, register
+from bd2k.util.retry import (_AttemptPolicy, _call_site, default_delays, default_timeout, never,
+                             retryable_http_error)
+
+log = logging.getLogger( __name__ )
+
+
+def async_memoize( f=None, maxsize=None, ttl=None, policy='lru', typed=False, freeze=False ):
+    """
+    Like bd2k.util.memoize, but for coroutine functions. The result of awaiting the decorated
+    coroutine is memoized, not the coroutine object. Concurrent callers with the same arguments
+    await a single task and share its result or exception. A caller that is cancelled doesn't
+    cancel that task for the others. Exceptions aren't memoized.
+
+    Unlike memoize, this decorator is not thread-safe. All invocations of the decorating
+    function must be made from the same event loop. If the decorated function calls itself with
+    the same arguments, that call is not memoized. Tasks that await each other's results,
+    on the other hand, will deadlock.
+
+    See bd2k.util.memoize for the remaining arguments.
+
+    >>> @async_memoize( maxsize=100 )
+    ... async def double( x ):
+    ...     print( 'computing', x )
+    ...     await asyncio.sleep( 0 )
+    ...     return x * 2
+    >>> async def main( ):
+    ...     return await asyncio.gather( double( 1 ), double( 1 ), double( 2 ) )
+    >>> asyncio.run( main( ) )
+    computing 1
+    computing 2
+    [2, 2, 4]
+    >>> asyncio.run( double( 1 ) )
+    2
+    >>> info = double.cache_info( )
+    >>> info.hits, info.misses
+    (2, 2)
+    """
+
+    if f is None:
+        return lambda f: async_memoize( f, maxsize=maxsize, ttl=ttl, policy=policy, typed=typed,
+                                        freeze=freeze )
+
+    cache = Cache( maxsize=maxsize, ttl=ttl, policy=policy )
+    get, put = cache.get, cache.put
+    slow = typed or freeze
+    # The computations in progress, by key
+    tasks = { }
+
+    async def compute( key, args, kwargs ):
+        start = now( )
+        try:
+            r = await f( *args, **kwargs )
+        finally:
+            cache.miss_time += now( ) - start
+            cache.misses += 1
+            # A caller arriving after this should consult the cache
+            del tasks[ key ]
+        put( key, r )
+        return r
+
+    @wraps( f )
+    async def new_f( *args, **kwargs ):
+        key = make_key( args, kwargs, typed, freeze ) if kwargs or slow else args
+        try:
+            r = get( key )
+        except KeyError:
+            pass
+        else:
+            cache.hits += 1
+            return r
+        task = tasks.get( key )
+        if task is None:
+            task = tasks[ key ] = asyncio.ensure_future( compute( key, args, kwargs ) )
+        elif task is asyncio.current_task( ):
+            # Awaiting ourselves would deadlock
+            return await f( *args, **kwargs )
+        else:
+            cache.hits += 1
+        return await asyncio.shield( task )
+
+    register( new_f, cache )
+    return new_f
+
+
+async def aretry( delays=default_delays, timeout=default_timeout, predicate=never, budget=None,
+                  breaker=None, observer=None, site=None ):
+    """
+    Like bd2k.util.retry.retry, but an asynchronous generator yielding asynchronous context
+    managers, one per attempt, that wait between attempts using asyncio.sleep(), without blocking
+    the event loop. See bd2k.util.retry.retry for the arguments.
+
+    >>> true = lambda _:True
+    >>> i = 0
+    >>> async def main( ):
+    ...     global i
+    ...     async for attempt in aretry( delays=[0], timeout=.1, predicate=true ):
+    ...         async with attempt:
+    ...             i += 1
+    ...             if i < 3:
+    ...                 raise RuntimeError( 'foo' )
+    >>> asyncio.run( main( ) )
+    >>> i
+    3
+
+    Don't retry unless predicate returns True:
+
+    >>> i = 0
+    >>> async def main( ):
+    ...     global i
+    ...     async for attempt in aretry( delays=[0], timeout=.1 ):
+    ...         async with attempt:
+    ...             i += 1
+    ...             raise RuntimeError( 'foo' )
+    >>> asyncio.run( main( ) )
+    Traceback (most recent call last):
+    ...
+    RuntimeError: foo
+    >>> i
+    1
+    """
+    if observer is not None and site is None:
+        site = _call_site( sys._getframe( 1 ) )
+    policy = _AttemptPolicy( delays, timeout, predicate, budget, breaker, observer, site )
+
+    @asynccontextmanager
+    async def attempt( ):
+        policy.start( )
+        try:
+            yield
+        except Exception as e:
+            delay = policy.failed( e )
+            if delay is None:
+                raise
+            log.info( 'Got %s, trying again in %is.', e, delay )
+            await asyncio.sleep( delay )
+        else:
+            policy.succeeded( )
+
+    while not policy.done:
+        yield attempt( )
+
+
+def aretry_http( delays=default_delays, timeout=default_timeout, predicate=retryable_http_error,
+                 budget=None, breaker=None, observer=None, site=None ):
+    """
+    Like bd2k.util.retry.retry_http, but using aretry().
+    """
+    return aretry( delays=delays, timeout=timeout, predicate=predicate, budget=budget,
+                   breaker=breaker, observer=observer, site=site )
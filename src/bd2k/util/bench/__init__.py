@@ -0,0 +1,126 @@
+"""
+Micro-benchmarks for the performance-critical parts of bd2k.util. Run the benchmark suite of
+primitives registered in bd2k.util.bench.primitives with
+
+python -m bd2k.util.bench --help
+
+and an individual, more detailed benchmark module with
+
+python -m bd2k.util.bench.<module>
+"""
+from __future__ import absolute_import
+from __future__ import division
+
+import sys
+import timeit
+from collections import OrderedDict
+
+# The registered benchmarks, by name
+operations = OrderedDict( )
+footprints = OrderedDict( )
+
+
+def seconds_per_call( f, repeat=5 ):
+    """
+    Return the time in seconds that the given nullary callable takes per invocation, the best out
+    of the given number of repetitions. Each repetition invokes the callable as often as needed to
+    take at least 0.2s.
+    """
+    timer = timeit.Timer( f )
+    number, _ = timer.autorange( )
+    return min( timer.repeat( repeat=repeat, number=number ) ) / number
+
+
+def bytes_per_object( make, n=10000 ):
+    """
+    Return the average number of bytes allocated by the given nullary callable and still in use
+    after it returns, in other words, the memory footprint of the object it creates.
+    """
+    import tracemalloc
+    tracemalloc.start( )
+    try:
+        objects = [ None ] * n
+        before, _ = tracemalloc.get_traced_memory( )
+        for i in range( n ):
+            objects[ i ] = make( )
+        after, _ = tracemalloc.get_traced_memory( )
+    finally:
+        tracemalloc.stop( )
+    return (after - before) / n
+
+
+def operation( name ):
+    """
+    Register the decorated function as the benchmark of the operation with the given name. The
+    function takes no arguments and returns a nullary callable performing one invocation of the
+    operation, so that any setup happens outside of the timed section.
+    """
+
+    def decorator( f ):
+        _register( operations, name, f )
+        return f
+
+    return decorator
+
+
+def footprint( name ):
+    """
+    Register the decorated function as the benchmark of the memory footprint of the object with
+    the given name. The function takes no arguments and returns a nullary callable that creates
+    one object and returns it.
+    """
+
+    def decorator( f ):
+        _register( footprints, name, f )
+        return f
+
+    return decorator
+
+
+def _register( registry, name, f ):
+    if name in registry:
+        raise ValueError( "A benchmark named '%s' is already registered." % name )
+    registry[ name ] = f
+
+
+def run( pattern=None, repeat=5 ):
+    """
+    Run the registered benchmarks whose name contains the given pattern, or all of them if the
+    pattern is None, and return the results as a dictionary that can be serialized to JSON.
+    """
+
+    def selected( registry ):
+        return [ (name, f) for name, f in registry.items( ) if pattern is None or pattern in name ]
+
+    return dict(
+        python='%i.%i.%i' % sys.version_info[ :3 ],
+        ops_per_sec=OrderedDict( (name, 1 / seconds_per_call( f( ), repeat=repeat ))
+                                 for name, f in selected( operations ) ),
+        bytes_per_object=OrderedDict( (name, bytes_per_object( f( ) ))
+                                      for name, f in selected( footprints ) ) )
+
+
+def compare( results, baseline, threshold=0.1 ):
+    """
+    Compare the given benchmark results against the given baseline results and return a list of
+    regressions, i.e. benchmarks that are slower or use more memory by more than the given
+    fraction. Each regression is a tuple of the metric, the benchmark name, the baseline value
+    and the current value. Benchmarks that are missing from either results are ignored.
+
+    >>> baseline = dict( ops_per_sec=dict( a=100, b=100 ), bytes_per_object=dict( c=100 ) )
+    >>> results = dict( ops_per_sec=dict( a=95, b=80 ), bytes_per_object=dict( c=120, d=1 ) )
+    >>> compare( results, baseline )
+    [('ops_per_sec', 'b', 100, 80), ('bytes_per_object', 'c', 100, 120)]
+    >>> compare( results, baseline, threshold=0.25 )
+    []
+    """
+    regressions = [ ]
+    for metric, worse in (('ops_per_sec', lambda old, new: new < old * (1 - threshold)),
+                          ('bytes_per_object', lambda old, new: new > old * (1 + threshold))):
+        old_values, new_values = baseline.get( metric, { } ), results.get( metric, { } )
+        for name in sorted( new_values ):
+            if name in old_values:
+                old, new = old_values[ name ], new_values[ name ]
+                if worse( old, new ):
+                    regressions.append( (metric, name, old, new) )
+    return regressions
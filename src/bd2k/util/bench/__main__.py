@@ -0,0 +1,68 @@
+"""
+Run the benchmark suite, print the number of operations per second and the memory footprint per
+object of each primitive, and optionally save the results as JSON or compare them against a
+baseline saved earlier. For example, to save a baseline before making a change
+
+python -m bd2k.util.bench --save baseline.json
+
+and to check for regressions afterwards
+
+python -m bd2k.util.bench --baseline baseline.json
+
+The exit status is 1 if any benchmark regressed by more than the threshold.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import argparse
+import json
+import sys
+
+import bd2k.util.bench.primitives  # registers the benchmarks
+from bd2k.util.bench import compare, run
+
+
+def main( args=None ):
+    parser = argparse.ArgumentParser( description=__doc__,
+                                      formatter_class=argparse.RawDescriptionHelpFormatter )
+    parser.add_argument( '--filter', metavar='SUBSTRING',
+                         help='Only run the benchmarks whose name contains this string.' )
+    parser.add_argument( '--repeat', type=int, default=5,
+                         help='Time each operation this many times and use the best.' )
+    parser.add_argument( '--save', metavar='PATH',
+                         help='Save the results to this JSON file.' )
+    parser.add_argument( '--baseline', metavar='PATH',
+                         help='Compare the results against those in this JSON file.' )
+    parser.add_argument( '--threshold', type=float, default=0.1,
+                         help='The fraction by which a benchmark may be slower, or use more '
+                              'memory, than the baseline before it is reported as a regression.' )
+    options = parser.parse_args( args )
+
+    baseline = None
+    if options.baseline:
+        with open( options.baseline ) as f:
+            baseline = json.load( f )
+
+    results = run( pattern=options.filter, repeat=options.repeat )
+
+    for name, value in results[ 'ops_per_sec' ].items( ):
+        print( '%-28s%14.0f ops/s' % (name, value) )
+    for name, value in results[ 'bytes_per_object' ].items( ):
+        print( '%-28s%14.0f bytes' % (name, value) )
+
+    if options.save:
+        with open( options.save, 'w' ) as f:
+            json.dump( results, f, indent=4 )
+
+    if baseline is not None:
+        regressions = compare( results, baseline, threshold=options.threshold )
+        for metric, name, old, new in regressions:
+            print( "Regression in '%s': %s went from %.0f to %.0f" % (name, metric, old, new),
+                   file=sys.stderr )
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit( main( ) )
@@ -0,0 +1,36 @@
+"""
+Throughput of D32 encoding and decoding in MB/s for inputs of 1KB, 1MB and 100MB, compared to
+base64.b32encode() and base64.b32decode() from the standard library.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import base64
+import os
+
+from bd2k.util.bench import seconds_per_call
+from bd2k.util.d32 import standard
+
+sizes = (1000, 1000 * 1000, 100 * 1000 * 1000)
+
+
+def main( ):
+    print( '%-16s' % 'bytes' + ''.join( '%14i' % size for size in sizes ) )
+    rows = [ ('d32.encode', [ ]), ('b32encode', [ ]), ('d32.decode', [ ]), ('b32decode', [ ]) ]
+    for size in sizes:
+        data = os.urandom( size )
+        encoded, b32encoded = standard.encode( data ), base64.b32encode( data )
+        repeat = 5 if size < max( sizes ) else 1
+        for (_, throughputs), f in zip( rows, (lambda: standard.encode( data ),
+                                               lambda: base64.b32encode( data ),
+                                               lambda: standard.decode( encoded ),
+                                               lambda: base64.b32decode( b32encoded )) ):
+            throughputs.append( size / seconds_per_call( f, repeat=repeat ) / 1e6 )
+        del data, encoded, b32encoded
+    for name, throughputs in rows:
+        print( '%-16s' % name + ''.join( '%9.0f MB/s' % t for t in throughputs ) )
+
+
+if __name__ == '__main__':
+    main( )
@@ -0,0 +1,96 @@
+"""
+Throughput of hash_json() in MB of canonical representation per second, for a document of
+records with strings, numbers and nested objects, and for a document of lists of floats,
+compared to the original, recursive implementation that updated the hash once per token. Also
+the throughput of hash_json_file() on the serialized documents, compared to json.load() followed
+by hash_json(). If NumPy is installed, also the throughput of hash_json() on an array of floats of
+the same size, compared to hashing the equivalent list of floats.
+
+python -m bd2k.util.bench.hash_json [MB]
+
+The size of the documents defaults to 100 MB.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import json
+import random
+import sys
+import tempfile
+from builtins import range
+
+from bd2k.util.bench import seconds_per_call
+from bd2k.util.hashes import hash_json, hash_json_file
+from bd2k.util.test.test_hashes import recursive_hash_json
+
+
+class Counter( object ):
+    """
+    A hash object that only counts the bytes passed to it
+    """
+
+    def __init__( self ):
+        self.size = 0
+
+    def update( self, b ):
+        self.size += len( b )
+
+
+def records( size ):
+    record = lambda i: { u'id': i,
+                         u'name': u'record %i' % i,
+                         u'score': random.random( ),
+                         u'valid': i % 2 == 0,
+                         u'tags': [ u'a', u'b', u'c' ],
+                         u'location': { u'x': i * 3, u'y': -i } }
+    # Each record takes about 120 bytes
+    return [ record( i ) for i in range( size // 120 ) ]
+
+
+def vectors( size ):
+    # Each vector takes about 20 bytes per element
+    return [ [ random.random( ) for _ in range( 100 ) ] for _ in range( size // 2000 ) ]
+
+
+def main( ):
+    size = int( float( sys.argv[ 1 ] ) * 1e6 ) if len( sys.argv ) > 1 else 100 * 1000 * 1000
+    for name, make in (('records', records), ('vectors', vectors)):
+        document = make( size )
+        counter = Counter( )
+        hash_json( counter, document )
+        for implementation in (recursive_hash_json, hash_json):
+            seconds = seconds_per_call( lambda: implementation( hashlib.md5( ), document ),
+                                        repeat=1 )
+            print( '%-12s%-24s%10.1f MB/s' % (name, implementation.__name__,
+                                               counter.size / seconds / 1e6) )
+        with tempfile.TemporaryFile( mode='w+' ) as f:
+            json.dump( document, f )
+            del document
+
+            def load( ):
+                f.seek( 0 )
+                hash_json( hashlib.md5( ), json.load( f ) )
+
+            def stream( ):
+                f.seek( 0 )
+                hash_json_file( hashlib.md5( ), f )
+
+            for implementation, f_name in ((load, 'json.load'), (stream, 'hash_json_file')):
+                seconds = seconds_per_call( implementation, repeat=1 )
+                print( '%-12s%-24s%10.1f MB/s' % (name, f_name, counter.size / seconds / 1e6) )
+
+    try:
+        import numpy
+    except ImportError:
+        pass
+    else:
+        array = numpy.random.random( size // 8 )
+        for name, value in (('ndarray', array), ('tolist', array.tolist( ))):
+            seconds = seconds_per_call( lambda: hash_json( hashlib.md5( ), value ), repeat=1 )
+            print( '%-12s%-24s%10.1f MB/s' % ('floats', name, array.nbytes / seconds / 1e6) )
+
+
+if __name__ == '__main__':
+    main( )
@@ -0,0 +1,43 @@
+"""
+Time it takes to format and parse sizes with bytes2human() and human2bytes(), and with their
+batch variants, compared to the original implementations.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import random
+from builtins import range
+
+from bd2k.util.bench import seconds_per_call
+from bd2k.util.humanize import bytes2human, bytes2human_many, human2bytes, human2bytes_many
+from bd2k.util.test.test_humanize import reference_bytes2human, reference_human2bytes
+
+
+def main( ):
+    n = 10000
+    sizes = [ random.randrange( 2 ** random.randrange( 1, 60 ) ) for _ in range( n ) ]
+    strings = bytes2human_many( sizes )
+    cases = [
+        ('old bytes2human', lambda: [ reference_bytes2human( size ) for size in sizes ]),
+        ('bytes2human', lambda: [ bytes2human( size ) for size in sizes ]),
+        ('bytes2human_many', lambda: bytes2human_many( sizes )),
+        ('old human2bytes', lambda: [ reference_human2bytes( s ) for s in strings ]),
+        ('human2bytes', lambda: [ human2bytes( s ) for s in strings ]),
+        ('human2bytes_many', lambda: human2bytes_many( strings )) ]
+    try:
+        import numpy
+    except ImportError:
+        pass
+    else:
+        array, string_array = numpy.array( sizes ), numpy.array( strings )
+        cases += [
+            ('bytes2human_many array', lambda: bytes2human_many( array )),
+            ('human2bytes_many array', lambda: human2bytes_many( string_array )) ]
+    for name, f in cases:
+        seconds = seconds_per_call( f ) / n
+        print( '%-24s%10.0fns' % (name, seconds * 1e9) )
+
+
+if __name__ == '__main__':
+    main( )
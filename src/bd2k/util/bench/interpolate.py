@@ -0,0 +1,53 @@
+"""
+Time it takes to call interpolate() from a module with many global variables, compared to the
+original implementation that merged copies of the caller's globals and locals for every call.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import inspect
+from builtins import range
+
+from bd2k.util.bench import seconds_per_call
+from bd2k.util.strings import interpolate
+
+
+def copying_interpolate( template, skip_frames=0, **kwargs ):
+    """
+    The interpolate() of old
+    """
+    frame = inspect.currentframe( )
+    for i in range( skip_frames + 1 ):
+        prev_frame = frame
+        frame = frame.f_back
+        del prev_frame
+    try:
+        env = frame.f_globals.copy( )
+        env.update( frame.f_locals )
+        env.update( kwargs )
+    finally:
+        del frame
+    return template.format( **env )
+
+
+# Stands in for the hot path of a module, logging a message with a few local variables
+source = '''
+def log( path, size ):
+    attempt = 3
+    return interpolate( 'Copied {size} bytes to {path} on attempt {attempt} of {attempts}' )
+'''
+
+
+def main( ):
+    for implementation in (copying_interpolate, interpolate):
+        for n in (10, 1000, 10000):
+            namespace = { 'global%i' % i: i for i in range( n ) }
+            namespace.update( interpolate=implementation, attempts=5 )
+            exec( source, namespace )
+            log = namespace[ 'log' ]
+            seconds = seconds_per_call( lambda: log( '/some/path', 123 ) )
+            print( '%-24s%6i globals%10.0fns' % (implementation.__name__, n, seconds * 1e9) )
+
+
+if __name__ == '__main__':
+    main( )
@@ -0,0 +1,57 @@
+"""
+Time it takes to parse an RFC-3339 date-time with parse_iso_utc() and parse_iso_utc_many(),
+compared to the original implementation that called strptime() with a format built per call.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import datetime
+import random
+
+from bd2k.util import _rfc3339_datetime_re, parse_iso_utc, parse_iso_utc_many
+from bd2k.util.bench import seconds_per_call
+
+
+def strptime_parse_iso_utc( s ):
+    """
+    The parse_iso_utc() of old
+    """
+    m = _rfc3339_datetime_re.match( s )
+    if not m:
+        raise ValueError( 'Not a valid ISO datetime in UTC: ' + s )
+    else:
+        fmt = '%Y-%m-%dT%H:%M:%S' + ('.%f' if m.group( 7 ) else '') + 'Z'
+        return datetime.datetime.strptime( s, fmt )
+
+
+def timestamps( n, tz='Z' ):
+    start = datetime.datetime( 2016, 1, 1 )
+    return [ (start + datetime.timedelta( seconds=random.random( ) * 1e8 )).isoformat( ) + tz
+        for _ in range( n ) ]
+
+
+def main( ):
+    n = 1000
+    cases = [
+        ('strptime', strptime_parse_iso_utc, timestamps( n )),
+        ('parse_iso_utc', parse_iso_utc, timestamps( n )),
+        ('  with offset', parse_iso_utc, timestamps( n, tz='-08:00' )) ]
+    for name, f, strings in cases:
+        seconds = seconds_per_call( lambda: [ f( s ) for s in strings ] ) / n
+        print( '%-24s%10.0fns' % (name, seconds * 1e9) )
+    strings = timestamps( n )
+    seconds = seconds_per_call( lambda: parse_iso_utc_many( strings ) ) / n
+    print( '%-24s%10.0fns' % ('parse_iso_utc_many', seconds * 1e9) )
+    try:
+        import numpy
+    except ImportError:
+        pass
+    else:
+        array = numpy.array( strings )
+        seconds = seconds_per_call( lambda: parse_iso_utc_many( array, datetime64=True ) ) / n
+        print( '%-24s%10.0fns' % ('  to datetime64', seconds * 1e9) )
+
+
+if __name__ == '__main__':
+    main( )
@@ -0,0 +1,42 @@
+"""
+Time per ID it takes to encode and decode 100,000 IDs of 16 bytes with encode_many() and
+decode_many(), passing a list or a NumPy array, compared to invoking encode() and decode() on each
+ID in a loop.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+from bd2k.util.bench import seconds_per_call
+from bd2k.util.d32 import standard as d32
+from bd2k.util.d64 import standard as d64
+
+
+def main( num_ids=100000, width=16 ):
+    ids = [ os.urandom( width ) for _ in range( num_ids ) ]
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    for name, codec in (('d32', d32), ('d64', d64)):
+        encoded = codec.encode_many( ids )
+        cases = [
+            ('encode loop', lambda: [ codec.encode( d ) for d in ids ]),
+            ('encode_many', lambda: codec.encode_many( ids )),
+            ('decode loop', lambda: [ codec.decode( e ) for e in encoded ]),
+            ('decode_many', lambda: codec.decode_many( encoded )) ]
+        if numpy is not None:
+            array = numpy.array( ids, dtype='S%i' % width )
+            encoded_array = codec.encode_many( array )
+            cases += [
+                ('encode_many array', lambda: codec.encode_many( array )),
+                ('decode_many array', lambda: codec.decode_many( encoded_array )) ]
+        for case, f in cases:
+            seconds = seconds_per_call( f, repeat=3 ) / num_ids
+            print( '%-24s%10.0fns' % (name + ' ' + case, seconds * 1e9) )
+
+
+if __name__ == '__main__':
+    main( )
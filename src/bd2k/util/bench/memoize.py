@@ -0,0 +1,145 @@
+"""
+Hit latency of memoize() and sync_memoize() as their cache fills up, one row per configuration and
+one column per number of cached results. The latency should be independent of the cache size.
+
+Overhead of building cache keys with make_key() compared to using the tuple of positional
+arguments as is.
+
+Throughput of sync_memoize() with 32 threads calling a slow function with a mix of repeated and
+new arguments, compared to a single lock serializing all cache misses.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import random
+import threading
+import time
+from functools import wraps
+
+from bd2k.util import memoize, sync_memoize
+from bd2k.util.bench import seconds_per_call
+from bd2k.util.cache import make_key
+
+sizes = (10, 1000, 100000)
+
+configurations = [
+    ('unbounded', { }),
+    ('lru', dict( policy='lru', maxsize=max( sizes ) )),
+    ('fifo', dict( policy='fifo', maxsize=max( sizes ) )),
+    ('ttl', dict( ttl=3600 )),
+    ('lru+ttl', dict( policy='lru', maxsize=max( sizes ), ttl=3600 )) ]
+
+
+def hit_latency( decorator, size, **kwargs ):
+    """
+    Return the time in seconds that a hit takes in a cache populated with the given number of
+    results.
+    """
+    f = decorator( **kwargs )( lambda x: x )
+    for i in range( size ):
+        f( i )
+    keys = [ random.randrange( size ) for _ in range( 1000 ) ]
+
+    def hits( ):
+        for key in keys:
+            f( key )
+
+    return seconds_per_call( hits ) / len( keys )
+
+
+def key_building( ):
+    """
+    Return a list of pairs, each consisting of a description and the time in seconds it takes to
+    build a single key for a call with three arguments.
+    """
+    args, kwargs = (1, 'a', 2.0), dict( x=1, y='a', z=2.0 )
+    lists = ([ 1, 2, 3 ], { 'a': 1 }, 2.0)
+    cases = [
+        ('positional', lambda: args),
+        ('keyword', lambda: make_key( (), kwargs )),
+        ('typed', lambda: make_key( args, { }, typed=True )),
+        ('hashable, freeze', lambda: make_key( args, { }, freeze=True )),
+        ('unhashable, freeze', lambda: make_key( lists, { }, freeze=True )),
+        ('unhashable, by hand', lambda: (tuple( lists[ 0 ] ),
+                                         tuple( sorted( lists[ 1 ].items( ) ) ),
+                                         lists[ 2 ])) ]
+    return [ (name, seconds_per_call( key )) for name, key in cases ]
+
+
+def global_lock_memoize( f ):
+    """
+    The sync_memoize() of old, which held a single lock while computing any missing result.
+    """
+    memory = { }
+    lock = threading.Lock( )
+
+    @wraps( f )
+    def new_f( *args ):
+        try:
+            return memory[ args ]
+        except KeyError:
+            with lock:
+                try:
+                    return memory[ args ]
+                except KeyError:
+                    r = f( *args )
+                    memory[ args ] = r
+                    return r
+
+    return new_f
+
+
+def throughput( decorator, num_threads=32, calls_per_thread=200, num_keys=1000, delay=.001 ):
+    """
+    Return the number of calls per second and the number of invocations of the decorated
+    function when the given number of threads concurrently call a function that takes the given
+    number of seconds to compute a result, each thread passing arguments drawn randomly from the
+    given number of distinct keys.
+    """
+    invocations = [ ]
+
+    @decorator
+    def f( x ):
+        invocations.append( x )
+        time.sleep( delay )
+        return x
+
+    def run( keys ):
+        for key in keys:
+            f( key )
+
+    threads = [ threading.Thread( target=run,
+                                  args=([ random.randrange( num_keys )
+                                      for _ in range( calls_per_thread ) ],) )
+        for _ in range( num_threads ) ]
+    start = time.time( )
+    for thread in threads:
+        thread.start( )
+    for thread in threads:
+        thread.join( )
+    elapsed = time.time( ) - start
+    return num_threads * calls_per_thread / elapsed, len( invocations )
+
+
+def main( ):
+    for decorator in (memoize, sync_memoize):
+        print( decorator.__name__ )
+        print( '%-12s' % 'results' + ''.join( '%12i' % size for size in sizes ) )
+        for name, kwargs in configurations:
+            latencies = [ hit_latency( decorator, size, **kwargs ) for size in sizes ]
+            print( '%-12s' % name + ''.join( '%10.0fns' % (l * 1e9) for l in latencies ) )
+        print( )
+    print( 'Key building' )
+    for name, seconds in key_building( ):
+        print( '%-20s%10.0fns' % (name, seconds * 1e9) )
+    print( )
+    print( 'Throughput with 32 threads' )
+    for decorator in (global_lock_memoize, sync_memoize):
+        calls_per_sec, invocations = throughput( decorator )
+        print( '%-20s%10.0f calls/s%8i invocations' % (
+            decorator.__name__, calls_per_sec, invocations) )
+
+
+if __name__ == '__main__':
+    main( )
@@ -0,0 +1,52 @@
+"""
+Time it takes to compute the Merkle tree hash of a document of records with hash_json_merkle(),
+serially and with a pool of processes, and to compute it again after a change to one record
+using a MerkleCache, compared to hash_json().
+
+python -m bd2k.util.bench.merkle [MB]
+
+The size of the document defaults to 100 MB.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import multiprocessing
+import sys
+
+from bd2k.util.bench import seconds_per_call
+from bd2k.util.bench.hash_json import records
+from bd2k.util.hashes import MerkleCache, hash_json, hash_json_merkle
+
+
+def main( ):
+    size = int( float( sys.argv[ 1 ] ) * 1e6 ) if len( sys.argv ) > 1 else 100 * 1000 * 1000
+    document = records( size )
+    processes = multiprocessing.cpu_count( )
+    pool = multiprocessing.Pool( processes )
+    try:
+        cache = MerkleCache( )
+
+        def edit( ):
+            document[ len( document ) // 2 ][ u'score' ] += 1
+            cache.invalidate( (len( document ) // 2, u'score') )
+            hash_json_merkle( hashlib.sha256( ), document, cache=cache )
+
+        hash_json_merkle( hashlib.sha256( ), document, cache=cache )
+        cases = [
+            ('hash_json', lambda: hash_json( hashlib.sha256( ), document )),
+            ('merkle', lambda: hash_json_merkle( hashlib.sha256( ), document )),
+            ('merkle, %i processes' % processes,
+             lambda: hash_json_merkle( hashlib.sha256( ), document, pool=pool )),
+            ('merkle after edit', edit) ]
+        for name, f in cases:
+            seconds = seconds_per_call( f, repeat=1 )
+            print( '%-28s%10.3fs' % (name, seconds) )
+    finally:
+        pool.close( )
+        pool.join( )
+
+
+if __name__ == '__main__':
+    main( )
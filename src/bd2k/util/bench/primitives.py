@@ -0,0 +1,177 @@
+"""
+The benchmarks run by python -m bd2k.util.bench, one per hot primitive of bd2k.util. Benchmark
+names must remain stable, otherwise results can't be compared against older baselines.
+"""
+from __future__ import absolute_import
+from __future__ import division
+
+import hashlib
+import io
+import itertools
+import os
+
+from bd2k.util import memoize, sync_memoize
+from bd2k.util.bench import footprint, operation
+from bd2k.util.collections import OrderedSet
+from bd2k.util.d32 import standard as d32
+from bd2k.util.d64 import standard as d64
+from bd2k.util.files import copyfileobj
+from bd2k.util.fnmatch import fnmatch
+from bd2k.util.hashes import hash_json
+from bd2k.util.humanize import bytes2human, human2bytes
+from bd2k.util.iterables import flatten
+from bd2k.util.keys import pack, pack_int
+from bd2k.util.strings import interpolate
+
+kilobyte = os.urandom( 1024 )
+
+document = {
+    'name': 'sample',
+    'size': 123456,
+    'ratio': 0.5,
+    'paired': True,
+    'tags': [ 'a', 'b', 'c' ] * 10,
+    'files': [ { 'path': '/some/path/%i' % i, 'size': i } for i in range( 20 ) ] }
+
+
+@operation( 'd32.encode 1KiB' )
+def d32_encode( ):
+    return lambda: d32.encode( kilobyte )
+
+
+@operation( 'd32.decode 1KiB' )
+def d32_decode( ):
+    encoded = d32.encode( kilobyte )
+    return lambda: d32.decode( encoded )
+
+
+@operation( 'd64.encode 1KiB' )
+def d64_encode( ):
+    return lambda: d64.encode( kilobyte )
+
+
+@operation( 'd64.decode 1KiB' )
+def d64_decode( ):
+    encoded = d64.encode( kilobyte )
+    return lambda: d64.decode( encoded )
+
+
+@operation( 'd64.decode_into 1KiB' )
+def d64_decode_into( ):
+    encoded = d64.encode( kilobyte ).encode( 'ascii' )
+    buf = bytearray( len( kilobyte ) )
+    return lambda: d64.decode_into( encoded, buf )
+
+
+@operation( 'hash_json document' )
+def hash_json_document( ):
+    return lambda: hash_json( hashlib.md5( ), document )
+
+
+@operation( 'bytes2human' )
+def bytes2human_size( ):
+    return lambda: bytes2human( 123456789 )
+
+
+@operation( 'human2bytes' )
+def human2bytes_size( ):
+    return lambda: human2bytes( '117.7 M' )
+
+
+@operation( 'keys.pack tuple' )
+def keys_pack( ):
+    key = (123456789, 'sample', 0.5)
+    return lambda: pack( key )
+
+
+@operation( 'keys.pack int' )
+def keys_pack_int( ):
+    return lambda: pack( 123456789 )
+
+
+@operation( 'keys.pack_int' )
+def keys_pack_fixed_int( ):
+    return lambda: pack_int( 123456789 )
+
+
+@operation( 'OrderedSet.add' )
+def ordered_set_add( ):
+    s = OrderedSet( )
+    keys = itertools.count( )
+    return lambda: s.add( next( keys ) )
+
+
+@operation( 'OrderedSet contains' )
+def ordered_set_contains( ):
+    s = OrderedSet( range( 1000 ) )
+    return lambda: 500 in s
+
+
+@operation( 'OrderedSet 100 items' )
+def ordered_set_create( ):
+    items = list( range( 100 ) )
+    return lambda: OrderedSet( items )
+
+
+@operation( 'flatten 100x10' )
+def flatten_lists( ):
+    lists = [ list( range( 10 ) ) ] * 100
+    return lambda: list( flatten( lists ) )
+
+
+@operation( 'fnmatch' )
+def fnmatch_path( ):
+    return lambda: fnmatch( 'foo/bar/baz.txt', '**/*.txt' )
+
+
+@operation( 'interpolate' )
+def interpolate_locals( ):
+    def log( path, size ):
+        return interpolate( 'Copied {size} bytes to {path}' )
+
+    return lambda: log( '/some/path', 123 )
+
+
+@operation( 'copyfileobj 1MiB' )
+def copyfileobj_megabyte( ):
+    src = io.BytesIO( kilobyte * 1024 )
+
+    def copy( ):
+        src.seek( 0 )
+        copyfileobj( src, io.BytesIO( ) )
+
+    return copy
+
+
+@operation( 'memoize hit' )
+def memoize_hit( ):
+    f = memoize( lambda x: x )
+    f( 0 )
+    return lambda: f( 0 )
+
+
+@operation( 'sync_memoize hit' )
+def sync_memoize_hit( ):
+    f = sync_memoize( lambda x: x )
+    f( 0 )
+    return lambda: f( 0 )
+
+
+@footprint( 'OrderedSet 100 items' )
+def ordered_set( ):
+    items = list( range( 100 ) )
+    return lambda: OrderedSet( items )
+
+
+@footprint( 'memoize entry' )
+def memoize_entry( ):
+    f = memoize( lambda x: None )
+    keys = itertools.count( )
+    return lambda: f( next( keys ) )
+
+
+@footprint( 'memoize entry, LRU' )
+def memoize_lru_entry( ):
+    f = memoize( lambda x: None, maxsize=2 ** 30 )
+    keys = itertools.count( )
+    return lambda: f( next( keys ) )
@@ -0,0 +1,59 @@
+"""
+Number of IDs per second and thread generated by ulid() and by ulids() in batches of 1000, with
+1, 4 and 16 threads, compared to encoding the concatenation of a timestamp and random bytes.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import struct
+import threading
+import time
+
+from bd2k.util.d32 import standard as d32
+from bd2k.util.ulid import ulid, ulids
+
+thread_counts = (1, 4, 16)
+
+
+def time_and_random( ):
+    """
+    The ad-hoc way of generating sortable IDs this module replaces
+    """
+    return d32.encode( struct.pack( '>Q', int( time.time( ) * 1000 ) ) + os.urandom( 8 ) )
+
+
+def ids_per_second_and_thread( generate, num_threads, ids_per_thread=100000 ):
+    """
+    Return the number of IDs per second generated by each of the given number of threads, each
+    thread invoking the given callable until it has generated the given number of IDs. The
+    callable returns the number of IDs it generated.
+    """
+    def run( ):
+        n = 0
+        while n < ids_per_thread:
+            n += generate( )
+
+    threads = [ threading.Thread( target=run ) for _ in range( num_threads ) ]
+    start = time.time( )
+    for thread in threads:
+        thread.start( )
+    for thread in threads:
+        thread.join( )
+    return ids_per_thread / (time.time( ) - start)
+
+
+def main( ):
+    cases = [
+        ('time + random', lambda: time_and_random( ) and 1),
+        ('ulid', lambda: ulid( ) and 1),
+        ('ulids(1000)', lambda: len( ulids( 1000 ) )) ]
+    print( '%-16s' % 'threads' + ''.join( '%16i' % n for n in thread_counts ) )
+    for name, generate in cases:
+        print( '%-16s' % name + ''.join( '%12.0f/s/t' % ids_per_second_and_thread( generate, n )
+                                         for n in thread_counts ) )
+
+
+if __name__ == '__main__':
+    main( )
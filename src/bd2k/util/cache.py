@@ -0,0 +1,619 @@
+from __future__ import absolute_import
+
+from builtins import object
+import errno
+import fcntl
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import tempfile
+from collections import OrderedDict, namedtuple
+from threading import Event, Lock
+from weakref import WeakSet
+
+from future.utils import raise_
+
+from bd2k.util.exceptions import panic
+from bd2k.util.files import mkdir_p, rm_f
+
+try:
+    from threading import get_ident
+except ImportError:
+    from thread import get_ident
+
+try:
+    from time import monotonic as now
+except ImportError:
+    from time import time as now
+
+
+log = logging.getLogger( __name__ )
+
+# Python 2's OrderedDict can't reorder an entry in place. Its operations are implemented in
+# Python and aren't atomic, so there reordering entries requires the cache's lock.
+_atomic_move_to_end = hasattr( OrderedDict, 'move_to_end' )
+
+
+def _move_to_end( data, key ):
+    if _atomic_move_to_end:
+        data.move_to_end( key )
+    else:
+        data[ key ] = data.pop( key )
+
+CacheInfo = namedtuple( 'CacheInfo', [ 'hits', 'misses', 'maxsize', 'currsize', 'evictions',
+                                       'miss_time' ] )
+
+
+class Cache( object ):
+    """
+    A mapping from keys to values with an optional bound on the number of entries and an optional
+    time-to-live for each entry. This is the storage behind memoize() and sync_memoize().
+
+    The get( key ) method returns the value for the given key. Instead of returning a default,
+    it raises KeyError if an entry is missing or expired. It is an instance attribute assigned in
+    the constructor to the cheapest lookup that honors the configuration of the cache. Lookups
+    never acquire a lock, except those in an LRU cache on Python 2. Insertions via put() do.
+
+    :param int maxsize: the maximum number of entries or None if the number of entries should
+           not be bounded
+
+    :param float ttl: the number of seconds after which an entry expires or None if entries
+           should never expire
+
+    :param str policy: which entry to evict when the cache is full, 'lru' for the least recently
+           looked up entry or 'fifo' for the least recently inserted one. A 'fifo' cache is a
+           little cheaper to look up.
+
+    >>> c = Cache( maxsize=2 )
+    >>> c.put( 'a', 1 )
+    >>> c.put( 'b', 2 )
+    >>> c.get( 'a' )
+    1
+    >>> c.put( 'c', 3 )
+    >>> c.get( 'b' )
+    Traceback (most recent call last):
+    ...
+    KeyError: 'b'
+    >>> c.get( 'a' ), c.get( 'c' ), c.evictions
+    (1, 3, 1)
+
+    >>> c = Cache( maxsize=2, policy='fifo' )
+    >>> c.put( 'a', 1 )
+    >>> c.put( 'b', 2 )
+    >>> c.get( 'a' )
+    1
+    >>> c.put( 'c', 3 )
+    >>> c.get( 'a' )
+    Traceback (most recent call last):
+    ...
+    KeyError: 'a'
+
+    The statistics in info() are maintained by the caller of get() and put(), except for
+    evictions:
+
+    >>> c.info( )
+    CacheInfo(hits=0, misses=0, maxsize=2, currsize=2, evictions=1, miss_time=0.0)
+    >>> c.clear( )
+    >>> c.info( )
+    CacheInfo(hits=0, misses=0, maxsize=2, currsize=0, evictions=0, miss_time=0.0)
+
+    >>> Cache( policy='random' )
+    Traceback (most recent call last):
+    ...
+    ValueError: Eviction policy must be one of 'lru' or 'fifo', not 'random'.
+    """
+
+    policies = ('lru', 'fifo')
+
+    def __init__( self, maxsize=None, ttl=None, policy='lru' ):
+        super( Cache, self ).__init__( )
+        if policy not in self.policies:
+            raise ValueError( "Eviction policy must be one of %s, not '%s'." % (
+                ' or '.join( "'%s'" % p for p in self.policies ), policy) )
+        if maxsize is not None and maxsize < 0:
+            raise ValueError( 'The maximum size must not be negative.' )
+        if ttl is not None and ttl <= 0:
+            raise ValueError( 'The time-to-live must be positive.' )
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.policy = policy
+        self.lock = Lock( )
+        self._reset_stats( )
+        # An unbounded cache without expiration has no use for the ordering
+        self.data = { } if maxsize is None and ttl is None else OrderedDict( )
+        # The cheapest lookup that honors the configuration. Looking up an unbounded or FIFO
+        # cache without expiration doesn't even involve a Python-level call.
+        recent = maxsize is not None and policy == 'lru'
+        lookup = self._get_recent if recent else self.data.__getitem__
+        if ttl is None:
+            self.get = lookup
+        else:
+            self._lookup = lookup
+            self.get = self._get_fresh
+
+    def put( self, key, value ):
+        """
+        Insert or replace the entry for the given key, evicting other entries as necessary.
+        """
+        data = self.data
+        with self.lock:
+            if self.ttl is not None:
+                t = now( )
+                self._purge( t )
+                value = (value, t + self.ttl)
+            data[ key ] = value
+            if isinstance( data, OrderedDict ):
+                # A replaced entry is as good as a new one
+                _move_to_end( data, key )
+            maxsize = self.maxsize
+            if maxsize is not None:
+                while len( data ) > maxsize:
+                    data.popitem( last=False )
+                    self.evictions += 1
+
+    def info( self ):
+        """
+        Return statistics about this cache. The hit and miss counters are updated without
+        synchronization so they may be a little off if the cache is used by multiple threads.
+
+        :rtype: CacheInfo
+        """
+        return CacheInfo( hits=self.hits,
+                          misses=self.misses,
+                          maxsize=self.maxsize,
+                          currsize=len( self.data ),
+                          evictions=self.evictions,
+                          miss_time=self.miss_time )
+
+    def clear( self ):
+        """
+        Remove all entries and reset the statistics.
+        """
+        with self.lock:
+            self.data.clear( )
+            self._reset_stats( )
+
+    def _reset_stats( self ):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # The total number of seconds spent computing values on misses
+        self.miss_time = 0.0
+
+    def _get_recent( self, key ):
+        data = self.data
+        value = data[ key ]
+        if _atomic_move_to_end:
+            try:
+                data.move_to_end( key )
+            except KeyError:
+                # Another thread evicted the entry after we looked it up, that's fine
+                pass
+        else:
+            with self.lock:
+                if key in data:
+                    _move_to_end( data, key )
+        return value
+
+    def _get_fresh( self, key ):
+        value, expiration = self._lookup( key )
+        if expiration <= now( ):
+            with self.lock:
+                entry = self.data.get( key )
+                if entry is not None and entry[ 1 ] <= now( ):
+                    del self.data[ key ]
+                    self.evictions += 1
+            raise KeyError( key )
+        return value
+
+    def _purge( self, t ):
+        """
+        Remove expired entries from the front of the eviction queue. Entries are inserted in order
+        of expiration but lookups in an LRU cache reorder them, so expired entries may linger
+        behind fresh ones. They will be evicted eventually because such a cache is bounded.
+        """
+        data = self.data
+        while data:
+            key = next( iter( data ) )
+            if data[ key ][ 1 ] > t:
+                break
+            del data[ key ]
+            self.evictions += 1
+
+
+class DiskCache( object ):
+    """
+    A cache of pickled values in a directory, one file per entry, that survives the process and
+    can be shared by multiple processes on the same host. Each entry is written to a temporary
+    file that is then renamed into place, so readers never see a partially written entry. The
+    files are spread over 256 subdirectories to keep directories small.
+
+    Unlike Cache, values are copies, and keys must be picklable. A key's file name is derived
+    from its content and is independent of the hash randomization of the process.
+
+    :param str path: the directory to store the entries in. It will be created if necessary.
+
+    :param int max_bytes: the approximate maximum total size of the entries in bytes or None if
+           the size should not be bounded. The least recently used entries are evicted when the
+           cache exceeds that size. Entries are counted towards the size when written and the
+           directory is only scanned after every max_bytes / 16 bytes written by the current
+           process, so the cache may temporarily exceed the bound a little. Only one process at
+           a time scans the directory, the others skip the scan.
+
+    >>> import shutil
+    >>> path = tempfile.mkdtemp( )
+    >>> c = DiskCache( path )
+    >>> c.put( ('a', 1), [ 1, 2 ] )
+    >>> DiskCache( path ).get( ('a', 1) )
+    [1, 2]
+    >>> c.get( ('b', 1) )
+    Traceback (most recent call last):
+    ...
+    KeyError: ('b', 1)
+    >>> c.info( ).currsize
+    1
+    >>> c.clear( )
+    >>> c.info( ).currsize
+    0
+    >>> shutil.rmtree( path )
+    """
+
+    suffix = '.pickle'
+
+    def __init__( self, path, max_bytes=None ):
+        super( DiskCache, self ).__init__( )
+        if max_bytes is not None and max_bytes < 0:
+            raise ValueError( 'The maximum size must not be negative.' )
+        self.path = path
+        self.max_bytes = max_bytes
+        self.bytes_written = 0
+        mkdir_p( path )
+        self._reset_stats( )
+
+    def get( self, key ):
+        path = self._path( key )
+        try:
+            with open( path, 'rb' ) as f:
+                value = pickle.load( f )
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                raise KeyError( key )
+            else:
+                raise
+        except Exception:
+            log.warning( 'Discarding unreadable cache entry %s.', path, exc_info=True )
+            rm_f( path )
+            raise KeyError( key )
+        if self.max_bytes is not None:
+            # The modification time doubles as the time of last use
+            try:
+                os.utime( path, None )
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+        return value
+
+    def put( self, key, value ):
+        path = self._path( key )
+        dir_path = os.path.dirname( path )
+        mkdir_p( dir_path )
+        fd, tmp_path = tempfile.mkstemp( dir=dir_path, suffix='.tmp' )
+        try:
+            with os.fdopen( fd, 'wb' ) as f:
+                pickle.dump( value, f, protocol=pickle.HIGHEST_PROTOCOL )
+                size = f.tell( )
+            os.rename( tmp_path, path )
+        except:
+            with panic( log ):
+                rm_f( tmp_path )
+        if self.max_bytes is not None:
+            self.bytes_written += size
+            if self.bytes_written > self.max_bytes // 16:
+                self.bytes_written = 0
+                self._evict( )
+
+    def info( self ):
+        """
+        Return statistics about this cache. The maxsize field is the maximum size in bytes, all
+        other fields except currsize, the number of entries, only reflect the activity of this
+        process.
+
+        :rtype: CacheInfo
+        """
+        return CacheInfo( hits=self.hits,
+                          misses=self.misses,
+                          maxsize=self.max_bytes,
+                          currsize=sum( 1 for _ in self._entries( ) ),
+                          evictions=self.evictions,
+                          miss_time=self.miss_time )
+
+    def clear( self ):
+        """
+        Remove all entries and reset the statistics.
+        """
+        for path in self._entries( ):
+            rm_f( path )
+        self._reset_stats( )
+
+    def _reset_stats( self ):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.miss_time = 0.0
+
+    def _path( self, key ):
+        digest = hashlib.sha256( _fingerprint( key ) ).hexdigest( )
+        return os.path.join( self.path, digest[ :2 ], digest[ 2: ] + self.suffix )
+
+    def _entries( self ):
+        for shard in os.listdir( self.path ):
+            shard_path = os.path.join( self.path, shard )
+            if os.path.isdir( shard_path ):
+                for name in os.listdir( shard_path ):
+                    if name.endswith( self.suffix ):
+                        yield os.path.join( shard_path, name )
+
+    def _evict( self ):
+        """
+        Remove the least recently used entries until the cache is 10% below its maximum size,
+        unless another process is already doing that.
+        """
+        with open( os.path.join( self.path, '.lock' ), 'w' ) as lock:
+            try:
+                fcntl.flock( lock, fcntl.LOCK_EX | fcntl.LOCK_NB )
+            except IOError as e:
+                if e.errno in (errno.EAGAIN, errno.EACCES):
+                    log.debug( 'Another process is evicting entries from %s.', self.path )
+                    return
+                else:
+                    raise
+            entries = [ ]
+            total = 0
+            for path in self._entries( ):
+                try:
+                    st = os.stat( path )
+                except OSError as e:
+                    if e.errno == errno.ENOENT:
+                        continue
+                    else:
+                        raise
+                entries.append( (st.st_mtime, st.st_size, path) )
+                total += st.st_size
+            if total > self.max_bytes:
+                entries.sort( )
+                target = self.max_bytes * 9 // 10
+                for _, size, path in entries:
+                    if total <= target:
+                        break
+                    rm_f( path )
+                    total -= size
+                    self.evictions += 1
+
+
+def _fingerprint( key ):
+    """
+    Return a byte string that identifies the given key. Unlike the pickled key, it doesn't depend
+    on the iteration order of the frozensets in the key, an order that varies between processes.
+    """
+    if isinstance( key, tuple ):
+        return b'(' + b''.join( _fingerprint( v ) for v in key ) + b')'
+    elif isinstance( key, frozenset ):
+        return b'{' + b''.join( sorted( _fingerprint( v ) for v in key ) ) + b'}'
+    else:
+        p = pickle.dumps( key, protocol=2 )
+        return str( len( p ) ).encode( 'ascii' ) + b':' + p
+
+
+class Flight( object ):
+    """
+    A computation of a value that is in progress in one thread, the owner, and that other threads
+    may wait on. This is how sync_memoize() ensures that concurrent callers with the same
+    arguments share one invocation of the decorated function while callers with other arguments
+    proceed independently.
+
+    >>> flight = Flight( )
+    >>> flight.land( 42 )
+    >>> flight.wait( )
+    42
+    """
+
+    def __init__( self ):
+        super( Flight, self ).__init__( )
+        self.owner = get_ident( )
+        self.landed = Event( )
+        self.result = None
+        self.exc_info = None
+
+    def is_owned( self ):
+        """
+        True if the current thread is the one performing the computation.
+        """
+        return self.owner == get_ident( )
+
+    def land( self, result ):
+        self.result = result
+        self.landed.set( )
+
+    def crash( self ):
+        """
+        Record the exception currently being handled as the outcome of the computation.
+        """
+        self.exc_info = sys.exc_info( )
+        self.landed.set( )
+
+    def wait( self ):
+        """
+        Wait for the computation to end and return its result or raise its exception.
+        """
+        self.landed.wait( )
+        if self.exc_info is not None:
+            raise_( *self.exc_info )
+        return self.result
+
+
+class _Mark( object ):
+    """
+    A marker that separates the parts of a key. Markers pickle by reference so a key that was
+    unpickled in another process compares equal to the original.
+    """
+
+    def __init__( self, name ):
+        super( _Mark, self ).__init__( )
+        self.name = name
+
+    def __repr__( self ):
+        return self.name
+
+    def __reduce__( self ):
+        return self.name
+
+
+_kwargs_mark = _Mark( '_kwargs_mark' )
+_types_mark = _Mark( '_types_mark' )
+_list_mark = _Mark( '_list_mark' )
+_dict_mark = _Mark( '_dict_mark' )
+_set_mark = _Mark( '_set_mark' )
+_bytearray_mark = _Mark( '_bytearray_mark' )
+
+
+def make_key( args, kwargs, typed=False, freeze=False ):
+    """
+    Return a key for looking up the result of a call with the given positional and keyword
+    arguments. The key for a call with positional arguments only is the tuple of arguments.
+
+    :param tuple args: the positional arguments
+
+    :param dict kwargs: the keyword arguments. Their order doesn't affect the key.
+
+    :param bool typed: if True, arguments of different types make for different keys, even if they
+           compare equal, as is the case for 1 and 1.0
+
+    :param bool freeze: if True, lists, dictionaries, sets and bytearrays among the arguments
+           are converted to hashable equivalents. That conversion is only attempted if the
+           arguments aren't already hashable.
+
+    >>> make_key( (1, 2), { } )
+    (1, 2)
+    >>> make_key( (1,), dict( b=3, a=2 ) ) == make_key( (1,), dict( a=2, b=3 ) )
+    True
+    >>> make_key( (1,), { } ) == make_key( (1.0,), { } )
+    True
+    >>> make_key( (1,), { }, typed=True ) == make_key( (1.0,), { }, typed=True )
+    False
+    >>> make_key( ([ 1, 2 ], { 'a': { 3 } }), { }, freeze=True )
+    ((_list_mark, (1, 2)), (_dict_mark, frozenset({('a', (_set_mark, frozenset({3})))})))
+    >>> make_key( (), dict( a=[ 1 ] ), freeze=True )
+    (_kwargs_mark, frozenset({('a', (_list_mark, (1,)))}))
+
+    Calls passing the same values as positional and keyword arguments get different keys:
+
+    >>> make_key( (1,), { } ) == make_key( (), dict( a=1 ) )
+    False
+    """
+    if freeze:
+        try:
+            hash( args )
+        except TypeError:
+            args = frozen( args )
+    key = args
+    if kwargs:
+        # Unlike a sorted tuple of items, a frozenset is independent of the order of the keyword
+        # arguments without requiring their values to be comparable. It also caches its hash.
+        try:
+            key += (_kwargs_mark, frozenset( kwargs.items( ) ))
+        except TypeError:
+            if not freeze:
+                raise
+            key += (_kwargs_mark, frozenset( [ (k, frozen( v )) for k, v in kwargs.items( ) ] ))
+    if typed:
+        key += (_types_mark,) + tuple( map( type, args ) )
+        if kwargs:
+            key += (frozenset( [ (k, type( v )) for k, v in kwargs.items( ) ] ),)
+    return key
+
+
+def frozen( value ):
+    """
+    Return a hashable equivalent of the given value, converting lists, dictionaries, sets and
+    bytearrays, even when nested in tuples or in each other. The type of each converted value is
+    reflected in the result such that, for example, a list and a tuple of the same elements
+    remain distinct. Other values are returned as is.
+
+    >>> frozen( (1, [ 2, bytearray( b'3' ) ]) )
+    (1, (_list_mark, (2, (_bytearray_mark, b'3'))))
+    >>> frozen( [ ] ) == frozen( ( ) )
+    False
+    """
+    # Most elements are atomic, checking for that inline saves a lot of calls
+    atomic = _atomic_types
+    if type( value ) in atomic:
+        return value
+    elif isinstance( value, tuple ):
+        return tuple( [ v if type( v ) in atomic else frozen( v ) for v in value ] )
+    elif isinstance( value, list ):
+        return _list_mark, tuple( [ v if type( v ) in atomic else frozen( v ) for v in value ] )
+    elif isinstance( value, dict ):
+        return _dict_mark, frozenset( [ (k, v if type( v ) in atomic else frozen( v ))
+                                          for k, v in value.items( ) ] )
+    elif isinstance( value, (set, frozenset) ):
+        return _set_mark, frozenset( [ v if type( v ) in atomic else frozen( v ) for v in value ] )
+    elif isinstance( value, bytearray ):
+        return _bytearray_mark, bytes( value )
+    else:
+        return value
+
+
+_atomic_types = { int, float, complex, bool, str, bytes, type( None ) }
+
+
+_registry = WeakSet( )
+_registry_lock = Lock( )
+
+
+def register( f, cache ):
+    """
+    Make the given memoized function's cache available via its cache_info() and cache_clear()
+    attributes and via all_cache_info(). The cache itself is exposed as the function's cache
+    attribute, for priming it, for example. The function is tracked by a weak reference so it
+    won't be kept alive by this.
+    """
+    f.cache = cache
+    f.cache_info = cache.info
+    f.cache_clear = cache.clear
+    with _registry_lock:
+        _registry.add( f )
+
+
+def memoized_functions( ):
+    """
+    Return a list of all live functions that were decorated with memoize() or sync_memoize().
+    """
+    with _registry_lock:
+        return list( _registry )
+
+
+def all_cache_info( ):
+    """
+    Return a dictionary mapping the qualified name of every live memoized function to the
+    statistics of its cache. If there are multiple functions of the same name, as is the case
+    for functions that are memoized in a loop, the ID of the function is appended to the name.
+
+    >>> from bd2k.util import memoize
+    >>> @memoize
+    ... def f( x ):
+    ...     return x
+    >>> f( 1 ), f( 1 ), f( 2 )
+    (1, 1, 2)
+    >>> info = all_cache_info( )[ 'bd2k.util.cache.f' ]
+    >>> info.hits, info.misses, info.currsize
+    (1, 2, 2)
+    """
+    infos = { }
+    for f in memoized_functions( ):
+        name = '%s.%s' % (f.__module__, getattr( f, '__qualname__', f.__name__ ))
+        if name in infos:
+            name = '%s@%x' % (name, id( f ))
+        infos[ name ] = f.cache_info( )
+    return infos
@@ -0,0 +1,479 @@
+"""
+Incremental encoding and decoding for the binary-to-text codecs in bd2k.util.d32 and
+bd2k.util.d64, and file-like wrappers that encode or decode while reading or writing. The amount
+of memory used is independent of the size of the data.
+
+>>> import io
+>>> from bd2k.util.d64 import standard as d64
+>>> from bd2k.util.files import copyfileobj
+>>> data = bytes( bytearray( range( 256 ) ) ) * 100
+>>> encoded = io.BytesIO( )
+>>> copyfileobj( EncodingReader( io.BytesIO( data ), d64 ), encoded, bufsize=1000 )
+>>> encoded.getvalue( ).decode( 'ascii' ) == d64.encode( data )
+True
+>>> decoded = io.BytesIO( )
+>>> with DecodingWriter( decoded, d64 ) as writer:
+...     copyfileobj( io.BytesIO( encoded.getvalue( ) ), writer, bufsize=1001 )
+>>> decoded.getvalue( ) == data
+True
+"""
+from __future__ import absolute_import
+
+import codecs
+import sys
+from builtins import object
+from builtins import range
+from builtins import str
+
+# The number of groups encoded or decoded at once by encode_into() and decode_into(), bounding the
+# size of the temporary buffers they use
+into_chunk_groups = 16 * 1024
+
+
+def ascii_buffer( e ):
+    """
+    Return the given encoding as a bytes-like object. Text is encoded as ASCII, while anything
+    supporting the buffer protocol, like bytes, bytearray, mmap or a NumPy array, is viewed as a
+    flat sequence of bytes without copying it.
+
+    >>> bytes( ascii_buffer( 'ab' ) ) == bytes( ascii_buffer( bytearray( b'ab' ) ) ) == b'ab'
+    True
+    >>> ascii_buffer( u'\u20ac' )
+    Traceback (most recent call last):
+    ...
+    UnicodeEncodeError: 'ascii' codec can't encode character '\u20ac' in position 0: ordinal not in range(128)
+    """
+    if isinstance( e, str ):
+        return codecs.encode( e, 'ASCII' )
+    return byte_view( e )
+
+
+def byte_view( b ):
+    """
+    Return a flat memoryview of bytes of the given object supporting the buffer protocol.
+    """
+    view = memoryview( b )
+    if view.ndim != 1 or view.format != 'B':
+        view = view.cast( 'B' )
+    return view
+
+
+class Codec( object ):
+    """
+    The base class of binary-to-text codecs that encode groups of bytes into groups of
+    characters. Subclasses implement encode_bytes() and decode_bytes() and set group_size and
+    encoded_group_size.
+    """
+
+    # The number of bytes in a group
+    group_size = None
+
+    # The number of characters each group is encoded into
+    encoded_group_size = None
+
+    def encode_bytes( self, d ):
+        """
+        Encode the given bytes-like object and return the encoding as ASCII bytes.
+        """
+        raise NotImplementedError( )
+
+    def decode_bytes( self, e ):
+        """
+        Decode the given encoding, a bytes-like object containing ASCII characters.
+
+        :raises ValueError: if the input contains characters outside of the alphabet
+        """
+        raise NotImplementedError( )
+
+    def encode_into( self, d, buf ):
+        """
+        Encode the given bytes-like object into the given writable buffer, as ASCII characters,
+        and return the number of characters written. Temporary memory use is bounded
+        independently of the size of the input.
+
+        :raises ValueError: if the buffer is too small
+
+        >>> from bd2k.util.d64 import standard as d64
+        >>> buf = bytearray( 8 )
+        >>> d64.encode_into( b'\\0\\1\\2\\3', buf )
+        6
+        >>> buf  # doctest: +ALLOW_BYTES
+        bytearray(b'..31.k\\x00\\x00')
+        >>> d64.encode_into( b'\\0\\1\\2\\3\\4\\5\\6', buf )
+        Traceback (most recent call last):
+        ...
+        ValueError: The buffer is too small, 10 bytes are needed but it only has 8
+        """
+        return self._into( self.encode_bytes, byte_view( d ), buf,
+                           self.group_size, self.encoded_length )
+
+    def decode_into( self, e, buf ):
+        """
+        Decode the given encoding, either text or a bytes-like object of ASCII characters, into the
+        given writable buffer and return the number of bytes written. Temporary memory use is
+        bounded independently of the size of the input.
+
+        :raises ValueError: if the buffer is too small or the input contains characters outside of
+                the alphabet
+
+        >>> from bd2k.util.d64 import standard as d64
+        >>> buf = bytearray( 5 )
+        >>> d64.decode_into( b'..31.k', buf )
+        4
+        >>> buf  # doctest: +ALLOW_BYTES
+        bytearray(b'\\x00\\x01\\x02\\x03\\x00')
+        """
+        return self._into( self.decode_bytes, ascii_buffer( e ), buf,
+                           self.encoded_group_size, self.decoded_length )
+
+    @staticmethod
+    def _into( f, src, buf, group_size, output_length ):
+        dst = byte_view( buf )
+        n = output_length( len( src ) )
+        if n > len( dst ):
+            raise ValueError( 'The buffer is too small, %i bytes are needed but it only has %i' % (
+                n, len( dst )) )
+        chunk_size = into_chunk_groups * group_size
+        j = 0
+        for i in range( 0, len( src ), chunk_size ):
+            chunk = f( src[ i:i + chunk_size ] )
+            dst[ j:j + len( chunk ) ] = chunk
+            j += len( chunk )
+        assert j == n
+        return j
+
+    def encoded_length( self, n ):
+        """
+        Return the number of characters in the encoding of the given number of bytes.
+        """
+        return (n * self.encoded_group_size + self.group_size - 1) // self.group_size
+
+    def decoded_length( self, n ):
+        """
+        Return the number of bytes in the decoding of the given number of characters.
+        """
+        return n * self.group_size // self.encoded_group_size
+
+    def encode_many( self, items ):
+        """
+        Encode each of the given byte strings. This is equivalent to, but much faster than,
+        invoking encode() on each of them, especially for large numbers of short strings. Each
+        string is padded to a whole number of groups, all of them are encoded at once, and the
+        result is sliced up again.
+
+        :param items: an iterable of bytes-like objects or a NumPy array of fixed-width byte
+               strings, either with a dtype of 'S<n>' or a two-dimensional array of uint8
+
+        :return: a list of strings or, if a NumPy array was passed, a NumPy array of ASCII
+                 byte strings
+
+        >>> from bd2k.util.d64 import standard as d64
+        >>> d64.encode_many( [ b'', b'\\0', b'\\0\\1\\2\\3' ] )  # doctest: +ALLOW_UNICODE
+        ['', '..', '..31.k']
+        """
+        numpy = sys.modules.get( 'numpy' )
+        if numpy is not None and isinstance( items, numpy.ndarray ):
+            return self._encode_array( numpy, items )
+        items = list( items )
+        g, eg = self.group_size, self.encoded_group_size
+        lengths = set( map( len, items ) )
+        if len( lengths ) == 1 and 0 not in lengths:
+            # All items are of the same length, typical for IDs, so the padding can be inserted
+            # as a separator and the result sliced at a fixed stride.
+            n, = lengths
+            pad = b'\0' * (-n % g)
+            e = codecs.decode( self.encode_bytes( pad.join( items ) + pad ), 'ASCII' )
+            k = self.encoded_length( n )
+            return [ e[ i:i + k ] for i in range( 0, len( e ), (n + g - 1) // g * eg ) ]
+        pads = [ b'\0' * (-i % g) for i in range( g ) ]
+        e = codecs.decode( self.encode_bytes( b''.join(
+            x for d in items for x in (d, pads[ len( d ) % g ]) ) ), 'ASCII' )
+        result = [ ]
+        i = 0
+        for d in items:
+            n = len( d )
+            result.append( e[ i:i + (n * eg + g - 1) // g ] )
+            i += (n + g - 1) // g * eg
+        return result
+
+    def decode_many( self, items ):
+        """
+        Decode each of the given strings, the inverse of encode_many().
+
+        :param items: an iterable of strings or a NumPy array of fixed-width ASCII byte strings,
+               either with a dtype of 'S<n>' or a two-dimensional array of uint8
+
+        :return: a list of bytes or, if a NumPy array was passed, a two-dimensional NumPy array
+                 of uint8, one row per item
+
+        >>> from bd2k.util.d64 import standard as d64
+        >>> d64.decode_many( [ '', '..', '..31.k' ] )  # doctest: +ALLOW_BYTES
+        [b'', b'\\x00', b'\\x00\\x01\\x02\\x03']
+        """
+        numpy = sys.modules.get( 'numpy' )
+        if numpy is not None and isinstance( items, numpy.ndarray ):
+            return self._decode_array( numpy, items )
+        items = list( items )
+        g, eg = self.group_size, self.encoded_group_size
+        zero = chr( self.alphabet[ 0 ] )
+        lengths = set( map( len, items ) )
+        if len( lengths ) == 1 and 0 not in lengths:
+            n, = lengths
+            m = self.decoded_length( n )
+            # Like in encode_many(), unless there are superfluous characters to be dropped
+            if self.encoded_length( m ) == n:
+                pad = zero * (-n % eg)
+                d = self.decode_bytes( codecs.encode( pad.join( items ) + pad, 'ASCII' ) )
+                return [ d[ i:i + m ] for i in range( 0, len( d ), (n + eg - 1) // eg * g ) ]
+        pads = [ zero * (-i % eg) for i in range( eg ) ]
+        parts, lengths, superfluous = [ ], [ ], [ ]
+        for e in items:
+            m = len( e ) * g // eg
+            n = (m * eg + g - 1) // g
+            if n < len( e ):
+                superfluous.append( e[ n: ] )
+                e = e[ :n ]
+            parts.append( e )
+            parts.append( pads[ n % eg ] )
+            lengths.append( (m, (n + eg - 1) // eg * g) )
+        d = self.decode_bytes( codecs.encode( ''.join( parts ), 'ASCII' ) )
+        # Superfluous characters are ignored but must still be valid
+        self.decode_bytes( codecs.encode( ''.join( superfluous ), 'ASCII' ) )
+        result = [ ]
+        i = 0
+        for m, padded in lengths:
+            result.append( d[ i:i + m ] )
+            i += padded
+        return result
+
+    def _encode_array( self, numpy, a ):
+        a = self._rows( numpy, a )
+        num_rows, n = a.shape
+        g, eg = self.group_size, self.encoded_group_size
+        a = self._pad( numpy, a, -n % g, 0 )
+        e = numpy.frombuffer( self.encode_bytes( a.tobytes( ) ), dtype=numpy.uint8 )
+        e = e.reshape( num_rows, a.shape[ 1 ] // g * eg )[ :, :self.encoded_length( n ) ]
+        return numpy.ascontiguousarray( e ).view( 'S%i' % e.shape[ 1 ] ).reshape( num_rows )
+
+    def _decode_array( self, numpy, a ):
+        a = self._rows( numpy, a )
+        num_rows, n = a.shape
+        g, eg = self.group_size, self.encoded_group_size
+        m = self.decoded_length( n )
+        valid = self.encoded_length( m )
+        if valid < n:
+            # Superfluous characters are ignored but must still be valid
+            self.decode_bytes( a[ :, valid: ].tobytes( ) )
+            a = a[ :, :valid ]
+        a = self._pad( numpy, a, -a.shape[ 1 ] % eg, self.alphabet[ 0 ] )
+        d = numpy.frombuffer( self.decode_bytes( a.tobytes( ) ), dtype=numpy.uint8 )
+        return d.reshape( num_rows, a.shape[ 1 ] // eg * g )[ :, :m ].copy( )
+
+    @staticmethod
+    def _rows( numpy, a ):
+        """
+        Return the given array of fixed-width byte strings as a two-dimensional array of uint8,
+        one row per string.
+        """
+        if a.ndim == 1:
+            a = numpy.ascontiguousarray( a )
+            a = a.view( numpy.uint8 ).reshape( len( a ), a.dtype.itemsize )
+        elif a.ndim != 2 or a.dtype != numpy.uint8:
+            raise ValueError( 'Expected a one-dimensional array of byte strings or a '
+                              'two-dimensional array of uint8, not %s of %s' % (a.shape, a.dtype) )
+        return a
+
+    @staticmethod
+    def _pad( numpy, a, n, value ):
+        """
+        Append the given number of columns filled with the given value to the given array.
+        """
+        if n:
+            padded = numpy.full( (a.shape[ 0 ], a.shape[ 1 ] + n), value, dtype=numpy.uint8 )
+            padded[ :, :a.shape[ 1 ] ] = a
+            a = padded
+        return a
+
+    def encoder( self ):
+        """
+        Return a new incremental encoder using this codec.
+        """
+        return Encoder( self )
+
+    def decoder( self ):
+        """
+        Return a new incremental decoder using this codec.
+        """
+        return Decoder( self )
+
+
+class _Incremental( object ):
+    """
+    Passes the input to a function in portions that are a multiple of a given size, carrying the
+    remainder over to the next invocation of update().
+    """
+
+    def __init__( self, f, size ):
+        super( _Incremental, self ).__init__( )
+        self.f = f
+        self.size = size
+        self.carry = b''
+
+    def update( self, data ):
+        if self.carry:
+            data = self.carry + data
+        n = len( data )
+        n -= n % self.size
+        self.carry = bytes( data[ n: ] )
+        return self.f( data[ :n ] ) if n else b''
+
+    def finish( self ):
+        carry, self.carry = self.carry, b''
+        return self.f( carry ) if carry else b''
+
+
+class Encoder( _Incremental ):
+    """
+    Encodes data passed to it in arbitrary portions such that the concatenation of the results
+    of all invocations of update() and the final invocation of finish() is the encoding of the
+    concatenation of the portions.
+
+    >>> from bd2k.util.d32 import standard as d32
+    >>> encoder = d32.encoder( )
+    >>> [ encoder.update( d ) for d in ( b'\\0\\1', b'\\2\\3\\4\\5', b'' ) ]  # doctest: +ALLOW_BYTES
+    [b'', b'222k62s6', b'']
+    >>> encoder.finish( )  # doctest: +ALLOW_BYTES
+    b'2o'
+    >>> d32.encode( b'\\0\\1\\2\\3\\4\\5' )  # doctest: +ALLOW_UNICODE
+    '222k62s62o'
+    """
+
+    def __init__( self, codec ):
+        super( Encoder, self ).__init__( codec.encode_bytes, codec.group_size )
+
+
+class Decoder( _Incremental ):
+    """
+    The counterpart of Encoder.
+
+    >>> from bd2k.util.d32 import standard as d32
+    >>> decoder = d32.decoder( )
+    >>> [ decoder.update( e ) for e in ( b'222k6', b'2s62o' ) ]  # doctest: +ALLOW_BYTES
+    [b'', b'\\x00\\x01\\x02\\x03\\x04']
+    >>> decoder.finish( )  # doctest: +ALLOW_BYTES
+    b'\\x05'
+    """
+
+    def __init__( self, codec ):
+        super( Decoder, self ).__init__( codec.decode_bytes, codec.encoded_group_size )
+
+
+class _Reader( object ):
+    """
+    A file-like object that reads from another file-like object and returns the result of passing
+    what it reads through an incremental encoder or decoder.
+    """
+
+    # The number of bytes to read from the underlying file at once
+    bufsize = 1024 * 1024
+
+    def __init__( self, src, incremental ):
+        super( _Reader, self ).__init__( )
+        self.src = src
+        self.incremental = incremental
+        self.buffer = b''
+        self.eof = False
+
+    def read( self, size=-1 ):
+        chunks = [ self.buffer ]
+        n = len( self.buffer )
+        while not self.eof and (size < 0 or n < size):
+            data = self.src.read( self.bufsize )
+            if data:
+                chunk = self.incremental.update( data )
+            else:
+                chunk = self.incremental.finish( )
+                self.eof = True
+            chunks.append( chunk )
+            n += len( chunk )
+        data = b''.join( chunks )
+        if size < 0:
+            self.buffer = b''
+            return data
+        else:
+            self.buffer = data[ size: ]
+            return data[ :size ]
+
+
+class EncodingReader( _Reader ):
+    """
+    A file-like object whose read() method returns the encoding of what is read from the given
+    binary file-like object.
+    """
+
+    def __init__( self, src, codec ):
+        super( EncodingReader, self ).__init__( src, codec.encoder( ) )
+
+
+class DecodingReader( _Reader ):
+    """
+    A file-like object whose read() method returns the decoding of what is read from the given
+    binary file-like object.
+    """
+
+    def __init__( self, src, codec ):
+        super( DecodingReader, self ).__init__( src, codec.decoder( ) )
+
+
+class _Writer( object ):
+    """
+    A file-like object that passes what is written to it through an incremental encoder or decoder
+    and writes the result to another file-like object. Like gzip.GzipFile, close() writes what
+    remains but doesn't close the underlying file.
+    """
+
+    def __init__( self, dst, incremental ):
+        super( _Writer, self ).__init__( )
+        self.dst = dst
+        self.incremental = incremental
+        self.closed = False
+
+    def write( self, data ):
+        if self.closed:
+            raise ValueError( 'I/O operation on closed file.' )
+        self.dst.write( self.incremental.update( data ) )
+        return len( data )
+
+    def flush( self ):
+        self.dst.flush( )
+
+    def close( self ):
+        if not self.closed:
+            self.closed = True
+            self.dst.write( self.incremental.finish( ) )
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, exc_type, exc_val, exc_tb ):
+        self.close( )
+
+
+class EncodingWriter( _Writer ):
+    """
+    A file-like object that writes the encoding of what is written to it to the given binary
+    file-like object.
+    """
+
+    def __init__( self, dst, codec ):
+        super( EncodingWriter, self ).__init__( dst, codec.encoder( ) )
+
+
+class DecodingWriter( _Writer ):
+    """
+    A file-like object that writes the decoding of what is written to it to the given binary
+    file-like object.
+    """
+
+    def __init__( self, dst, codec ):
+        super( DecodingWriter, self ).__init__( dst, codec.decoder( ) )
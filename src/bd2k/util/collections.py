@@ -1,11 +1,15 @@
 from __future__ import absolute_import
 
 from builtins import next
-import collections
 from itertools import dropwhile
 
+try:
+    from collections.abc import MutableSet
+except ImportError:
+    from collections import MutableSet
 
-class OrderedSet( collections.MutableSet ):
+
+class OrderedSet( MutableSet ):
     """
     An ordered set from http://code.activestate.com/recipes/576694/
 
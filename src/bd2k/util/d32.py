@@ -18,21 +18,48 @@ from __future__ import division
 
 # Inspired by Dominic Tarr's JavaScript at https://github.com/dominictarr/d64
 import codecs
-import sys
+
+try:
+    maketrans = bytes.maketrans
+except AttributeError:
+    from string import maketrans
+
+from builtins import int
 from builtins import range
-from builtins import object
-from past.utils import old_div
-class D32( object ):
+
+from bd2k.util import memoize
+from bd2k.util.codec import Codec, ascii_buffer, byte_view
+
+# The number of 5-byte groups encoded at once. Larger chunks make for fewer operations per chunk
+# but each of them touches more memory. This value was determined empirically.
+chunk_groups = 1024
+
+
+class D32( Codec ):
     """
     Base32 encoding and decoding without padding, and using an arbitrary alphabet.
+
+    Instead of looping over the input in Python, the input is processed in chunks of many groups
+    of five bytes. Each chunk is converted to a single integer whose 5-bit digits are spread out
+    into bytes by a fixed number of bitwise operations on that integer. The resulting bytes are
+    then translated to the alphabet. Decoding does the reverse.
     """
 
+    group_size = 5
+    encoded_group_size = 8
+
     def __init__( self, alphabet ):
         super( D32, self ).__init__( )
         self.alphabet = bytearray( alphabet.encode('utf-8') )
         self.lookup = bytearray( 255 )
         for i in range( 32 ):
             self.lookup[ self.alphabet[ i ] ] = i
+        self._encoding = maketrans( bytes( bytearray( range( 32 ) ) ), bytes( self.alphabet ) )
+        # Characters outside of the alphabet are mapped to a value that isn't a 5-bit digit
+        decoding = bytearray( b'\xff' * 256 )
+        for i in range( 32 ):
+            decoding[ self.alphabet[ i ] ] = i
+        self._decoding = bytes( decoding )
 
     def encode( self, d ):
         """
@@ -48,70 +75,120 @@ class D32( object ):
         >>> encode(b'\\0\\1\\2\\3\\4\\5')  # doctest: +ALLOW_UNICODE
         '222k62s62o'
         """
-        m = len( d )
-        n = old_div((m * 8 + 4), 5)
-        padding = 8 - n % 8
-        e = bytearray( n + padding )
-        i, j = 0, 0
-        a = self.alphabet
-
-        while i < m:
-            if m - i < 5:
-                g = bytearray( d[ i: ] + b'\0' * (5 - (m - i)))
-            else:
-                g = bytearray( d[ i:i + 5 ] )
-            # bit              1          2          3
-            # bit   01234567 89012345 67890123 45678901 23456789
-            # byte  00000000 11111111 22222222 33333333 44444444
-            # group 00000111 11222223 33334444 45555566 66677777
-            e[ j + 0 ] = a[ g[ 0 ] >> 3 ]
-            e[ j + 1 ] = a[ g[ 0 ] << 2 & 31 | g[ 1 ] >> 6 ]
-            e[ j + 2 ] = a[ g[ 1 ] >> 1 & 31 ]
-            e[ j + 3 ] = a[ g[ 1 ] << 4 & 31 | g[ 2 ] >> 4 ]
-            e[ j + 4 ] = a[ g[ 2 ] << 1 & 31 | g[ 3 ] >> 7 ]
-            e[ j + 5 ] = a[ g[ 3 ] >> 2 & 31 ]
-            e[ j + 6 ] = a[ g[ 3 ] << 3 & 31 | g[ 4 ] >> 5 ]
-            e[ j + 7 ] = a[ g[ 4 ] & 31 ]
-            j += 8
-            i += 5
-        return codecs.decode( e[ :-padding ], 'ASCII' )
+        return codecs.decode( self.encode_bytes( d ), 'ASCII' )
 
     def decode( self, e ):
         """
         >>> import codecs
         >>> decode = standard.decode
 
-        # >>> decode('222k62s62o')
-        # '\\x00\\x01\\x02\\x03\\x04\\x05'
-        # >>> decode('222k62s6')
-        # '\\x00\\x01\\x02\\x03\\x04'
+        >>> decode('222k62s62o')  # doctest: +ALLOW_BYTES
+        b'\\x00\\x01\\x02\\x03\\x04\\x05'
+        >>> decode('222k62s6')  # doctest: +ALLOW_BYTES
+        b'\\x00\\x01\\x02\\x03\\x04'
         >>> codecs.decode(decode('zw'), 'unicode-escape')  # # doctest: +ALLOW_UNICODE
         '\\xff'
+        >>> decode('zW')
+        Traceback (most recent call last):
+        ...
+        ValueError: Not a valid D32 encoding: zW
         """
-        n = len( e )
-        m = old_div(n * 5, 8)
-        padding = 5 - m % 5
-        d = bytearray( m + padding )
-        i, j = 0, 0
-        l = self.lookup
-        while j < n:
-            if n - j < 8:
-                g = [ l[ ord( x ) ] for x in e[ j: ] ] + [ 0 ] * (8 - (n - j))
-            else:
-                g = [ l[ ord( x ) ] for x in e[ j:j + 8 ] ]
-            # bit              1          2          3
-            # bit   01234567 89012345 67890123 45678901 23456789
-            # byte  00000000 11111111 22222222 33333333 44444444
-            # group 00000111 11222223 33334444 45555566 66677777
-            d[ i + 0 ] = g[ 0 ] << 3 & 255 | g[ 1 ] >> 2
-            d[ i + 1 ] = g[ 1 ] << 6 & 255 | g[ 2 ] << 1 & 255 | g[ 3 ] >> 4
-            d[ i + 2 ] = g[ 3 ] << 4 & 255 | g[ 4 ] >> 1
-            d[ i + 3 ] = g[ 4 ] << 7 & 255 | g[ 5 ] << 2 & 255 | g[ 6 ] >> 3
-            d[ i + 4 ] = g[ 6 ] << 5 & 255 | g[ 7 ]
-            j += 8
-            i += 5
-
-        return bytes(d[ :-padding ])
+        try:
+            return self.decode_bytes( ascii_buffer( e ) )
+        except ValueError:
+            raise ValueError( 'Not a valid D32 encoding: %s' % (e,) )
+
+    def encode_bytes( self, d ):
+        if not isinstance( d, bytes ):
+            d = byte_view( d )
+        m = len( d )
+        chunk_size = 5 * chunk_groups
+        e = b''.join( _spread( d[ i:i + chunk_size ] ) for i in range( 0, m, chunk_size ) )
+        return e[ :(m * 8 + 4) // 5 ].translate( self._encoding )
+
+    def decode_bytes( self, e ):
+        digits = bytes( e ).translate( self._decoding )
+        if b'\xff' in digits:
+            raise ValueError( 'Not a valid D32 encoding' )
+        n = len( digits )
+        chunk_size = 8 * chunk_groups
+        d = b''.join( _gather( digits[ i:i + chunk_size ] ) for i in range( 0, n, chunk_size ) )
+        return d[ :n * 5 // 8 ]
+
+
+def _spread( d ):
+    """
+    Return a byte string with one byte per 5-bit digit of the given byte string. The result is
+    padded to a multiple of eight digits.
+
+    >>> list( _spread( b'\\xff' ) )
+    [31, 28, 0, 0, 0, 0, 0, 0]
+    """
+    groups = (len( d ) + 4) // 5
+    if len( d ) % 5:
+        d = bytes( d ) + b'\0' * (5 * groups - len( d ))
+    x = int.from_bytes( d, 'big' )
+    for mask, shift in _spreading_steps( ):
+        y = x & mask
+        x = x ^ y | y << shift
+    return x.to_bytes( 8 * groups, 'big' )
+
+
+def _gather( digits ):
+    """
+    The inverse of _spread()
+
+    >>> _gather( bytes( bytearray( [ 31, 28 ] ) ) )  # doctest: +ALLOW_BYTES
+    b'\\xff\\x00\\x00\\x00\\x00'
+    """
+    groups = (len( digits ) + 7) // 8
+    x = int.from_bytes( digits + b'\0' * (8 * groups - len( digits )), 'big' )
+    for mask, shift in _gathering_steps( ):
+        y = x & mask
+        x = x ^ y | y >> shift
+    return x.to_bytes( 5 * groups, 'big' )
+
+
+@memoize
+def _spreading_steps( ):
+    """
+    Return a list of (mask, shift) pairs such that shifting the bits selected by each mask,
+    one pair after the other, moves each 5-bit digit of an integer into its own byte.
+
+    In the first phase, the 40-bit groups are moved apart, into 64-bit slots. Group g, counting
+    from the least significant end, needs to move by 24 * g bits. It does so in one step per bit
+    in g, starting with the most significant one, and moving by 24 * 2 ** b bits in the step for
+    bit b. Going from the most significant bit down guarantees that moved groups don't overlap the
+    ones that weren't. In the second phase, the same is done within each 64-bit slot, moving each
+    5-bit digit d by 3 * d bits.
+    """
+    steps = [ ]
+    num_bits = chunk_groups.bit_length( ) - 1
+    assert chunk_groups == 1 << num_bits
+    for b in reversed( range( num_bits ) ):
+        # Group positions are multiples of eight bits, so the mask can be built bytewise
+        mask = bytearray( 8 * chunk_groups )
+        for g in range( chunk_groups ):
+            if g >> b & 1:
+                i = len( mask ) - (40 * g + 24 * (g >> b + 1 << b + 1)) // 8
+                mask[ i - 5:i ] = b'\xff' * 5
+        steps.append( (int.from_bytes( bytes( mask ), 'big' ), 24 << b) )
+    for b in (2, 1, 0):
+        mask = 0
+        for d in range( 8 ):
+            if d >> b & 1:
+                mask |= 31 << 5 * d + 3 * (d >> b + 1 << b + 1)
+        mask = int.from_bytes( mask.to_bytes( 8, 'big' ) * chunk_groups, 'big' )
+        steps.append( (mask, 3 << b) )
+    return steps
+
+
+@memoize
+def _gathering_steps( ):
+    """
+    The inverse of _spreading_steps(), with each mask selecting the bits at their destination
+    """
+    return [ (mask << shift, shift) for mask, shift in reversed( _spreading_steps( ) ) ]
 
 
 # A variant of Base64 that maintains the lexicographical ordering such that for any given list of
@@ -119,6 +196,6 @@ class D32( object ):
 
 standard = D32( '234567abcdefghijklmnopqrstuvwxyz' )
 
-# A reimplementation of base64.b32encode and base64.b32encode, but faster and without padding:
+# A variant of base64.b32encode and base64.b32decode that uses lower case and omits padding:
 
 base32 = D32( 'abcdefghijklmnopqrstuvwxyz234567' )
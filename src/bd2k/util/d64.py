@@ -19,13 +19,34 @@ from __future__ import division
 
 # Ported from JS found at https://github.com/dominictarr/d64
 
+import binascii
 import codecs
-from builtins import bytes
+
+try:
+    maketrans = bytes.maketrans
+except AttributeError:
+    from string import maketrans
+
 from builtins import range
-from builtins import object
-from past.utils import old_div
 
-class D64( object ):
+from bd2k.util.codec import Codec, ascii_buffer, byte_view
+
+# The alphabet used by binascii.b2a_base64() and binascii.a2b_base64()
+_base64_alphabet = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+
+
+class D64( Codec ):
+    """
+    Base64 encoding and decoding without padding, and using an alphabet whose lexicographical
+    order matches the order of the values of its characters.
+
+    The work is done in bulk by the base64 codec in binascii, translating its output to the
+    alphabet, and translating the input to decode back from it.
+    """
+
+    group_size = 3
+    encoded_group_size = 4
+
     def __init__( self, special_chars ):
         super( D64, self ).__init__( )
         alphabet = 'PYFGCRLAOEUIDHTNSQJKXBMWVZpyfgcrlaoeuidhtnsqjkxbmwvz1234567890'
@@ -34,6 +55,12 @@ class D64( object ):
         for i in range( 64 ):
             code = self.alphabet[ i ]
             self.lookup[ code ] = i
+        self._encoding = maketrans( _base64_alphabet, bytes( self.alphabet ) )
+        # Characters outside of the alphabet are mapped to one that is outside of both alphabets
+        decoding = bytearray( b'!' * 256 )
+        for i in range( 64 ):
+            decoding[ self.alphabet[ i ] ] = _base64_alphabet[ i ]
+        self._decoding = bytes( decoding )
 
     def encode( self, data ):
         """
@@ -49,35 +76,7 @@ class D64( object ):
         >>> encode(b'\\x00\\x01\\x02\\x03\\x04\\x05\\x06\\x07')  # doctest: +ALLOW_UNICODE
         '..31.kF40VR'
         """
-        data = bytes( data )
-        l = len( data )
-        s = bytearray( old_div((l * 4 + 2), 3) )
-        hang = 0
-        j = 0
-        a = self.alphabet
-        for i in range( l ):
-            v = data[ i ]
-            r = i % 3
-            if r == 0:
-                s[ j ] = a[ v >> 2 ]
-                j += 1
-                hang = (v & 3) << 4
-            elif r == 1:
-                s[ j ] = a[ hang | v >> 4 ]
-                j += 1
-                hang = (v & 0xf) << 2
-            elif r == 2:
-                s[ j ] = a[ hang | v >> 6 ]
-                j += 1
-                s[ j ] = a[ v & 0x3f ]
-                j += 1
-                hang = 0
-            else:
-                assert False
-        if l % 3:
-            s[ j ] = a[ hang ]
-
-        return codecs.decode( s )
+        return codecs.decode( self.encode_bytes( data ) )
 
     def decode( self, e ):
         """
@@ -93,32 +92,34 @@ class D64( object ):
         '\\x00\\x01\\x02'
         >>> codecs.decode(decode('..31.kF40VR'), 'unicode-escape') # doctest: +ALLOW_UNICODE
         '\\x00\\x01\\x02\\x03\\x04\\x05\\x06\\x07'
+        >>> decode('..+')
+        Traceback (most recent call last):
+        ...
+        ValueError: Not a valid D64 encoding: ..+
         """
+        try:
+            return self.decode_bytes( ascii_buffer( e ) )
+        except ValueError:
+            raise ValueError( 'Not a valid D64 encoding: %s' % (e,) )
+
+    def encode_bytes( self, d ):
+        if not isinstance( d, bytes ):
+            d = byte_view( d )
+        e = binascii.b2a_base64( d )
+        # Strip the newline and padding
+        return e[ :(len( d ) * 4 + 2) // 3 ].translate( self._encoding )
+
+    def decode_bytes( self, e ):
+        e = bytes( e ).translate( self._decoding )
+        # The binascii decoder ignores invalid characters, we don't
+        if b'!' in e:
+            raise ValueError( 'Not a valid D64 encoding' )
         n = len( e )
-        j = 0
-        b = bytearray( old_div(n * 3, 4) )
-        hang = 0
-        l = self.lookup
-
-        for i in range( n ):
-            v = l[ ord( e[ i ] ) ]
-            r = i % 4
-            if r == 0:
-                hang = v << 2
-            elif r == 1:
-                b[ j ] = hang | v >> 4
-                j += 1
-                hang = (v << 4) & 0xFF
-            elif r == 2:
-                b[ j ] = hang | v >> 2
-                j += 1
-                hang = (v << 6) & 0xFF
-            elif r == 3:
-                b[ j ] = hang | v
-                j += 1
-            else:
-                assert False
-        return bytes(b)
+        # A length that can't result from encoding carries a superfluous character
+        if n % 4 == 1:
+            n -= 1
+            e = e[ :n ]
+        return binascii.a2b_base64( e + b'=' * (-n % 4) )
 
 
 standard = D64( '._' )
@@ -146,4 +146,4 @@ def translate( pat ):
                 res = '%s[%s]' % (res, stuff)
         else:
             res = res + re.escape( c )
-    return res + '\Z(?ms)'
+    return '(?ms)' + res + r'\Z'
@@ -1,5 +1,14 @@
+import codecs
+import hashlib
+import json
+import re
+import struct
+import sys
+import tempfile
+from builtins import object
 from builtins import str
-from past.builtins import basestring
+
+
 def hash_json( hash_obj, value ):
     """
     Compute the hash of a parsed JSON value using the given hash object. This function does not
@@ -7,13 +16,31 @@ def hash_json( hash_obj, value ):
     format. Hashables (JSON objects) are hashed entry by entry in order of the lexicographical
     ordering on the keys. Iterables are hashed in their inherent order.
 
+    The value is traversed iteratively, so there is no limit on how deeply it may be nested. The
+    canonical representation is buffered and passed to the hash object in large chunks. Lists
+    of numbers are converted by the C implementation of the json module.
+
     If value or any of its children is an iterable with non-deterministic ordering of its
     elements, e.g. a set, this method will yield non-deterministic results.
 
+    Byte strings, NumPy arrays and other objects supporting the buffer protocol are hashed as
+    binary leaves: the canonical prefix '#<typestr>(<shape>):' followed by the raw contents of
+    the buffer, which are passed to the hash object without being copied. For NumPy arrays,
+    <typestr> is the array-interface type string of the dtype in little-endian byte order, e.g.
+    '<f8' or '|b1', <shape> is the comma-separated shape of the array and the contents are the
+    elements in C order and little-endian byte order. Arrays in big-endian byte order or that
+    aren't C-contiguous are converted, and therefore copied, first. The digest of an array thus
+    depends on its dtype, shape and elements but not on its memory layout, the platform or the
+    version of NumPy. Arrays of objects and structured arrays are not supported. All other
+    buffers, including bytes and bytearray, are hashed as a one-dimensional array of unsigned
+    bytes ('|u1') in their in-memory layout, which, for buffers of multi-byte items like an
+    array.array, may depend on the platform. Note that arrays don't hash like lists of the same
+    elements. NumPy scalars are hashed like the equivalent Python scalar.
+
     :param hash_obj: one of the Hash objects in hashlib, or any other object that has an update(s)
            method accepting a single string.
 
-    :type value: int|str|float|Iterable[type(obj)]|Hashable[str,type(obj)]
+    :type value: int|str|float|bytes|numpy.ndarray|Iterable[type(obj)]|Hashable[str,type(obj)]
     :param value: The value to be hashed
 
     >>> import hashlib
@@ -59,78 +86,822 @@ def hash_json( hash_obj, value ):
     Traceback (most recent call last):
     ...
     ValueError: Type "object" is not supported.
+    >>> actual([b'ab', bytearray(b'c')]) == expect(u'[#|u1(2):ab,#|u1(1):c]')
+    True
     """
+    parts = [ ]
+    append = parts.append
+    # One entry per container being hashed: an iterator over the remaining elements or items, and
+    # whether the container is a JSON object, or a JSON array otherwise
+    stack = [ ]
+    first = True
+    while True:
+        # Dispatch on the exact type for the common types, avoiding the cost of raising
+        # AttributeError or TypeError for every leaf
+        t = type( value )
+        if t is str:
+            append( '"' )
+            append( value )
+            append( '"' )
+        elif t is int or t is float:
+            append( str( value ) )
+        elif t is bool:
+            append( 'true' if value else 'false' )
+        elif t is dict:
+            append( '{' )
+            stack.append( (iter( sorted( value.items( ) ) ), True) )
+            first = True
+        elif t in _sequence_types and _dumps_leaves( value, append ):
+            pass
+        elif t in _sequence_types:
+            append( '[' )
+            stack.append( (iter( value ), False) )
+            first = True
+        else:
+            first = _hash_other( value, hash_obj, parts, stack )
+        if len( parts ) > _max_parts:
+            _flush( hash_obj, parts )
+        # Find the next value to hash, closing any exhausted containers along the way
+        while stack:
+            iterator, is_object = stack[ -1 ]
+            try:
+                item = next( iterator )
+            except StopIteration:
+                stack.pop( )
+                append( '}' if is_object else ']' )
+                first = False
+            else:
+                if first:
+                    first = False
+                else:
+                    append( ',' )
+                if is_object:
+                    k, value = item
+                    if isinstance( k, str ):
+                        append( k )
+                        append( ':' )
+                    else:
+                        raise ValueError( 'Dictionary keys must be strings, not type "%s".' %
+                                          type( k ).__name__ )
+                else:
+                    value = item
+                break
+        else:
+            break
+    _flush( hash_obj, parts )
+
+
+# The number of parts of the canonical representation to collect before passing them to the hash
+# object in one go
+_max_parts = 4096
+
+
+def _hash_other( value, hash_obj, parts, stack ):
+    """
+    Append the representation of a value whose type is not one of the common ones, or, if the
+    value is a container, its opening bracket, pushing an iterator over its contents on the stack.
+    Binary leaves are passed to the hash object directly, after flushing the parts. Return True if
+    the value is a container.
+    """
+    append = parts.append
     try:
-        items = iter(value.items( ))
+        items = value.items( )
     except AttributeError:
         # Must check for string before testing iterability since strings are iterable
         if isinstance( value, str ):
-            _hash_string( hash_obj, value )
+            append( '"' )
+            append( value )
+            append( '"' )
+        elif _is_numpy_scalar( value ):
+            return _hash_other( value.item( ), hash_obj, parts, stack )
+        elif _is_binary( value ):
+            prefix, buf = _binary_leaf( value )
+            append( prefix )
+            _flush( hash_obj, parts )
+            hash_obj.update( buf )
         else:
             try:
                 iterator = iter( value )
             except TypeError:
                 # We must check for bool first since it is subclass of int (wrongly, IMHO)
                 if isinstance( value, bool ):
-                    _hash_bool( hash_obj, value )
+                    append( 'true' if value else 'false' )
                 elif isinstance( value, (int, float) ):
-                    _hash_number( hash_obj, value )
+                    append( str( value ) )
                 else:
                     raise ValueError( 'Type "%s" is not supported.' % type( value ).__name__ )
             else:
-                _hash_iterable( hash_obj, iterator )
+                append( '[' )
+                stack.append( (iterator, False) )
+                return True
+    else:
+        append( '{' )
+        stack.append( (iter( sorted( items ) ), True) )
+        return True
+    return False
+
+
+def _is_numpy_scalar( value ):
+    numpy = sys.modules.get( 'numpy' )
+    return numpy is not None and isinstance( value, numpy.generic )
+
+
+def _is_binary( value ):
+    """
+    True if the given value is to be hashed as a binary leaf. NumPy scalars should be ruled out
+    first since they support the buffer protocol, too.
+    """
+    numpy = sys.modules.get( 'numpy' )
+    if numpy is not None and isinstance( value, numpy.ndarray ):
+        return True
+    try:
+        memoryview( value )
+    except TypeError:
+        return False
     else:
-        _hash_hashable( hash_obj, items )
+        return True
 
 
-def _hash_number( hash_obj, n ):
-    hash_obj.update( str( n ).encode('utf-8') )
+# The kinds of NumPy dtypes whose elements are plain bytes, not references to objects, and can
+# be brought into a canonical byte order by astype()
+_binary_kinds = frozenset( 'biufcSUmM' )
 
 
-def _hash_bool( hash_obj, b ):
-    hash_obj.update( str('true' if b else 'false' ).encode('utf-8'))
+def _binary_leaf( value ):
+    """
+    Return a tuple of the canonical prefix of the given binary leaf and a buffer with the
+    canonical representation of its contents.
+    """
+    numpy = sys.modules.get( 'numpy' )
+    if numpy is not None and isinstance( value, numpy.ndarray ):
+        dtype = value.dtype
+        if dtype.kind not in _binary_kinds:
+            raise ValueError( 'Arrays of type "%s" are not supported.' % dtype )
+        if dtype.byteorder == '>' or dtype.byteorder == '=' and sys.byteorder == 'big':
+            value = value.astype( dtype.newbyteorder( '<' ) )
+        if not value.flags.c_contiguous:
+            value = value.copy( order='C' )
+        typestr, shape = value.dtype.str, value.shape
+        # Not all dtypes can be exported through the buffer protocol, datetime64, for example
+        buf = value.reshape( -1 ).view( numpy.uint8 ) if value.size else b''
+    else:
+        buf = memoryview( value )
+        if not buf.c_contiguous:
+            buf = memoryview( buf.tobytes( ) )
+        buf = buf.cast( 'B' )
+        typestr, shape = '|u1', (buf.nbytes,)
+    return '#%s(%s):' % (typestr, ','.join( map( str, shape ) )), buf
 
 
-def _hash_string( hash_obj, s ):
-    hash_obj.update( '"'.encode('utf-8') )
-    hash_obj.update( s.encode('utf-8') )
-    hash_obj.update( '"'.encode('utf-8') )
+def _flush( hash_obj, parts ):
+    if parts:
+        hash_obj.update( ''.join( parts ).encode( 'utf-8' ) )
+        del parts[ : ]
 
 
-def _hash_iterable( hash_obj, items ):
-    hash_obj.update( '['.encode('utf-8') )
-    try:
-        item = next( items )
-        hash_json( hash_obj, item )
+_sequence_types = (list, tuple)
+
+# The types of array elements for which json.dumps() yields the canonical representation. Only
+# on Python 3, is the representation of a float the same as what str() returns.
+_leaf_types = frozenset( (int, float, bool) if sys.version_info[ 0 ] >= 3 else () )
+
+_dumps = json.JSONEncoder( separators=(',', ':'), allow_nan=False ).encode
+
+
+def _dumps_leaves( value, append ):
+    """
+    If the given list or tuple only contains numbers and booleans, append its canonical
+    representation, as generated by the JSON encoder written in C, and return True. Otherwise,
+    return False.
+    """
+    types = set( map( type, value ) )
+    if types and types <= _leaf_types:
+        try:
+            append( _dumps( value ) )
+        except ValueError:
+            # NaN or infinity
+            return False
+        else:
+            return True
+    else:
+        return False
+
+
+def hash_json_file( hash_obj, f, max_object_size=16 * 1024 * 1024, bufsize=1024 * 1024 ):
+    """
+    Compute the same hash as hash_json( hash_obj, json.load( f ) ) without loading the entire
+    document into memory. The document is read and tokenized incrementally.
+
+    The members of a JSON object must be hashed in the order of their keys, so the canonical
+    representation of each member value is buffered until the end of the object is reached. The
+    buffer for each object is kept in memory until it exceeds the given size, at which point it is
+    moved to a temporary file. Peak memory is therefore bounded by about
+
+    - twice max_object_size for each object that encloses the current position in the document,
+      i.e. for each level of nesting of objects, plus
+
+    - the keys of the members of those objects, plus
+
+    - a few times bufsize or the largest string in the document, whichever is larger.
+
+    With the defaults and documents that nest objects no more than a few levels deep, that is
+    less than 100 MiB, regardless of the size of the document.
+
+    Arrays are not buffered. A document consisting of a huge array of small objects, for
+    example, is hashed in constant memory.
+
+    :param hash_obj: one of the Hash objects in hashlib, or any other object that has an update(s)
+           method accepting a single string.
+
+    :param f: a file-like object containing the document, opened in text or binary mode. In
+           binary mode, the document must be encoded in UTF-8.
+
+    :param max_object_size: the number of bytes of canonical representation beyond which the
+           buffer for the members of an object is written to disk
+
+    :param bufsize: the number of characters or bytes to read from the file at a time
+
+    >>> import hashlib, io
+    >>> def actual(s): h = hashlib.md5(); hash_json_file(h,io.StringIO(s)); return h.hexdigest()
+    >>> def expect(s): h = hashlib.md5(); hash_json(h,json.loads(s)); return h.hexdigest()
+    >>> s = u'{"b": [1, 2.50, true, {"y": "\\u00e4", "x": -1e3}], "a": false}'
+    >>> actual(s) == expect(s)
+    True
+    >>> actual(u'[1, null]')
+    Traceback (most recent call last):
+    ...
+    ValueError: Type "NoneType" is not supported.
+    >>> actual(u'[1, 2')
+    Traceback (most recent call last):
+    ...
+    ValueError: Not a valid JSON document, unexpected end at character 5
+    >>> actual(u'{"a": 1}}')
+    Traceback (most recent call last):
+    ...
+    ValueError: Not a valid JSON document, unexpected '}' at character 8
+    """
+    top = _Output( hash_obj.update )
+    # One entry per object or array enclosing the current token, an _Object or '[', respectively
+    stack = [ ]
+    out = top
+    # The token just consumed, ':' or ',' standing for the separators as well as the opening
+    # brackets, None for the beginning of the document, 'k' for a key and 'v' for any complete
+    # value, including a closed object or array
+    last = None
+    tokenizer = _Tokenizer( f, bufsize )
+    kind_opening = { '}': '{', ']': '[' }
+    for kind, value in tokenizer.tokens( ):
+        if len( out.parts ) > _max_parts or out.size > bufsize:
+            out.flush( )
+        frame = stack[ -1 ] if stack else None
+        in_object = isinstance( frame, _Object )
+        if kind == 's' and in_object and last in ('{', ','):
+            frame.begin( value )
+            last = 'k'
+            continue
+        elif kind == ':':
+            if last == 'k':
+                last = ':'
+                continue
+        elif kind == ',':
+            if last == 'v' and stack:
+                if in_object:
+                    frame.end( )
+                else:
+                    out.append( ',' )
+                last = ','
+                continue
+        elif kind in kind_opening:
+            closes_object = kind == '}'
+            if stack and in_object == closes_object and last in ('v', kind_opening[ kind ]):
+                stack.pop( )
+                if in_object:
+                    if last == 'v':
+                        frame.end( )
+                    out = frame.parent
+                    frame.copy_to( out )
+                else:
+                    out.append( ']' )
+                last = 'v'
+                continue
+        elif last == ':' or last is None or last == '[' or (last == ',' and not in_object):
+            # A value is expected
+            if kind == 's':
+                out.append( '"' )
+                out.append( value )
+                out.append( '"' )
+                out.size += len( value )
+            elif kind == 'v':
+                # We must check for bool first since it is subclass of int (wrongly, IMHO)
+                if value is True or value is False:
+                    out.append( 'true' if value else 'false' )
+                elif value is None:
+                    raise ValueError( 'Type "NoneType" is not supported.' )
+                else:
+                    out.append( str( value ) )
+            elif kind == '{':
+                frame = _Object( out, max_object_size )
+                stack.append( frame )
+                out = frame.output
+                last = '{'
+                continue
+            elif kind == '[':
+                stack.append( '[' )
+                out.append( '[' )
+                last = '['
+                continue
+            last = 'v'
+            continue
+        raise ValueError( "Not a valid JSON document, unexpected '%s' at character %i" %
+                          (value if kind in 'sv' else kind, tokenizer.offset) )
+    if stack or last != 'v':
+        raise ValueError( 'Not a valid JSON document, unexpected end at character %i' %
+                          tokenizer.offset )
+    top.flush( )
+
+
+class _Output( object ):
+    """
+    Collects parts of a canonical representation and passes them to the given function in chunks
+    """
+
+    def __init__( self, write ):
+        self.parts = [ ]
+        self.append = self.parts.append
+        self.write = write
+        # The approximate number of characters in the parts, not counting short ones
+        self.size = 0
+
+    def flush( self ):
+        parts = self.parts
+        if parts:
+            self.write( ''.join( parts ).encode( 'utf-8' ) )
+            del parts[ : ]
+        self.size = 0
+
+
+class _Object( object ):
+    """
+    The members of a JSON object being read, buffered until the end of the object is reached and
+    they can be written out in order of their keys. The canonical representation of the member
+    values is kept in memory until it exceeds the given size or until a single member value
+    becomes too large to be joined into one string. From then on the member values are written to
+    a spooled temporary file which in turn moves to disk once it exceeds the given size.
+    """
+
+    def __init__( self, parent, max_size ):
+        self.parent = parent
+        self.max_size = max_size
+        self.size = 0
+        self.spool = None
+        self.output = _Output( self._write )
+        # A (key, value) tuple for each member, where value is either the canonical representation
+        # of the member value or, once the object has been spilled, an (offset, length) tuple
+        # locating it in the spool
+        self.members = [ ]
+        self.key = None
+        self.start = 0
+
+    def _spill( self ):
+        spool = tempfile.SpooledTemporaryFile( max_size=self.max_size )
+        members = self.members
+        for i, (key, value) in enumerate( members ):
+            value = value.encode( 'utf-8' )
+            members[ i ] = key, (spool.tell( ), len( value ))
+            spool.write( value )
+        self.spool = spool
+        self.start = spool.tell( )
+
+    def _write( self, b ):
+        # Only invoked when the canonical representation of the current member value has grown
+        # large enough to warrant flushing it in chunks
+        if self.spool is None:
+            self._spill( )
+        self.spool.write( b )
+
+    def begin( self, key ):
+        self.key = key
+        if self.spool is not None:
+            self.output.flush( )
+            self.start = self.spool.tell( )
+
+    def end( self ):
+        output = self.output
+        if self.spool is None:
+            value = ''.join( output.parts )
+            del output.parts[ : ]
+            output.size = 0
+            self.members.append( (self.key, value) )
+            self.size += len( value )
+            if self.size > self.max_size:
+                self._spill( )
+        else:
+            self.output.flush( )
+            end = self.spool.tell( )
+            self.members.append( (self.key, (self.start, end - self.start)) )
+
+    def copy_to( self, out ):
+        # Sort by key only, in a stable manner, so that json.load()'s behavior of letting the last
+        # of several members with the same key win can be emulated
+        members = self.members
+        members.sort( key=lambda member: member[ 0 ] )
+        append = out.append
+        append( '{' )
+        first = True
+        last = len( members ) - 1
+        for i, (key, value) in enumerate( members ):
+            if i < last and members[ i + 1 ][ 0 ] == key:
+                continue
+            if first:
+                first = False
+            else:
+                append( ',' )
+            append( key )
+            append( ':' )
+            if self.spool is None:
+                append( value )
+                out.size += len( value )
+            else:
+                out.flush( )
+                offset, length = value
+                self.spool.seek( offset )
+                while length:
+                    b = self.spool.read( min( length, 1024 * 1024 ) )
+                    out.write( b )
+                    length -= len( b )
+        append( '}' )
+        if self.spool is not None:
+            self.spool.close( )
+
+
+class _Tokenizer( object ):
+    """
+    Splits a JSON document into (kind, value) tuples where kind is 's' for strings, 'v' for all
+    other scalar values, or one of the characters {}[]:, with a value of None.
+    """
+
+    _token_re = re.compile( r"""
+        [ \t\n\r]*
+        (?:
+            ([{}\[\]:,])
+            | (-?(?:0|[1-9]\d*))(\.\d+)?([eE][-+]?\d+)?
+            | (")
+            | (true|false|null|NaN|Infinity|-Infinity)
+        )""", re.VERBOSE )
+    _whitespace_re = re.compile( r'[ \t\n\r]*' )
+    _number_chars_re = re.compile( r'[-+0-9.eE]*' )
+    _literals = { 'true': True, 'false': False, 'null': None,
+                  'NaN': float( 'nan' ), 'Infinity': float( 'inf' ), '-Infinity': float( '-inf' ) }
+
+    # Unless the end of the file was reached, the buffer is refilled whenever fewer characters
+    # than this remain, so that literals and most numbers are never split
+    _margin = 64
+
+    def __init__( self, f, bufsize ):
+        self.read = f.read
+        self.bufsize = bufsize
+        self.decode = None
+        self.buf = ''
+        self.eof = False
+        # The number of characters that were consumed before the start of self.buf
+        self.consumed = 0
+        # The position of the most recent token in self.buf, or of the end of the document
+        self.start = 0
+
+    @property
+    def offset( self ):
+        """
+        The position of the most recent token in the document, or of the end of the document
+        """
+        return self.consumed + self.start
+
+    def _refill( self, pos ):
+        """
+        Discard the first pos characters of the buffer and append more characters to it. Reads at
+        least as many characters as the buffer holds, so that long strings don't take quadratic
+        time to be scanned.
+        """
+        data = self.read( max( self.bufsize, len( self.buf ) - pos ) )
+        if self.decode is None:
+            self.decode = codecs.getincrementaldecoder( 'utf-8' )( ).decode if isinstance(
+                data, bytes ) else lambda data, final=False: data
+        if not data:
+            self.eof = True
+        self.consumed += pos
+        self.start -= pos
+        self.buf = self.buf[ pos: ] + self.decode( data, final=self.eof )
+
+    def tokens( self ):
+        scanstring = json.decoder.scanstring
+        match_token = self._token_re.match
+        literals = self._literals
+        margin = self._margin
+        pos = 0
         while True:
-            item = next( items )
-            hash_obj.update( ','.encode('utf-8') )
-            hash_json( hash_obj, item )
-    except StopIteration:
-        pass
-    hash_obj.update( ']'.encode('utf-8') )
+            buf = self.buf
+            if len( buf ) - pos < margin and not self.eof:
+                self._refill( pos )
+                pos = 0
+                continue
+            m = match_token( buf, pos )
+            if m is None:
+                pos = self._whitespace_re.match( buf, pos ).end( )
+                self.start = pos
+                if pos < len( buf ):
+                    raise ValueError( "Not a valid JSON document, unexpected '%s' at "
+                                      "character %i" % (buf[ pos ], self.offset) )
+                elif self.eof:
+                    return
+                else:
+                    continue
+            punctuation, integer, frac, exp, quote, literal = m.groups( )
+            if punctuation is not None:
+                pos = m.end( )
+                self.start = pos - 1
+                yield punctuation, None
+            elif integer is not None:
+                end = m.end( )
+                if (not self.eof and end + margin > len( buf )
+                    and self._number_chars_re.match( buf, end ).end( ) == len( buf )):
+                    # The number may continue beyond the end of the buffer
+                    self._refill( pos )
+                    pos = 0
+                    continue
+                self.start = m.start( 2 )
+                pos = end
+                yield 'v', float( buf[ self.start:end ] ) if frac or exp else int( integer )
+            elif quote is not None:
+                self.start = m.start( 5 )
+                try:
+                    s, end = scanstring( buf, self.start + 1, True )
+                except ValueError as e:
+                    # Either the string or one of its escape sequences may be incomplete
+                    if not self.eof and (str( e ).startswith( 'Unterminated string' )
+                                         or getattr( e, 'pos', 0 ) >= len( buf ) - 6):
+                        self._refill( pos )
+                        pos = 0
+                        continue
+                    raise ValueError( 'Not a valid JSON document, %s' % e )
+                pos = end
+                yield 's', s
+            else:
+                self.start = m.start( 6 )
+                pos = m.end( )
+                yield 'v', literals[ literal ]
+
+
+def hash_json_merkle( hash_obj, value, cache=None, pool=None, chunks=64 ):
+    """
+    Compute a Merkle tree hash of a parsed JSON value using the given hash object. Every JSON
+    object and array in the value is hashed separately, with a new hash object of the same
+    algorithm, and the digest of each such child is hashed in place of the child's contents
+    when its parent is hashed. Strings, numbers and booleans are hashed inline. The hash of the
+    value itself is computed using the given hash object.
+
+    The resulting digests differ from those computed by hash_json() but they are equally
+    insensitive to the order of the members of JSON objects. The children of the given value
+    can be hashed in parallel and, for a value that changes over time, the digests of unchanged
+    children can be reused.
+
+    :param hash_obj: one of the Hash objects in hashlib or any other object whose name attribute
+           is accepted by hashlib.new()
+
+    :param value: the value to be hashed, see hash_json()
+
+    :param MerkleCache cache: a cache of the digests of the objects and arrays in the value, as
+           populated by a previous invocation for the same value. Every JSON object or array in
+           the value whose digest is cached will not be hashed again. The caller must invalidate
+           the cache for every part of the value that changed since that previous invocation.
+
+    :param pool: an object with a map( function, iterable ) method like a multiprocessing.Pool
+           or a concurrent.futures.Executor. If given, the children of the value that are
+           objects or arrays will be hashed using the pool, with the children split into the
+           given number of chunks of consecutive children. The children must be picklable if
+           the pool uses multiple processes.
+
+    >>> def actual(x, **kwargs):
+    ...     h = hashlib.sha1(); hash_json_merkle(h, x, **kwargs); return h.hexdigest()
+    >>> actual({'a': [1, 2], 'b': True}) == actual({'b': True, 'a': [1, 2]})
+    True
+    >>> actual(['a', 'b']) == actual(['ab']), actual([[1]]) == actual([1])
+    (False, False)
+
+    >>> value = {'a': [1, {'b': 2}], 'c': [3]}
+    >>> cache = MerkleCache( )
+    >>> digest = actual(value, cache=cache)
+    >>> value['a'][1]['b'] = 4
+    >>> cache.invalidate(('a', 1, 'b'))
+    >>> actual(value, cache=cache) == actual(value) != digest
+    True
+    """
+    name = hash_obj.name
+    node = None if cache is None else cache.root
+    members = _merkle_members( value )
+    if members is None:
+        hash_obj.update( _merkle_scalar( value ) )
+    elif pool is None:
+        _merkle( members, hash_obj, node )
+    else:
+        _merkle_parallel( name, members, hash_obj, node, pool, chunks )
+
+
+class MerkleCache( object ):
+    """
+    The digests of the JSON objects and arrays in a value, as computed by hash_json_merkle(), in
+    a tree mirroring the value.
+    """
+
+    def __init__( self ):
+        self.root = _MerkleNode( )
+
+    def invalidate( self, path=( ) ):
+        """
+        Drop the digests of the object or array at the given path, of everything inside it, and
+        of everything enclosing it. This must be called for the path of each part of the value
+        that was modified, added or removed.
+
+        :param path: a sequence of object keys and array indices leading from the root of the
+               value to the modified part
+        """
+        node = self.root
+        node.digest = None
+        path = tuple( path )
+        if not path:
+            node.children.clear( )
+        for i, key in enumerate( path ):
+            child = node.children.get( key )
+            if child is None:
+                break
+            elif i == len( path ) - 1:
+                del node.children[ key ]
+            else:
+                child.digest = None
+                node = child
+
+
+class _MerkleNode( object ):
+    __slots__ = ('digest', 'children')
+
+    def __init__( self ):
+        self.digest = None
+        self.children = { }
+
 
+_merkle_length = struct.Struct( '>Q' ).pack
 
-def _hash_hashable( hash_obj, items ):
-    items = iter( sorted( items ) )
-    hash_obj.update( '{'.encode('utf-8') )
+# Types that can be recognized as strings, numbers and booleans without trying to iterate over them
+_scalar_types = frozenset( (str, int, float, bool) )
+
+
+def _merkle_members( value ):
+    """
+    Return None if the given value is a string, number, boolean or binary leaf, otherwise return
+    a tuple of the opening bracket of the value and an iterator over (key, child) tuples, where
+    the key is the object key of the child or its index in the array.
+    """
     try:
-        item = next( items )
-        _hash_hashable_item( hash_obj, item )
-        while True:
-            item = next( items )
-            hash_obj.update( ','.encode('utf-8') )
-            _hash_hashable_item( hash_obj, item )
-    except StopIteration:
-        pass
-    hash_obj.update( '}'.encode('utf-8') )
-
-
-def _hash_hashable_item( hash_obj, k_v ):
-    (k, v) = k_v
-    if isinstance( k, basestring ):
-        hash_obj.update( k.encode('utf-8') )
-        hash_obj.update( ':'.encode('utf-8') )
-        hash_json( hash_obj, v )
+        items = value.items( )
+    except AttributeError:
+        # Must check for string before testing iterability since strings are iterable
+        if isinstance( value, str ) or _is_numpy_scalar( value ) or _is_binary( value ):
+            return None
+        try:
+            return b'[', enumerate( value )
+        except TypeError:
+            return None
     else:
-        raise ValueError( 'Dictionary keys must be strings, not type "%s".' % type( k ).__name__ )
+        return b'{', iter( sorted( items ) )
+
+
+def _merkle_scalar( value ):
+    """
+    Return the serialization of the given string, number, boolean or binary leaf.
+    """
+    if _is_numpy_scalar( value ):
+        value = value.item( )
+    # We must check for bool first since it is subclass of int (wrongly, IMHO)
+    if isinstance( value, str ):
+        s = '"' + value + '"'
+    elif isinstance( value, bool ):
+        s = 'true' if value else 'false'
+    elif isinstance( value, (int, float) ):
+        s = str( value )
+    elif _is_binary( value ):
+        prefix, buf = _binary_leaf( value )
+        b = b''.join( (prefix.encode( 'utf-8' ), buf) )
+        return b'=' + _merkle_length( len( b ) ) + b
+    else:
+        raise ValueError( 'Type "%s" is not supported.' % type( value ).__name__ )
+    b = s.encode( 'utf-8' )
+    return b'=' + _merkle_length( len( b ) ) + b
+
+
+def _merkle( members, hash_obj, node, children=None ):
+    """
+    Hash the object or array with the given members into the given hash object. If a cache node
+    is given, reuse the digests of the object's or array's children that are cached in it and
+    cache the digests of the ones that aren't.
+
+    :param children: a dictionary mapping the keys of some of the children to the digests of
+           those children, as computed in advance, or None
+    """
+    # Copying a pristine hash object is cheaper than looking up the algorithm by name
+    new_hash = hashlib.new( hash_obj.name ).copy
+    bracket, iterator = members
+    root_parts = [ bracket ]
+    # One entry per object or array being hashed: the parts of its serialization that weren't
+    # hashed yet, an iterator over its remaining members, whether it is an object, and the node
+    # caching the digests of its children, or None
+    stack = [ (root_parts, iterator, bracket == b'{', node) ]
+    while stack:
+        parts, iterator, is_object, node = stack[ -1 ]
+        append = parts.append
+        for key, child in iterator:
+            if is_object:
+                if not isinstance( key, str ):
+                    raise ValueError( 'Dictionary keys must be strings, not type "%s".' %
+                                      type( key ).__name__ )
+                b = key.encode( 'utf-8' )
+                append( _merkle_length( len( b ) ) )
+                append( b )
+            if parts is root_parts:
+                if children is not None and key in children:
+                    append( b'#' + children[ key ] )
+                    continue
+                if len( parts ) > _max_parts:
+                    hash_obj.update( b''.join( parts ) )
+                    del parts[ : ]
+            child_node = None
+            if node is not None:
+                child_node = node.children.get( key )
+                # A cached digest implies that the child is an object or array
+                if child_node is not None and child_node.digest is not None:
+                    append( b'#' + child_node.digest )
+                    continue
+            if type( child ) in _scalar_types:
+                append( _merkle_scalar( child ) )
+                continue
+            members = _merkle_members( child )
+            if members is None:
+                append( _merkle_scalar( child ) )
+                continue
+            if node is not None and child_node is None:
+                child_node = node.children[ key ] = _MerkleNode( )
+            bracket, child_iterator = members
+            stack.append( ([ bracket ], child_iterator, bracket == b'{', child_node) )
+            break
+        else:
+            stack.pop( )
+            if stack:
+                h = new_hash( )
+                h.update( b''.join( parts ) )
+                digest = h.digest( )
+                if node is not None:
+                    node.digest = digest
+                stack[ -1 ][ 0 ].append( b'#' + digest )
+            else:
+                hash_obj.update( b''.join( parts ) )
+
+
+def _merkle_parallel( name, members, hash_obj, node, pool, chunks ):
+    """
+    Like _merkle() but hash the children of the object or array with the given members that are
+    objects or arrays themselves using the given pool.
+    """
+    bracket, iterator = members
+    members = list( iterator )
+    # The keys and values of the children that need to be hashed
+    keys, values = [ ], [ ]
+    for key, child in members:
+        if _merkle_members( child ) is not None:
+            child_node = None if node is None else node.children.get( key )
+            if child_node is None or child_node.digest is None:
+                keys.append( key )
+                values.append( child )
+    size = -(-len( values ) // chunks)
+    tasks = [ (name, values[ i:i + size ], node is not None)
+        for i in range( 0, len( values ), size or 1 ) ]
+    children = { }
+    results = (result for chunk in pool.map( _merkle_chunk, tasks ) for result in chunk)
+    for key, (digest, child_node) in zip( keys, results ):
+        children[ key ] = digest
+        if node is not None:
+            node.children[ key ] = child_node
+    _merkle( (bracket, iter( members )), hash_obj, node, children )
+
+
+def _merkle_chunk( task ):
+    """
+    Return a (digest, cache node) tuple for each of the given objects or arrays. Runs in a pool.
+    """
+    name, values, caching = task
+    results = [ ]
+    for value in values:
+        h = hashlib.new( name )
+        node = _MerkleNode( ) if caching else None
+        _merkle( _merkle_members( value ), h, node )
+        digest = h.digest( )
+        if node is not None:
+            node.digest = digest
+        results.append( (digest, node) )
+    return results
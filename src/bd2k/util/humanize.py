@@ -10,8 +10,11 @@ License: MIT
 """
 from __future__ import division
 
+import re
+import sys
+from bisect import bisect_right
+
 # see: http://goo.gl/kTQMs
-from past.utils import old_div
 SYMBOLS = {
     'customary'     : ('', 'K', 'M', 'G', 'T', 'P', 'E', 'Z', 'Y'),
     'customary_ext' : ('byte', 'kilo', 'mega', 'giga', 'tera', 'peta', 'exa',
@@ -19,12 +22,29 @@ SYMBOLS = {
     'iec'           : ('Bi', 'Ki', 'Mi', 'Gi', 'Ti', 'Pi', 'Ei', 'Zi', 'Yi'),
     'iec_ext'       : ('byte', 'kibi', 'mebi', 'gibi', 'tebi', 'pebi', 'exbi',
                        'zebi', 'yobi'),
+    # SI prefixes are decimal, all others are binary
+    'si'            : ('B', 'kB', 'MB', 'GB', 'TB', 'PB', 'EB', 'ZB', 'YB'),
 }
 
+# For each set of symbols, the number of bytes each symbol stands for, in ascending order
+PREFIXES = dict((symbols, tuple((1000 if symbols == 'si' else 1024) ** i
+                                for i in range(len(sset))))
+                for symbols, sset in SYMBOLS.items())
+
+# The number of bytes each symbol in any of the sets stands for. If a symbol occurs in more than
+# one set, the first set wins, in the order above, except for the SI symbols, which are checked
+# last. 'k' is an alias for 'K' as per: http://goo.gl/kTQMs
+MULTIPLIERS = {'k': 1024}
+for _symbols in ('customary', 'customary_ext', 'iec', 'iec_ext', 'si'):
+    for _symbol, _prefix in zip(SYMBOLS[_symbols], PREFIXES[_symbols]):
+        MULTIPLIERS.setdefault(_symbol, _prefix)
+del _symbols, _symbol, _prefix
+
 def bytes2human(n, fmt='%(value).1f %(symbol)s', symbols='customary'):
     """
     Convert n bytes into a human readable string based on format.
-    symbols can be either "customary", "customary_ext", "iec" or "iec_ext",
+    symbols can be either "customary", "customary_ext", "iec", "iec_ext" or
+    "si", the latter using decimal instead of binary prefixes,
     see: http://goo.gl/kTQMs
 
       >>> bytes2human(0)
@@ -50,6 +70,10 @@ def bytes2human(n, fmt='%(value).1f %(symbol)s', symbols='customary'):
       '9.6 Ki'
       >>> bytes2human(9856, symbols="iec_ext")
       '9.6 kibi'
+      >>> bytes2human(9856, symbols="si")
+      '9.9 kB'
+      >>> bytes2human(999, symbols="si")
+      '999.0 B'
 
       >>> bytes2human(10000, "%(value).1f %(symbol)s/sec")
       '9.8 K/sec'
@@ -61,15 +85,56 @@ def bytes2human(n, fmt='%(value).1f %(symbol)s', symbols='customary'):
     n = int(n)
     if n < 0:
         raise ValueError("n < 0")
-    symbols = SYMBOLS[symbols]
-    prefix = {}
-    for i, s in enumerate(symbols[1:]):
-        prefix[s] = 1 << (i+1)*10
-    for symbol in reversed(symbols[1:]):
-        if n >= prefix[symbol]:
-            value = old_div(float(n), prefix[symbol])
-            return fmt % locals()
-    return fmt % dict(symbol=symbols[0], value=n)
+    prefixes = PREFIXES[symbols]
+    i = max(bisect_right(prefixes, n) - 1, 0)
+    value = float(n) / prefixes[i] if i else n
+    return fmt % {'n': n, 'symbol': SYMBOLS[symbols][i], 'value': value}
+
+def bytes2human_many(ns, fmt='%(value).1f %(symbol)s', symbols='customary'):
+    """
+    Convert each of the given numbers of bytes like bytes2human() does.
+    Returns a list of strings or, if ns is a NumPy array, an array of
+    strings of the same shape. The scaling of integer arrays is vectorized.
+
+      >>> bytes2human_many([0, 1024, 1536, 10 ** 6], symbols="si")
+      ['0.0 B', '1.0 kB', '1.5 kB', '1.0 MB']
+    """
+    numpy = sys.modules.get('numpy')
+    if numpy is None or not isinstance(ns, numpy.ndarray):
+        return _bytes2human_many(ns, fmt, symbols)
+    shape, ns = ns.shape, ns.ravel()
+    if ns.dtype.kind not in 'iu':
+        return numpy.array(_bytes2human_many(ns.tolist(), fmt, symbols)).reshape(shape)
+    if ns.size and ns.min() < 0:
+        raise ValueError("n < 0")
+    # The prefixes beyond the range of the array's dtype are irrelevant
+    prefixes = [p for p in PREFIXES[symbols] if p <= numpy.iinfo(ns.dtype).max]
+    indices = numpy.searchsorted(numpy.array(prefixes, dtype=ns.dtype), ns,
+                                 side='right')
+    indices = numpy.maximum(indices - 1, 0)
+    values = ns / numpy.array(prefixes, dtype=ns.dtype)[indices]
+    sset = SYMBOLS[symbols]
+    return numpy.array([fmt % {'n': n, 'symbol': sset[i], 'value': value if i else n}
+                        for n, i, value in zip(ns.tolist(), indices.tolist(),
+                                               values.tolist())]).reshape(shape)
+
+def _bytes2human_many(ns, fmt, symbols):
+    prefixes, sset = PREFIXES[symbols], SYMBOLS[symbols]
+    strings = []
+    append = strings.append
+    for n in ns:
+        n = int(n)
+        if n < 0:
+            raise ValueError("n < 0")
+        i = bisect_right(prefixes, n) - 1
+        if i > 0:
+            append(fmt % {'n': n, 'symbol': sset[i], 'value': float(n) / prefixes[i]})
+        else:
+            append(fmt % {'n': n, 'symbol': sset[0], 'value': n})
+    return strings
+
+# Splits a size into the number and the symbol
+_size_re = re.compile(r'([\d.]*)(.*)', re.DOTALL)
 
 def human2bytes(s):
     """
@@ -100,32 +165,37 @@ def human2bytes(s):
       1
       >>> human2bytes('1 k')  # k is an alias for K
       1024
+      >>> human2bytes('1 kB')  # but kB is decimal
+      1000
+      >>> human2bytes('1.5 GB')
+      1500000000
       >>> human2bytes('12 foo')
       Traceback (most recent call last):
           ...
       ValueError: can't interpret '12 foo'
     """
-    init = s
-    num = ""
-    while s and s[0:1].isdigit() or s[0:1] == '.':
-        num += s[0]
-        s = s[1:]
+    num, letter = _size_re.match(s).groups()
     num = float(num)
-    letter = s.strip()
-    for name, sset in list(SYMBOLS.items()):
-        if letter in sset:
-            break
+    try:
+        return int(num * MULTIPLIERS[letter.strip()])
+    except KeyError:
+        raise ValueError("can't interpret %r" % s)
+
+def human2bytes_many(strings):
+    """
+    Convert each of the given strings like human2bytes() does. Returns a
+    list of integers or, if strings is a NumPy array, an array of them of
+    the same shape.
+
+      >>> human2bytes_many(['1 K', '1 kB', '2MB', '1.5 Mi'])
+      [1024, 1000, 2000000, 1572864]
+    """
+    numpy = sys.modules.get('numpy')
+    if numpy is None or not isinstance(strings, numpy.ndarray):
+        return [human2bytes(s) for s in strings]
     else:
-        if letter == 'k':
-            # treat 'k' as an alias for 'K' as per: http://goo.gl/kTQMs
-            sset = SYMBOLS['customary']
-            letter = letter.upper()
-        else:
-            raise ValueError("can't interpret %r" % init)
-    prefix = {sset[0]:1}
-    for i, s in enumerate(sset[1:]):
-        prefix[s] = 1 << (i+1)*10
-    return int(num * prefix[letter])
+        return numpy.array([human2bytes(s) for s in strings.ravel().tolist()]
+                           ).reshape(strings.shape)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,294 @@
+"""
+Order-preserving encoding of keys, i.e. of None, integers, floats, byte strings, text strings
+and tuples thereof, into byte strings and, via D64 or D32, into text. For keys a and b of the
+same shape, a < b if and only if pack( a ) < pack( b ), and therefore if and only if
+encode( a ) < encode( b ). This makes the encodings suitable as keys in stores that order keys
+lexicographically, like S3 or a sorted directory listing.
+
+The encoding is that of the tuple layer of FoundationDB. Each element starts with a code for its
+type, and all integers sort before all floats, for example. Values of different types therefore
+sort by type, not by value, even if they are comparable in Python, like 1 and 1.5 are. Also, -0.0
+sorts before 0.0 and the NaNs sort after infinity. Booleans are encoded as the integers 0 and 1.
+
+>>> keys = [ (1, 'b'), (-1,), (1, 'a', 2.5), (), (1,), (2 ** 70, '') ]
+>>> sorted( keys ) == sorted( keys, key=pack )
+True
+>>> encode( (1, 'a', 2.5) )  # doctest: +ALLOW_UNICODE
+'4F31NF.Wk.F........'
+>>> decode( '4F31NF.Wk.F........' )
+(1, 'a', 2.5)
+
+For keys consisting of a single integer that fits in a given number of bytes, pack_int() is the
+faster alternative. It handles signed integers, too:
+
+>>> unpack_int( pack_int( 42 ) )
+42
+>>> pack_int( -1, signed=True ) < pack_int( 0, signed=True )
+True
+"""
+from __future__ import absolute_import
+
+import struct
+from builtins import bytes
+from builtins import int
+from builtins import range
+from builtins import str
+
+from bd2k.util.d64 import standard as d64
+
+_null = 0x00
+_bytes = 0x01
+_str = 0x02
+_nested = 0x05
+_int_zero = 0x14
+_neg_int_start = 0x0b
+_pos_int_end = 0x1d
+_double = 0x21
+
+_double_struct = struct.Struct( '>d' )
+_uint64_struct = struct.Struct( '>Q' )
+
+# Complement masks for negative integers, by number of bytes
+_size_limits = [ (1 << (i * 8)) - 1 for i in range( 9 ) ]
+
+# The type codes of integers of up to eight bytes, negative ones first
+_int_codes = [ bytes( bytearray( [ _int_zero + i ] ) ) for i in range( -8, 9 ) ]
+
+
+def pack( key ):
+    """
+    Return the order-preserving byte string representation of the given key. If the key is a
+    tuple, its elements are encoded one after the other, otherwise the key is treated like a tuple
+    with the key as its only element.
+
+    >>> pack( ( 'a', 1 ) )  # doctest: +ALLOW_BYTES
+    b'\\x02a\\x00\\x15\\x01'
+    >>> pack( 'a' ) == pack( ( 'a', ) )
+    True
+    >>> pack( [ 1 ] )
+    Traceback (most recent call last):
+    ...
+    ValueError: Unsupported type of key element: <class 'list'>
+    """
+    parts = [ ]
+    if isinstance( key, tuple ):
+        for element in key:
+            _pack( element, parts, False )
+    else:
+        _pack( key, parts, False )
+    return b''.join( parts )
+
+
+def unpack( b ):
+    """
+    The inverse of pack(), always returning a tuple.
+
+    >>> unpack( pack( ( None, b'\\0', '\\0', -1, 1.5, ( None, ( ), 'x' ) ) ) )  # doctest: +ALLOW_BYTES
+    (None, b'\\x00', '\\x00', -1, 1.5, (None, (), 'x'))
+    >>> unpack( b'\\x02a' )
+    Traceback (most recent call last):
+    ...
+    ValueError: Not a valid packed key
+    """
+    b = bytes( b )
+    elements = [ ]
+    i, n = 0, len( b )
+    try:
+        while i < n:
+            element, i = _unpack( b, i, False )
+            elements.append( element )
+    except (IndexError, ValueError, struct.error):
+        raise ValueError( 'Not a valid packed key' )
+    if i != n:
+        raise ValueError( 'Not a valid packed key' )
+    return tuple( elements )
+
+
+def encode( key, codec=d64 ):
+    """
+    Return the order-preserving text representation of the given key, using the given
+    binary-to-text codec, bd2k.util.d64.standard by default or bd2k.util.d32.standard.
+
+    >>> from bd2k.util.d32 import standard as d32
+    >>> encode( -1, codec=d32 )  # doctest: +ALLOW_UNICODE
+    '4jz2'
+    >>> encode( -1, codec=d32 ) < encode( 0, codec=d32 ) < encode( 1, codec=d32 )
+    True
+    """
+    return codec.encode( pack( key ) )
+
+
+def decode( s, codec=d64 ):
+    """
+    The inverse of encode().
+    """
+    return unpack( codec.decode( s ) )
+
+
+def pack_int( n, size=8, signed=False ):
+    """
+    Return the order-preserving representation of the given integer as a byte string of the
+    given length. This is much faster than pack() but the representations are not compatible
+    with those returned by pack().
+
+    :param int size: the length of the representation in bytes
+
+    :param bool signed: if False, the integer must be non-negative. If True, the integer may be
+           negative and is represented in offset binary, i.e. as the unsigned integer n + 2 **
+           (8 * size - 1), so that it must fit in the given number of bytes as a two's complement.
+           The representations of signed and unsigned integers are not compatible either.
+
+    >>> pack_int( 1 )  # doctest: +ALLOW_BYTES
+    b'\\x00\\x00\\x00\\x00\\x00\\x00\\x00\\x01'
+    >>> pack_int( 1, size=2 )  # doctest: +ALLOW_BYTES
+    b'\\x00\\x01'
+    >>> pack_int( -1, size=2, signed=True )  # doctest: +ALLOW_BYTES
+    b'\\x7f\\xff'
+    >>> pack_int( -1 )
+    Traceback (most recent call last):
+    ...
+    ValueError: Integer must be non-negative and fit in 8 bytes: -1
+    >>> pack_int( 128, size=1, signed=True )
+    Traceback (most recent call last):
+    ...
+    ValueError: Integer must fit in 1 bytes as a signed integer: 128
+    """
+    if signed:
+        offset = n + (1 << (size * 8 - 1))
+        try:
+            if size == 8:
+                return _uint64_struct.pack( offset )
+            elif offset >= 0:
+                return offset.to_bytes( size, 'big' )
+        except (struct.error, OverflowError):
+            pass
+        raise ValueError( 'Integer must fit in %i bytes as a signed integer: %i' % (size, n) )
+    try:
+        if size == 8:
+            return _uint64_struct.pack( n )
+        elif n >= 0:
+            return n.to_bytes( size, 'big' )
+    except (struct.error, OverflowError):
+        pass
+    raise ValueError( 'Integer must be non-negative and fit in %i bytes: %i' % (size, n) )
+
+
+def unpack_int( b, signed=False ):
+    """
+    The inverse of pack_int().
+    """
+    if len( b ) == 8:
+        n = _uint64_struct.unpack( b )[ 0 ]
+    else:
+        n = int.from_bytes( b, 'big' )
+    if signed:
+        n -= 1 << (len( b ) * 8 - 1)
+    return n
+
+
+def _pack( value, parts, nested ):
+    append = parts.append
+    if value is None:
+        append( b'\x00\xff' if nested else b'\x00' )
+    elif isinstance( value, int ):
+        # This includes bool
+        size = (abs( value ).bit_length( ) + 7) // 8
+        if size <= 8:
+            if value >= 0:
+                append( _int_codes[ 8 + size ] )
+                append( value.to_bytes( size, 'big' ) )
+            else:
+                append( _int_codes[ 8 - size ] )
+                append( (_size_limits[ size ] + value).to_bytes( size, 'big' ) )
+        elif value > 0:
+            append( bytes( bytearray( [ _pos_int_end, size ] ) ) )
+            append( value.to_bytes( size, 'big' ) )
+        else:
+            append( bytes( bytearray( [ _neg_int_start, size ^ 0xff ] ) ) )
+            append( ((1 << size * 8) - 1 + value).to_bytes( size, 'big' ) )
+    elif isinstance( value, float ):
+        b = bytearray( _double_struct.pack( value ) )
+        if b[ 0 ] & 0x80:
+            b = bytearray( x ^ 0xff for x in b )
+        else:
+            b[ 0 ] ^= 0x80
+        append( b'\x21' )
+        append( bytes( b ) )
+    elif isinstance( value, str ):
+        append( b'\x02' )
+        append( value.encode( 'utf-8' ).replace( b'\x00', b'\x00\xff' ) )
+        append( b'\x00' )
+    elif isinstance( value, (bytes, bytearray) ):
+        append( b'\x01' )
+        append( bytes( value ).replace( b'\x00', b'\x00\xff' ) )
+        append( b'\x00' )
+    elif isinstance( value, tuple ):
+        append( b'\x05' )
+        for element in value:
+            _pack( element, parts, True )
+        append( b'\x00' )
+    else:
+        raise ValueError( 'Unsupported type of key element: %s' % type( value ) )
+
+
+def _find_terminator( b, i ):
+    """
+    Return the index of the first unescaped null byte in b at or after index i.
+    """
+    while True:
+        i = b.index( b'\x00', i )
+        if b[ i + 1:i + 2 ] == b'\xff':
+            i += 2
+        else:
+            return i
+
+
+def _unpack( b, i, nested ):
+    code = b[ i ]
+    i += 1
+    if code == _null:
+        if nested:
+            if b[ i ] != 0xff:
+                raise IndexError( )
+            i += 1
+        return None, i
+    elif code == _bytes or code == _str:
+        end = _find_terminator( b, i )
+        value = b[ i:end ].replace( b'\x00\xff', b'\x00' )
+        return (value.decode( 'utf-8' ) if code == _str else value), end + 1
+    elif _neg_int_start < code < _pos_int_end:
+        size = code - _int_zero
+        if size >= 0:
+            value = int.from_bytes( b[ i:i + size ], 'big' )
+        else:
+            size = -size
+            value = int.from_bytes( b[ i:i + size ], 'big' ) - _size_limits[ size ]
+        if i + size > len( b ):
+            raise IndexError( )
+        return value, i + size
+    elif code == _pos_int_end or code == _neg_int_start:
+        size = b[ i ]
+        i += 1
+        if code == _pos_int_end:
+            value = int.from_bytes( b[ i:i + size ], 'big' )
+        else:
+            size ^= 0xff
+            value = int.from_bytes( b[ i:i + size ], 'big' ) - (1 << size * 8) + 1
+        if i + size > len( b ):
+            raise IndexError( )
+        return value, i + size
+    elif code == _double:
+        d = bytearray( b[ i:i + 8 ] )
+        if d[ 0 ] & 0x80:
+            d[ 0 ] ^= 0x80
+        else:
+            d = bytearray( x ^ 0xff for x in d )
+        return _double_struct.unpack( bytes( d ) )[ 0 ], i + 8
+    elif code == _nested:
+        elements = [ ]
+        while b[ i ] != 0x00 or b[ i + 1:i + 2 ] == b'\xff':
+            element, i = _unpack( b, i, True )
+            elements.append( element )
+        return tuple( elements ), i + 1
+    else:
+        raise IndexError( )
@@ -1,6 +1,7 @@
 from __future__ import absolute_import
 from builtins import object
-from bd2k.util import sync_memoize
+import weakref
+from threading import Lock
 
 
 class abstractclassmethod( classmethod ):
@@ -97,8 +98,20 @@ class InnerClass( object ):
     Caveat: Within the inner class, self.__class__ will not be the inner class but a dynamically
     created subclass thereof. It's name will be the same as that of the inner class,
     but its __module__ will be different. There will be one such dynamic subclass per inner class
-    and instance of outer class, if that outer class instance created any instances of inner the
-    class.
+    and instance of outer class at a time, if that outer class instance created any instances of
+    inner the class.
+
+    The dynamic subclasses are cached in the decorator, not in the outer instance, so binding an
+    inner class doesn't change the outer instance's __dict__, and a copy of an outer instance
+    gets its own subclasses. The cache only references the outer instances and the subclasses
+    weakly. An outer instance is kept alive by the instances of its subclasses, via their outer
+    attribute, but not by the cache. Outer instances must be weakly referenceable.
+
+    Since a dynamic subclass refers to its outer instance, caching it strongly would keep the
+    outer instance alive. Once nothing references a dynamic subclass anymore, neither an
+    instance of it nor a variable, it is therefore discarded, and the next access to the inner
+    class via the outer instance creates a new subclass. Don't set attributes on a dynamic
+    subclass, set them on the inner class or on the instances instead.
 
     >>> class Outer(object):
     ...     def new_inner(self):
@@ -179,11 +192,23 @@ class InnerClass( object ):
 
     >>> o.Inner.new_inner().outer == o
     True
+
+    The dynamic subclass lives as long as it is referenced:
+
+    >>> import gc
+    >>> inner = o.new_inner()
+    >>> _ = gc.collect()
+    >>> o.Inner is inner.__class__
+    True
     """
 
     def __init__( self, inner_class ):
         super( InnerClass, self ).__init__( )
         self.inner_class = inner_class
+        # Maps the id() of each outer instance to a weak reference to that instance and a weak
+        # reference to the inner class bound to it. The outer instance needn't be hashable.
+        self.bound = { }
+        self.lock = Lock( )
 
     # noinspection PyUnusedLocal
     def __get__( self, instance, owner ):
@@ -191,18 +216,48 @@ class InnerClass( object ):
         if instance is None:
             return self.inner_class
         else:
-            return self._bind( instance )
-
-    @sync_memoize
-    def _bind( self, _outer ):
-        class BoundInner( self.inner_class ):
+            key = id( instance )
+            entry = self.bound.get( key )
+            if entry is not None:
+                outer_ref, bound_ref = entry
+                if outer_ref( ) is instance:
+                    bound_class = bound_ref( )
+                    if bound_class is not None:
+                        return bound_class
+            with self.lock:
+                return self._bind_cached( instance, key )
+
+    def _bind_cached( self, outer, key ):
+        entry = self.bound.get( key )
+        if entry is not None and entry[ 0 ]( ) is outer:
+            outer_ref = entry[ 0 ]
+            bound_class = entry[ 1 ]( )
+            if bound_class is not None:
+                return bound_class
+        else:
+            bound = self.bound
+
+            def forget( ref ):
+                # The id may have been reused by then, only remove the entry for this instance
+                entry = bound.get( key )
+                if entry is not None and entry[ 0 ] is ref:
+                    bound.pop( key, None )
+
+            outer_ref = weakref.ref( outer, forget )
+        bound_class = self._bind( outer, self.inner_class )
+        self.bound[ key ] = outer_ref, weakref.ref( bound_class )
+        return bound_class
+
+    @staticmethod
+    def _bind( _outer, inner_class ):
+        class BoundInner( inner_class ):
             outer = _outer
 
             def __repr__( self ):
                 return "%s bound to %s" % (super( BoundInner, self ).__repr__( ), repr( _outer ))
 
-        BoundInner.__name__ = self.inner_class.__name__
-        BoundInner.__module__ = self.inner_class.__module__
+        BoundInner.__name__ = inner_class.__name__
+        BoundInner.__module__ = inner_class.__module__
         return BoundInner
 
     def __call__( *args, **kwargs ):
@@ -3,12 +3,22 @@ from __future__ import absolute_import
 from future import standard_library
 standard_library.install_aliases()
 from builtins import next
+from builtins import object
+from builtins import range
+import sys
 import time
 import urllib.request, urllib.error, urllib.parse
+from bisect import bisect_left
 from contextlib import contextmanager
+from threading import Lock
 
 import logging
 
+try:
+    from time import monotonic as now
+except ImportError:
+    from time import time as now
+
 log = logging.getLogger( __name__ )
 
 
@@ -17,7 +27,8 @@ def never( exception ):
     return False
 
 
-def retry( delays=(0, 1, 1, 4, 16, 64), timeout=300, predicate=never ):
+def retry( delays=(0, 1, 1, 4, 16, 64), timeout=300, predicate=never, budget=None, breaker=None,
+           observer=None, site=None ):
     """
     Retry an operation while the failure matches a given predicate and until a given timeout
     expires, waiting a given amount of time in between attempts. This function is a generator
@@ -34,6 +45,21 @@ def retry( delays=(0, 1, 1, 4, 16, 64), timeout=300, predicate=never ):
            attempt should be made to recover from the given exception. The default value for this
            parameter will prevent any retries!
 
+    :param RetryBudget budget: if given, a retry is only made if the budget, typically shared
+           with other callers, permits it
+
+    :param CircuitBreaker breaker: if given, every attempt is reported to the circuit breaker,
+           typically shared with other callers. Attempts failing with an exception that the
+           predicate accepts count as failures, all other attempts as successes. While the
+           circuit is open, attempts aren't made and CircuitOpenError is raised instead, and
+           failed attempts aren't retried.
+
+    :param RetryObserver observer: if given, the observer is notified of each attempt and of
+           the outcome of the operation, see RetryObserver and RetryMetrics
+
+    :param str site: the name of the call site to pass to the observer. The default is derived
+           from the module, function and line that iterate over the return value.
+
     :return: a generator yielding context managers, one per attempt
     :rtype: Iterator
 
@@ -87,34 +113,502 @@ def retry( delays=(0, 1, 1, 4, 16, 64), timeout=300, predicate=never ):
     >>> i
     1
     """
-    if timeout > 0:
-        go = [ None ]
+    if observer is not None and site is None:
+        site = _call_site( sys._getframe( 1 ) )
+    policy = _AttemptPolicy( delays, timeout, predicate, budget, breaker, observer, site )
+
+    @contextmanager
+    def attempt( ):
+        policy.start( )
+        try:
+            yield
+        except Exception as e:
+            delay = policy.failed( e )
+            if delay is None:
+                raise
+            log.info( 'Got %s, trying again in %is.', e, delay )
+            time.sleep( delay )
+        else:
+            policy.succeeded( )
+
+    while not policy.done:
+        yield attempt( )
+
+
+def _call_site( frame ):
+    return '%s:%s:%i' % (frame.f_globals.get( '__name__' ), frame.f_code.co_name, frame.f_lineno)
+
+
+class _AttemptPolicy( object ):
+    """
+    Decides whether and when to retry an operation and notifies the observer, if any. This is
+    the logic shared by retry() and bd2k.util.asyncio.aretry(), which only differ in how they
+    wait between attempts.
+    """
 
-        @contextmanager
-        def repeated_attempt( delay ):
+    def __init__( self, delays, timeout, predicate, budget, breaker, observer, site ):
+        super( _AttemptPolicy, self ).__init__( )
+        self.timeout = timeout
+        self.predicate = predicate
+        self.budget = budget
+        self.breaker = breaker
+        self.observer = observer
+        self.site = site
+        self.done = False
+        self.attempts = 0
+        if timeout > 0:
+            self.delays = iter( delays )
+            self.expiration = time.time( ) + timeout
+            self.delay = next( self.delays )
+        if budget is not None:
+            budget.request( )
+        if observer is not None:
+            self.started = self.attempt_started = now( )
+
+    def start( self ):
+        """
+        Invoked before each attempt
+        """
+        self.attempts += 1
+        if self.breaker is not None:
             try:
-                yield
-            except Exception as e:
-                if time.time( ) + delay < expiration and predicate( e ):
-                    log.info( 'Got %s, trying again in %is.', e, delay )
-                    time.sleep( delay )
-                else:
-                    raise
+                self.breaker.before( )
+            except CircuitOpenError as e:
+                self.done = True
+                if self.observer is not None:
+                    self.observer.gave_up( self.site, self.attempts - 1, e, 'circuit_open',
+                                           now( ) - self.started )
+                raise
+        if self.observer is not None:
+            self.attempt_started = now( )
+            self.observer.attempt_started( self.site, self.attempts )
+
+    def succeeded( self ):
+        """
+        Invoked after a successful attempt
+        """
+        self.done = True
+        if self.breaker is not None:
+            self.breaker.success( )
+        if self.observer is not None:
+            t = now( )
+            self.observer.succeeded( self.site, self.attempts, t - self.attempt_started,
+                                     t - self.started )
+
+    def failed( self, e ):
+        """
+        Invoked after a failed attempt. Return the time to wait before the next attempt or None
+        if the operation should not be retried.
+        """
+        if self.observer is not None:
+            t = now( )
+            self.observer.attempt_failed( self.site, self.attempts, e, t - self.attempt_started )
+        reason = None
+        if self.timeout > 0:
+            delay = self.delay
+            self.delay = next( self.delays, delay )
+            if time.time( ) + delay >= self.expiration:
+                reason = 'timeout'
+            elif not self.predicate( e ):
+                reason = 'unretryable'
+        else:
+            delay, reason = None, 'timeout'
+        if self.breaker is not None:
+            if reason is None or reason == 'timeout' and self.predicate( e ):
+                self.breaker.failure( )
             else:
-                go.pop( )
-
-        delays = iter( delays )
-        expiration = time.time( ) + timeout
-        delay = next( delays )
-        while go:
-            yield repeated_attempt( delay )
-            delay = next( delays, delay )
-    else:
-        @contextmanager
-        def single_attempt( ):
-            yield
+                self.breaker.success( )
+        if reason is None:
+            if self.breaker is not None and not self.breaker.closed( ):
+                reason = 'circuit_open'
+            elif self.budget is not None and not self.budget.withdraw( ):
+                reason = 'budget'
+        if reason is None:
+            return delay
+        else:
+            self.done = True
+            if self.observer is not None:
+                self.observer.gave_up( self.site, self.attempts, e, reason, t - self.started )
+            return None
+
+
+class RetryObserver( object ):
+    """
+    The interface for observing the operations retried by retry() and related functions. Each
+    method receives the name of the call site of the operation and the number of the current
+    attempt, starting at 1. Durations are in seconds. The default implementations do nothing.
+
+    Observers may be shared by concurrent operations and must be thread-safe if those
+    operations run in different threads. Exceptions raised by an observer propagate to the
+    caller of retry().
+    """
+
+    def attempt_started( self, site, attempt ):
+        """
+        Invoked before each attempt.
+        """
+        pass
+
+    def attempt_failed( self, site, attempt, exception, duration ):
+        """
+        Invoked after an attempt failed with the given exception, whether or not the operation
+        will be retried.
+        """
+        pass
+
+    def succeeded( self, site, attempt, duration, total ):
+        """
+        Invoked after the operation succeeded in the given attempt, which took the given
+        duration. The total includes all attempts and the time spent waiting in between.
+        """
+        pass
+
+    def gave_up( self, site, attempts, exception, reason, total ):
+        """
+        Invoked when the operation won't be retried after the given number of attempts, just
+        before the given exception is raised to the caller. The reason is one of
+
+        'unretryable': the predicate rejected the exception,
+        'timeout': the next attempt would exceed the timeout,
+        'circuit_open': the circuit breaker is open, this is the only reason for which attempts
+                        may be zero, namely if the operation failed fast with CircuitOpenError,
+        'budget': the retry budget is exhausted.
+        """
+        pass
+
+
+class Histogram( object ):
+    """
+    A histogram of durations in buckets whose upper bounds are exponentially spaced.
+
+    >>> h = Histogram( )
+    >>> for x in .0001, .3, .3, 5000: h.add( x )
+    >>> d = h.as_dict( )
+    >>> d[ 'count' ], d[ 'max' ], d[ 'buckets' ]
+    (4, 5000, [(0.001, 1), (0.512, 2), (inf, 1)])
+    """
+    # 1ms, 2ms, 4ms and so on up to 17min
+    bounds = tuple( .001 * 2 ** i for i in range( 21 ) ) + (float( 'inf' ),)
+
+    def __init__( self ):
+        super( Histogram, self ).__init__( )
+        self.counts = [ 0 ] * len( self.bounds )
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def add( self, x ):
+        self.counts[ bisect_left( self.bounds, x ) ] += 1
+        self.count += 1
+        self.sum += x
+        if x > self.max:
+            self.max = x
+
+    def as_dict( self ):
+        """
+        Return a dictionary with the number, sum and maximum of the durations in the histogram,
+        and the non-empty buckets as a list of pairs of upper bound and number of durations.
+        """
+        return dict( count=self.count,
+                     sum=self.sum,
+                     max=self.max,
+                     buckets=[ (bound, count)
+                         for bound, count in zip( self.bounds, self.counts ) if count ] )
+
+
+class RetryMetrics( RetryObserver ):
+    """
+    A thread-safe RetryObserver that collects metrics for each call site.
+
+    >>> metrics = RetryMetrics( )
+    >>> def fetch( i ):
+    ...     for attempt in retry( delays=[ 0 ], timeout=10, predicate=lambda e: True,
+    ...                           observer=metrics, site='fetch' ):
+    ...         with attempt:
+    ...             i += 1
+    ...             if i < 3:
+    ...                 raise RuntimeError( 'foo' )
+    >>> fetch( 0 ), fetch( 2 )
+    (None, None)
+    >>> m = metrics.as_dict( )[ 'fetch' ]
+    >>> m[ 'operations' ], m[ 'attempts' ], m[ 'successes' ], m[ 'gave_up' ]
+    (2, 4, 2, {})
+    >>> sorted( m[ 'attempts_per_operation' ].items( ) )
+    [(1, 1), (3, 1)]
+    >>> m[ 'attempt_latency' ][ 'count' ], m[ 'total_latency' ][ 'count' ]
+    (4, 2)
+    """
+
+    def __init__( self ):
+        super( RetryMetrics, self ).__init__( )
+        self.lock = Lock( )
+        self.sites = { }
+
+    def _site( self, site ):
+        try:
+            return self.sites[ site ]
+        except KeyError:
+            return self.sites.setdefault( site, _SiteMetrics( ) )
+
+    def attempt_started( self, site, attempt ):
+        with self.lock:
+            self._site( site ).attempts += 1
 
-        yield single_attempt( )
+    def attempt_failed( self, site, attempt, exception, duration ):
+        with self.lock:
+            m = self._site( site )
+            m.failures += 1
+            m.attempt_latency.add( duration )
+
+    def succeeded( self, site, attempt, duration, total ):
+        with self.lock:
+            m = self._site( site )
+            m.successes += 1
+            m.attempt_latency.add( duration )
+            m.retry_latency += total - duration
+            m.finished( attempt, total )
+
+    def gave_up( self, site, attempts, exception, reason, total ):
+        with self.lock:
+            m = self._site( site )
+            m.gave_up[ reason ] = m.gave_up.get( reason, 0 ) + 1
+            m.gave_up_latency += total
+            m.finished( attempts, total )
+
+    def as_dict( self ):
+        """
+        Return a dictionary mapping the name of each call site to a dictionary with the metrics
+        for that site:
+
+        operations: the number of operations that succeeded or were given up on,
+        attempts: the number of attempts started,
+        failures: the number of failed attempts,
+        successes: the number of operations that succeeded,
+        gave_up: the number of operations given up on, by reason, see RetryObserver.gave_up(),
+        attempts_per_operation: the number of operations by the number of attempts they took,
+        attempt_latency: a histogram of the durations of individual attempts,
+        total_latency: a histogram of the durations of operations, including all attempts and
+                       the time spent waiting in between,
+        retry_latency: the latency added by retrying operations that eventually succeeded,
+                       i.e. the sum of their durations minus that of their successful attempt,
+        gave_up_latency: the sum of the durations of the operations given up on.
+
+        See Histogram.as_dict() for the format of the histograms.
+        """
+        with self.lock:
+            return { site: m.as_dict( ) for site, m in self.sites.items( ) }
+
+    def reset( self ):
+        """
+        Discard all metrics collected so far.
+        """
+        with self.lock:
+            self.sites.clear( )
+
+
+class _SiteMetrics( object ):
+    def __init__( self ):
+        super( _SiteMetrics, self ).__init__( )
+        self.operations = 0
+        self.attempts = 0
+        self.failures = 0
+        self.successes = 0
+        self.gave_up = { }
+        self.attempts_per_operation = { }
+        self.attempt_latency = Histogram( )
+        self.total_latency = Histogram( )
+        self.retry_latency = 0
+        self.gave_up_latency = 0
+
+    def finished( self, attempts, total ):
+        self.operations += 1
+        n = self.attempts_per_operation
+        n[ attempts ] = n.get( attempts, 0 ) + 1
+        self.total_latency.add( total )
+
+    def as_dict( self ):
+        return dict( operations=self.operations,
+                     attempts=self.attempts,
+                     failures=self.failures,
+                     successes=self.successes,
+                     gave_up=dict( self.gave_up ),
+                     attempts_per_operation=dict( self.attempts_per_operation ),
+                     attempt_latency=self.attempt_latency.as_dict( ),
+                     total_latency=self.total_latency.as_dict( ),
+                     retry_latency=self.retry_latency,
+                     gave_up_latency=self.gave_up_latency )
+
+
+class RetryBudget( object ):
+    """
+    Limits the number of retries made by all operations sharing an instance of this class to a
+    given fraction of the number of operations in a sliding time window, plus a given minimum
+    number of retries per second, so that a failing dependency isn't flooded with retries. Once
+    the budget is exhausted, failed attempts are not retried until enough retries have left the
+    window or enough new operations have entered it.
+
+    >>> budget = RetryBudget( ratio=0.5, min_per_second=0, window=10 )
+    >>> for _ in range( 4 ): budget.request( )
+    >>> [ budget.withdraw( ) for _ in range( 3 ) ]
+    [True, True, False]
+
+    This class is thread-safe.
+    """
+
+    def __init__( self, ratio=0.1, min_per_second=1, window=10 ):
+        """
+        :param float ratio: the maximum number of retries as a fraction of the number of
+               operations in the window
+
+        :param float min_per_second: the number of retries per second that are permitted
+               regardless of the number of operations
+
+        :param int window: the length of the sliding window in seconds
+        """
+        super( RetryBudget, self ).__init__( )
+        self.ratio = ratio
+        self.min_retries = min_per_second * window
+        self.window = int( window )
+        self.lock = Lock( )
+        # One-second buckets in a ring: the second each bucket is for, and the number of
+        # operations and retries counted in that second
+        self.seconds = [ None ] * self.window
+        self.requests = [ 0 ] * self.window
+        self.retries = [ 0 ] * self.window
+
+    def _bucket( self ):
+        second = int( time.time( ) )
+        i = second % self.window
+        if self.seconds[ i ] != second:
+            self.seconds[ i ] = second
+            self.requests[ i ] = 0
+            self.retries[ i ] = 0
+        return second, i
+
+    def request( self ):
+        """
+        Count an operation.
+        """
+        with self.lock:
+            _, i = self._bucket( )
+            self.requests[ i ] += 1
+
+    def withdraw( self ):
+        """
+        Count a retry and return True if the budget permits it, otherwise return False.
+        """
+        with self.lock:
+            second, i = self._bucket( )
+            start = second - self.window
+            requests = retries = 0
+            for j in range( self.window ):
+                if self.seconds[ j ] is not None and self.seconds[ j ] > start:
+                    requests += self.requests[ j ]
+                    retries += self.retries[ j ]
+            if retries < self.min_retries + self.ratio * requests:
+                self.retries[ i ] += 1
+                return True
+            else:
+                log.info( 'Retry budget exhausted, %i retries for %i operations.',
+                          retries, requests )
+                return False
+
+
+class CircuitOpenError( Exception ):
+    """
+    Raised instead of attempting an operation while the circuit breaker guarding it is open.
+    """
+    pass
+
+
+class CircuitBreaker( object ):
+    """
+    A circuit breaker for operations on a dependency, shared by all callers of that dependency.
+    The circuit opens after the given number of consecutive failures. While it is open,
+    attempts fail fast with CircuitOpenError. Once the given reset timeout has elapsed, the
+    circuit becomes half-open and a single attempt is let through to probe the dependency. If
+    the probe succeeds, the circuit closes, otherwise it opens again for another reset timeout.
+
+    >>> breaker = CircuitBreaker( threshold=2, reset_timeout=60 )
+    >>> breaker.failure( ); breaker.failure( )
+    >>> breaker.before( )  # doctest: +IGNORE_EXCEPTION_DETAIL
+    Traceback (most recent call last):
+    ...
+    CircuitOpenError: The circuit has been open for 0s after 2 consecutive failures.
+
+    This class is thread-safe.
+    """
+
+    def __init__( self, threshold=5, reset_timeout=30 ):
+        """
+        :param int threshold: the number of consecutive failures after which the circuit opens
+
+        :param float reset_timeout: the time in seconds after which an open circuit lets a
+               probe through. If the outcome of a probe isn't reported within that time,
+               another probe is let through.
+        """
+        super( CircuitBreaker, self ).__init__( )
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.lock = Lock( )
+        self.failures = 0
+        # The time the circuit opened, or None if it is closed
+        self.opened = None
+        # The time the most recent probe was let through while the circuit was open, or None
+        self.probed = None
+
+    def closed( self ):
+        """
+        True if the circuit is closed, i.e. if attempts are being made normally.
+        """
+        return self.opened is None
+
+    def before( self ):
+        """
+        Invoked before each attempt. Raises CircuitOpenError if the attempt should not be made.
+        """
+        if self.opened is None:
+            return
+        with self.lock:
+            if self.opened is None:
+                return
+            t = time.time( )
+            if t >= self.opened + self.reset_timeout and (self.probed is None or
+                                                          t >= self.probed + self.reset_timeout):
+                self.probed = t
+                log.info( 'Probing circuit that has been open for %is.', t - self.opened )
+            else:
+                raise CircuitOpenError( 'The circuit has been open for %is after %i '
+                                        'consecutive failures.' % (t - self.opened,
+                                                                   self.failures) )
+
+    def success( self ):
+        """
+        Report a successful attempt.
+        """
+        if self.failures or self.opened is not None:
+            with self.lock:
+                if self.opened is not None:
+                    log.info( 'Closing circuit.' )
+                self.failures = 0
+                self.opened = None
+                self.probed = None
+
+    def failure( self ):
+        """
+        Report a failed attempt.
+        """
+        with self.lock:
+            self.failures += 1
+            if self.opened is None:
+                if self.failures >= self.threshold:
+                    log.warning( 'Opening circuit after %i consecutive failures.',
+                                 self.failures )
+                    self.opened = time.time( )
+            elif self.probed is not None:
+                # The probe failed
+                self.opened = time.time( )
+                self.probed = None
 
 
 default_delays = (0, 1, 1, 4, 16, 64)
@@ -125,8 +619,11 @@ def retryable_http_error( e ):
     return isinstance( e, urllib.error.HTTPError ) and e.code in ('503', '408', '500')
 
 
-def retry_http( delays=default_delays, timeout=default_timeout, predicate=retryable_http_error ):
+def retry_http( delays=default_delays, timeout=default_timeout, predicate=retryable_http_error,
+                budget=None, breaker=None, observer=None, site=None ):
     """
+    Like retry(), but retrying on the HTTP errors that are likely to be transient.
+
     >>> i = 0
     >>> for attempt in retry_http(timeout=5):  # doctest: +IGNORE_EXCEPTION_DETAIL
     ...     with attempt:
@@ -138,4 +635,5 @@ def retry_http( delays=default_delays, timeout=default_timeout, predicate=retrya
     >>> i > 1
     True
     """
-    return retry( delays=delays, timeout=timeout, predicate=predicate )
+    return retry( delays=delays, timeout=timeout, predicate=predicate, budget=budget,
+                  breaker=breaker, observer=observer, site=site )
@@ -2,8 +2,14 @@
 
 from builtins import str
 from builtins import next
-from builtins import range
-import inspect
+import re
+import string
+import sys
+
+from bd2k.util import memoize
+
+# The maximum number of templates whose variable names are cached by interpolate()
+template_cache_size = 1024
 
 
 def to_english( iterable, separator=", ", conjunction=' and ', empty='empty',
@@ -74,7 +80,9 @@ def interpolate( template, skip_frames=0, **kwargs ):
     built-in string format function. Explicitly passed keyword arguments take precedence over
     local variables which take precedence over global variables.
 
-    Unlike with Python scoping rules, only the variables in a single frame are examined.
+    Unlike with Python scoping rules, only the variables in a single frame are examined. Only the
+    variables actually referenced by the template are looked up, the names of which are cached
+    per template string.
 
     Example usage:
 
@@ -118,15 +126,49 @@ def interpolate_dict( template, dictionary, skip_frames=0 ):
 # interpolate() and interpolate_dict()
 
 def __interpolate( template, skip_frames, dictionary ):
-    frame = inspect.currentframe( )
-    for i in range( skip_frames + 2 ):
-        prev_frame = frame
-        frame = frame.f_back
-        del prev_frame
+    frame = sys._getframe( skip_frames + 2 )
     try:
-        env = frame.f_globals.copy( )
-        env.update( frame.f_locals )
-        env.update( dictionary )
+        env = { }
+        f_locals = None
+        for name in _template_names( template ):
+            if name in dictionary:
+                env[ name ] = dictionary[ name ]
+            else:
+                if f_locals is None:
+                    f_locals = frame.f_locals
+                if name in f_locals:
+                    env[ name ] = f_locals[ name ]
+                elif name in frame.f_globals:
+                    env[ name ] = frame.f_globals[ name ]
+                # Otherwise, let format() raise the KeyError
     finally:
         del frame
     return template.format( **env )
+
+
+_formatter = string.Formatter( )
+
+# Matches the part of a field name before any attribute access or indexing
+_field_name_re = re.compile( r'[^.[]*' )
+
+
+@memoize( maxsize=template_cache_size )
+def _template_names( template ):
+    """
+    Return the names of the variables referenced by the replacement fields in the given template,
+    including those nested in format specifications.
+
+    >>> _template_names( '{x} {y.z:{w}} {x[0]!r} {{v}}' )
+    ('x', 'y', 'w')
+    """
+    names = [ ]
+    templates = [ template ]
+    while templates:
+        for _, field_name, format_spec, _ in _formatter.parse( templates.pop( ) ):
+            if field_name is not None:
+                name = _field_name_re.match( field_name ).group( )
+                if name not in names:
+                    names.append( name )
+            if format_spec:
+                templates.append( format_spec )
+    return tuple( names )
@@ -0,0 +1,205 @@
+import asyncio
+import time
+import urllib.error
+from unittest import TestCase
+
+from bd2k.util.asyncio import aretry, aretry_http, async_memoize
+from bd2k.util.retry import CircuitBreaker, CircuitOpenError, RetryBudget, RetryMetrics
+
+
+class TestAsyncMemoize( TestCase ):
+    def test_exception( self ):
+        calls = [ ]
+
+        @async_memoize
+        async def f( x ):
+            calls.append( x )
+            await asyncio.sleep( 0 )
+            if len( calls ) == 1:
+                raise RuntimeError( 'first' )
+            return x
+
+        async def main( ):
+            results = await asyncio.gather( f( 1 ), f( 1 ), return_exceptions=True )
+            self.assertEqual( [ str( r ) for r in results ], [ 'first' ] * 2 )
+            self.assertEqual( await f( 1 ), 1 )
+
+        asyncio.run( main( ) )
+        self.assertEqual( calls, [ 1, 1 ] )
+
+    def test_cancellation( self ):
+        """
+        Cancelling one caller doesn't affect the others.
+        """
+        calls = [ ]
+
+        @async_memoize
+        async def f( x ):
+            calls.append( x )
+            await asyncio.sleep( .1 )
+            return x
+
+        async def main( ):
+            first = asyncio.ensure_future( f( 1 ) )
+            second = asyncio.ensure_future( f( 1 ) )
+            await asyncio.sleep( 0 )
+            first.cancel( )
+            self.assertEqual( await second, 1 )
+            self.assertTrue( first.cancelled( ) )
+            self.assertEqual( await f( 1 ), 1 )
+
+        asyncio.run( main( ) )
+        self.assertEqual( calls, [ 1 ] )
+
+    def test_eviction( self ):
+        calls = [ ]
+
+        @async_memoize( maxsize=2 )
+        async def f( x ):
+            calls.append( x )
+            return x
+
+        async def main( ):
+            for x in [ 1, 2, 1, 3, 2 ]:
+                await f( x )
+
+        asyncio.run( main( ) )
+        self.assertEqual( calls, [ 1, 2, 3, 2 ] )
+
+    def test_recursion( self ):
+        @async_memoize
+        async def fib( n ):
+            return n if n < 2 else await fib( n - 1 ) + await fib( n - 2 )
+
+        @async_memoize
+        async def same( x, depth=[ ] ):
+            depth.append( x )
+            return await same( x ) if len( depth ) < 3 else len( depth )
+
+        self.assertEqual( asyncio.run( fib( 100 ) ), 354224848179261915075 )
+        self.assertEqual( asyncio.run( same( 0 ) ), 3 )
+
+
+class TestAretry( TestCase ):
+    def test_concurrency( self ):
+        """
+        Many operations waiting to be retried share the event loop instead of blocking it.
+        """
+        n, delay = 1000, .5
+        attempts = [ ]
+
+        async def operation( i ):
+            async for attempt in aretry( delays=[ delay ], timeout=10, predicate=lambda e: True ):
+                async with attempt:
+                    attempts.append( i )
+                    if attempts.count( i ) < 3:
+                        raise RuntimeError( 'flaky' )
+            return i
+
+        async def main( ):
+            return await asyncio.gather( *map( operation, range( n ) ) )
+
+        start = time.time( )
+        self.assertEqual( asyncio.run( main( ) ), list( range( n ) ) )
+        self.assertLess( time.time( ) - start, 2 * delay + 1 )
+        self.assertEqual( len( attempts ), 3 * n )
+
+    def test_timeout( self ):
+        attempts = [ ]
+
+        async def main( timeout ):
+            async for attempt in aretry( delays=[ .1 ], timeout=timeout,
+                                         predicate=lambda e: True ):
+                async with attempt:
+                    attempts.append( None )
+                    raise RuntimeError( 'down' )
+
+        self.assertRaises( RuntimeError, asyncio.run, main( 0 ) )
+        self.assertEqual( len( attempts ), 1 )
+        del attempts[ : ]
+        self.assertRaises( RuntimeError, asyncio.run, main( .35 ) )
+        # Four attempts unless the event loop was slow to resume
+        self.assertIn( len( attempts ), (2, 3, 4) )
+
+    def test_http( self ):
+        codes = [ '503', '408', '404' ]
+
+        async def main( ):
+            async for attempt in aretry_http( delays=[ 0 ], timeout=5 ):
+                async with attempt:
+                    raise urllib.error.HTTPError( 'http://www.test.com', codes.pop( 0 ),
+                                                  'some message', { }, None )
+
+        with self.assertRaises( urllib.error.HTTPError ) as cm:
+            asyncio.run( main( ) )
+        self.assertEqual( cm.exception.code, '404' )
+        self.assertEqual( codes, [ ] )
+
+    def test_cancellation( self ):
+        """
+        Cancelling an operation while it waits to be retried doesn't retry it.
+        """
+        attempts = [ ]
+
+        async def operation( ):
+            async for attempt in aretry( delays=[ 10 ], timeout=60, predicate=lambda e: True ):
+                async with attempt:
+                    attempts.append( None )
+                    raise RuntimeError( 'down' )
+
+        async def main( ):
+            task = asyncio.ensure_future( operation( ) )
+            await asyncio.sleep( .1 )
+            task.cancel( )
+            with self.assertRaises( asyncio.CancelledError ):
+                await task
+
+        asyncio.run( main( ) )
+        self.assertEqual( len( attempts ), 1 )
+
+    def test_breaker( self ):
+        """
+        Concurrent operations share a circuit breaker and a retry budget.
+        """
+        breaker = CircuitBreaker( threshold=5, reset_timeout=60 )
+        budget = RetryBudget( ratio=1, min_per_second=0 )
+        attempts = [ ]
+
+        async def operation( ):
+            async for attempt in aretry( delays=[ 0 ], timeout=10, predicate=lambda e: True,
+                                         budget=budget, breaker=breaker ):
+                async with attempt:
+                    attempts.append( None )
+                    await asyncio.sleep( 0 )
+                    raise RuntimeError( 'down' )
+
+        async def main( ):
+            return await asyncio.gather( *[ operation( ) for _ in range( 10 ) ],
+                                         return_exceptions=True )
+
+        results = asyncio.run( main( ) )
+        self.assertTrue( all( isinstance( r, Exception ) for r in results ) )
+        self.assertFalse( breaker.closed( ) )
+        self.assertLess( len( attempts ), 20 )
+        self.assertRaises( CircuitOpenError, asyncio.run, operation( ) )
+
+    def test_metrics( self ):
+        metrics = RetryMetrics( )
+
+        async def operation( failures ):
+            async for attempt in aretry( delays=[ 0 ], timeout=10, predicate=lambda e: True,
+                                         observer=metrics ):
+                async with attempt:
+                    await asyncio.sleep( 0 )
+                    if failures:
+                        failures -= 1
+                        raise RuntimeError( 'flaky' )
+
+        async def main( ):
+            await asyncio.gather( *[ operation( i ) for i in range( 3 ) ] )
+
+        asyncio.run( main( ) )
+        (site, m), = metrics.as_dict( ).items( )
+        self.assertTrue( site.startswith( __name__ + ':operation:' ), site )
+        self.assertEqual( (m[ 'operations' ], m[ 'attempts' ], m[ 'successes' ]), (3, 6, 3) )
+        self.assertEqual( m[ 'attempts_per_operation' ], { 1: 1, 2: 1, 3: 1 } )
@@ -0,0 +1,33 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from bd2k.util.bench.__main__ import main
+
+
+class TestBench( TestCase ):
+    def setUp( self ):
+        super( TestBench, self ).setUp( )
+        self.path = tempfile.mkdtemp( )
+
+    def tearDown( self ):
+        shutil.rmtree( self.path )
+        super( TestBench, self ).tearDown( )
+
+    def test_baseline( self ):
+        path = os.path.join( self.path, 'baseline.json' )
+        args = [ '--filter', 'memoize entry', '--repeat', '1' ]
+        self.assertEqual( main( args + [ '--save', path ] ), 0 )
+        with open( path ) as f:
+            baseline = json.load( f )
+        self.assertEqual( sorted( baseline[ 'bytes_per_object' ] ),
+                          [ 'memoize entry', 'memoize entry, LRU' ] )
+        self.assertEqual( main( args + [ '--baseline', path, '--threshold', '1' ] ), 0 )
+        # Pretend that the entries used to be much smaller
+        for name in baseline[ 'bytes_per_object' ]:
+            baseline[ 'bytes_per_object' ][ name ] /= 10
+        with open( path, 'w' ) as f:
+            json.dump( baseline, f )
+        self.assertEqual( main( args + [ '--baseline', path ] ), 1 )
@@ -0,0 +1,165 @@
+from builtins import map
+from builtins import range
+import io
+import mmap
+import os
+import random
+import tempfile
+import tracemalloc
+from unittest import TestCase, skipIf
+
+from bd2k.util.codec import DecodingReader, DecodingWriter, EncodingReader, EncodingWriter
+from bd2k.util.d32 import standard as d32
+from bd2k.util.d64 import standard as d64
+from bd2k.util.files import copyfileobj
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Zeros( object ):
+    """
+    A file-like object that reads the given number of zero bytes without holding them in memory
+    """
+
+    def __init__( self, size ):
+        self.size = size
+
+    def read( self, n ):
+        n = min( n, self.size )
+        self.size -= n
+        return b'\0' * n
+
+
+class Counter( object ):
+    """
+    A file-like object that counts the bytes written to it, discarding them
+    """
+
+    def __init__( self ):
+        self.size = 0
+
+    def write( self, data ):
+        self.size += len( data )
+
+
+class TestCodec( TestCase ):
+    def test_incremental( self ):
+        for codec in (d32, d64):
+            for _ in range( 100 ):
+                data = os.urandom( random.randrange( 1000 ) )
+                encoded = codec.encode( data ).encode( 'ascii' )
+                for f, x, y in ((codec.encoder, data, encoded), (codec.decoder, encoded, data)):
+                    incremental = f( )
+                    results = [ ]
+                    i = 0
+                    while i < len( x ):
+                        j = i + random.randrange( 20 )
+                        results.append( incremental.update( x[ i:j ] ) )
+                        i = j
+                    results.append( incremental.finish( ) )
+                    self.assertEqual( b''.join( results ), y )
+
+    def test_copyfileobj( self ):
+        for codec in (d32, d64):
+            data = os.urandom( 100000 )
+            encoded = codec.encode( data ).encode( 'ascii' )
+            for reader, writer, x, y in ((EncodingReader, EncodingWriter, data, encoded),
+                                         (DecodingReader, DecodingWriter, encoded, data)):
+                dst = io.BytesIO( )
+                copyfileobj( reader( io.BytesIO( x ), codec ), dst, bufsize=997 )
+                self.assertEqual( dst.getvalue( ), y )
+                dst = io.BytesIO( )
+                with writer( dst, codec ) as f:
+                    copyfileobj( io.BytesIO( x ), f, bufsize=997 )
+                self.assertEqual( dst.getvalue( ), y )
+
+    def test_invalid( self ):
+        with DecodingWriter( io.BytesIO( ), d64 ) as f:
+            self.assertRaises( ValueError, f.write, b'....+...' )
+
+    def test_memory( self ):
+        """
+        Memory usage must not depend on the size of the input.
+        """
+        size = 64 * 1024 * 1024
+        for codec in (d32, d64):
+            tracemalloc.start( )
+            try:
+                dst = Counter( )
+                with EncodingWriter( dst, codec ) as f:
+                    with DecodingWriter( f, codec ) as g:
+                        copyfileobj( EncodingReader( Zeros( size ), codec ), g )
+                _, peak = tracemalloc.get_traced_memory( )
+            finally:
+                tracemalloc.stop( )
+            self.assertEqual( dst.size, len( codec.encode( b'\0' * size ) ) )
+            self.assertLess( peak, 16 * 1024 * 1024 )
+
+    def test_many( self ):
+        for codec in (d32, d64):
+            for width in (None, 0, 7, 16):
+                items = [ os.urandom( random.randrange( 20 ) if width is None else width )
+                    for _ in range( 1000 ) ]
+                self._test_many( codec, items )
+
+    def _test_many( self, codec, items ):
+        encoded = codec.encode_many( items )
+        self.assertEqual( encoded, list( map( codec.encode, items ) ) )
+        self.assertEqual( codec.decode_many( iter( encoded ) ), items )
+        # Superfluous trailing characters are ignored, just like decode() does
+        encoded = [ e + 'z' for e in encoded ]
+        self.assertEqual( codec.decode_many( encoded ), list( map( codec.decode, encoded ) ) )
+        self.assertRaises( ValueError, codec.decode_many, [ 'zz', '+' ] )
+
+    @skipIf( numpy is None, 'NumPy is not installed' )
+    def test_many_array( self ):
+        for codec in (d32, d64):
+            for width in (8, 15, 16):
+                items = [ os.urandom( width ) for _ in range( 1000 ) ]
+                array = numpy.array( items, dtype='S%i' % width )
+                rows = array.view( numpy.uint8 ).reshape( len( items ), width )
+                expected = [ codec.encode( d ).encode( 'ascii' ) for d in items ]
+                for a in (array, rows):
+                    encoded = codec.encode_many( a )
+                    self.assertEqual( encoded.tolist( ), expected )
+                    self.assertTrue( numpy.array_equal( codec.decode_many( encoded ), rows ) )
+
+    def test_buffers( self ):
+        data = os.urandom( 100000 )
+        for codec in (d32, d64):
+            encoded = codec.encode( data )
+            with tempfile.TemporaryFile( ) as f:
+                f.write( encoded.encode( 'ascii' ) )
+                f.flush( )
+                m = mmap.mmap( f.fileno( ), 0, access=mmap.ACCESS_READ )
+                try:
+                    buffers = [ encoded, encoded.encode( 'ascii' ),
+                        bytearray( encoded.encode( 'ascii' ) ), m, memoryview( m )[ :-1 ] ]
+                    for e in buffers:
+                        self.assertEqual( codec.decode( e ), codec.decode( encoded[ :len( e ) ] ) )
+                        buf = bytearray( len( data ) + 1 )
+                        n = codec.decode_into( e, buf )
+                        self.assertEqual( bytes( buf[ :n ] ), codec.decode( e ) )
+                        del e
+                    del buffers
+                finally:
+                    m.close( )
+            buf = bytearray( len( encoded ) )
+            self.assertEqual( codec.encode_into( memoryview( data ), buf ), len( encoded ) )
+            self.assertEqual( buf.decode( 'ascii' ), encoded )
+            self.assertRaises( ValueError, codec.encode_into, data, bytearray( len( encoded ) - 1 ) )
+            self.assertRaises( ValueError, codec.decode_into, encoded, bytearray( len( data ) - 1 ) )
+            self.assertRaises( ValueError, codec.decode_into, b'\0' * 8, bytearray( 8 ) )
+
+    @skipIf( numpy is None, 'NumPy is not installed' )
+    def test_buffers_array( self ):
+        for codec in (d32, d64):
+            data = numpy.arange( 1000, dtype=numpy.int64 )
+            encoded = codec.encode( data.tobytes( ) )
+            self.assertEqual( codec.encode( data ), encoded )
+            decoded = numpy.zeros_like( data )
+            self.assertEqual( codec.decode_into( encoded, decoded ), data.nbytes )
+            self.assertTrue( numpy.array_equal( decoded, data ) )
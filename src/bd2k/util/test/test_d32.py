@@ -22,7 +22,7 @@ from __future__ import absolute_import
 from builtins import map
 from builtins import range
 from unittest import TestCase
-from bd2k.util.d32 import standard as d32
+from bd2k.util.d32 import standard as d32, base32
 import os
 
 
@@ -30,3 +30,66 @@ class TestD32( TestCase ):
     def test( self ):
         l = [ os.urandom( i ) for i in range( 1000 ) ]
         self.assertEqual( list(map( d32.decode, sorted( map( d32.encode, l ) ) )), sorted( l ) )
+
+    def test_reference( self ):
+        """
+        The output must be identical to that of the original, pure-Python implementation.
+        """
+        l = [ os.urandom( i ) for i in range( 100 ) ]
+        for codec in (d32, base32):
+            for d in l:
+                e = reference_encode( codec.alphabet, d )
+                self.assertEqual( codec.encode( d ), e )
+                self.assertEqual( codec.decode( e ), reference_decode( codec.lookup, e ) )
+                # A superfluous trailing character
+                x = e + codec.encode( b'x' )[ 0 ]
+                self.assertEqual( codec.decode( x ), reference_decode( codec.lookup, x ) )
+
+    def test_invalid( self ):
+        for e in ('A2', '2!', '\u20ac2'):
+            self.assertRaises( ValueError, d32.decode, e )
+
+
+def reference_encode( a, d ):
+    m = len( d )
+    n = (m * 8 + 4) // 5
+    padding = 8 - n % 8
+    e = bytearray( n + padding )
+    i, j = 0, 0
+    while i < m:
+        if m - i < 5:
+            g = bytearray( d[ i: ] + b'\0' * (5 - (m - i)) )
+        else:
+            g = bytearray( d[ i:i + 5 ] )
+        e[ j + 0 ] = a[ g[ 0 ] >> 3 ]
+        e[ j + 1 ] = a[ g[ 0 ] << 2 & 31 | g[ 1 ] >> 6 ]
+        e[ j + 2 ] = a[ g[ 1 ] >> 1 & 31 ]
+        e[ j + 3 ] = a[ g[ 1 ] << 4 & 31 | g[ 2 ] >> 4 ]
+        e[ j + 4 ] = a[ g[ 2 ] << 1 & 31 | g[ 3 ] >> 7 ]
+        e[ j + 5 ] = a[ g[ 3 ] >> 2 & 31 ]
+        e[ j + 6 ] = a[ g[ 3 ] << 3 & 31 | g[ 4 ] >> 5 ]
+        e[ j + 7 ] = a[ g[ 4 ] & 31 ]
+        j += 8
+        i += 5
+    return e[ :-padding ].decode( 'ascii' )
+
+
+def reference_decode( l, e ):
+    n = len( e )
+    m = n * 5 // 8
+    padding = 5 - m % 5
+    d = bytearray( m + padding )
+    i, j = 0, 0
+    while j < n:
+        if n - j < 8:
+            g = [ l[ ord( x ) ] for x in e[ j: ] ] + [ 0 ] * (8 - (n - j))
+        else:
+            g = [ l[ ord( x ) ] for x in e[ j:j + 8 ] ]
+        d[ i + 0 ] = g[ 0 ] << 3 & 255 | g[ 1 ] >> 2
+        d[ i + 1 ] = g[ 1 ] << 6 & 255 | g[ 2 ] << 1 & 255 | g[ 3 ] >> 4
+        d[ i + 2 ] = g[ 3 ] << 4 & 255 | g[ 4 ] >> 1
+        d[ i + 3 ] = g[ 4 ] << 7 & 255 | g[ 5 ] << 2 & 255 | g[ 6 ] >> 3
+        d[ i + 4 ] = g[ 6 ] << 5 & 255 | g[ 7 ]
+        j += 8
+        i += 5
+    return bytes( d[ :-padding ] )
@@ -30,3 +30,71 @@ class TestD64( TestCase ):
     def test( self ):
         l = [ os.urandom( i ) for i in range( 1000 ) ]
         self.assertEqual( list(map( d64.decode, sorted( map( d64.encode, l ) ) )), sorted( l ) )
+
+    def test_reference( self ):
+        """
+        The output must be identical to that of the original, pure-Python implementation.
+        """
+        for i in range( 100 ):
+            d = os.urandom( i )
+            e = reference_encode( d64.alphabet, d )
+            self.assertEqual( d64.encode( d ), e )
+            self.assertEqual( d64.decode( e ), reference_decode( d64.lookup, e ) )
+            # A superfluous trailing character
+            x = e + 'z'
+            self.assertEqual( d64.decode( x ), reference_decode( d64.lookup, x ) )
+
+    def test_invalid( self ):
+        for e in ('+...', '..=', '€...'):
+            self.assertRaises( ValueError, d64.decode, e )
+
+
+def reference_encode( a, data ):
+    l = len( data )
+    s = bytearray( (l * 4 + 2) // 3 )
+    hang = 0
+    j = 0
+    for i in range( l ):
+        v = data[ i ]
+        r = i % 3
+        if r == 0:
+            s[ j ] = a[ v >> 2 ]
+            j += 1
+            hang = (v & 3) << 4
+        elif r == 1:
+            s[ j ] = a[ hang | v >> 4 ]
+            j += 1
+            hang = (v & 0xf) << 2
+        else:
+            s[ j ] = a[ hang | v >> 6 ]
+            j += 1
+            s[ j ] = a[ v & 0x3f ]
+            j += 1
+            hang = 0
+    if l % 3:
+        s[ j ] = a[ hang ]
+    return s.decode( 'ascii' )
+
+
+def reference_decode( l, e ):
+    n = len( e )
+    j = 0
+    b = bytearray( n * 3 // 4 )
+    hang = 0
+    for i in range( n ):
+        v = l[ ord( e[ i ] ) ]
+        r = i % 4
+        if r == 0:
+            hang = v << 2
+        elif r == 1:
+            b[ j ] = hang | v >> 4
+            j += 1
+            hang = (v << 4) & 0xFF
+        elif r == 2:
+            b[ j ] = hang | v >> 2
+            j += 1
+            hang = (v << 6) & 0xFF
+        else:
+            b[ j ] = hang | v
+            j += 1
+    return bytes( b )
@@ -0,0 +1,356 @@
+from builtins import range
+from builtins import str
+from past.builtins import basestring
+import hashlib
+import io
+import json
+import random
+import tracemalloc
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+from unittest import TestCase, skipIf
+
+from bd2k.util.hashes import MerkleCache, hash_json, hash_json_file, hash_json_merkle
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def recursive_hash_json( hash_obj, value ):
+    """
+    The hash_json() of old
+    """
+    try:
+        items = iter(value.items( ))
+    except AttributeError:
+        # Must check for string before testing iterability since strings are iterable
+        if isinstance( value, str ):
+            _recursive_hash_string( hash_obj, value )
+        else:
+            try:
+                iterator = iter( value )
+            except TypeError:
+                # We must check for bool first since it is subclass of int (wrongly, IMHO)
+                if isinstance( value, bool ):
+                    _recursive_hash_bool( hash_obj, value )
+                elif isinstance( value, (int, float) ):
+                    _recursive_hash_number( hash_obj, value )
+                else:
+                    raise ValueError( 'Type "%s" is not supported.' % type( value ).__name__ )
+            else:
+                _recursive_hash_iterable( hash_obj, iterator )
+    else:
+        _recursive_hash_hashable( hash_obj, items )
+
+
+def _recursive_hash_number( hash_obj, n ):
+    hash_obj.update( str( n ).encode('utf-8') )
+
+
+def _recursive_hash_bool( hash_obj, b ):
+    hash_obj.update( str('true' if b else 'false' ).encode('utf-8'))
+
+
+def _recursive_hash_string( hash_obj, s ):
+    hash_obj.update( '"'.encode('utf-8') )
+    hash_obj.update( s.encode('utf-8') )
+    hash_obj.update( '"'.encode('utf-8') )
+
+
+def _recursive_hash_iterable( hash_obj, items ):
+    hash_obj.update( '['.encode('utf-8') )
+    try:
+        item = next( items )
+        recursive_hash_json( hash_obj, item )
+        while True:
+            item = next( items )
+            hash_obj.update( ','.encode('utf-8') )
+            recursive_hash_json( hash_obj, item )
+    except StopIteration:
+        pass
+    hash_obj.update( ']'.encode('utf-8') )
+
+
+def _recursive_hash_hashable( hash_obj, items ):
+    items = iter( sorted( items ) )
+    hash_obj.update( '{'.encode('utf-8') )
+    try:
+        item = next( items )
+        _recursive_hash_hashable_item( hash_obj, item )
+        while True:
+            item = next( items )
+            hash_obj.update( ','.encode('utf-8') )
+            _recursive_hash_hashable_item( hash_obj, item )
+    except StopIteration:
+        pass
+    hash_obj.update( '}'.encode('utf-8') )
+
+
+def _recursive_hash_hashable_item( hash_obj, k_v ):
+    (k, v) = k_v
+    if isinstance( k, basestring ):
+        hash_obj.update( k.encode('utf-8') )
+        hash_obj.update( ':'.encode('utf-8') )
+        recursive_hash_json( hash_obj, v )
+    else:
+        raise ValueError( 'Dictionary keys must be strings, not type "%s".' % type( k ).__name__ )
+
+
+class Text( str ):
+    pass
+
+
+def random_document( rng, depth=0 ):
+    leaves = [
+        lambda: rng.randint( -2 ** 70, 2 ** 70 ),
+        lambda: rng.choice( [ 0.0, -0.0, 1e100, 1e-7, float( 'nan' ), float( 'inf' ) ] ),
+        lambda: rng.random( ) * 10 ** rng.randint( -20, 20 ),
+        lambda: rng.choice( [ True, False ] ),
+        lambda: u''.join( rng.choice( u'abä€"' ) for _ in range( 5 ) ),
+        lambda: Text( u'text' ),
+        lambda: [ rng.random( ) for _ in range( rng.randrange( 5 ) ) ],
+        lambda: tuple( rng.randrange( 10 ) for _ in range( rng.randrange( 5 ) ) ) ]
+    if depth < 4 and rng.random( ) < 0.5:
+        n = rng.randrange( 6 )
+        r = rng.random( )
+        if r < 0.4:
+            return [ random_document( rng, depth + 1 ) for _ in range( n ) ]
+        elif r < 0.5:
+            # An iterable other than a list or tuple
+            return iter( [ random_document( rng, depth + 1 ) for _ in range( n ) ] )
+        elif r < 0.9:
+            return { u'k%i' % rng.randrange( 100 ): random_document( rng, depth + 1 )
+                for _ in range( n ) }
+        else:
+            # A mapping other than a dict
+            return OrderedDict( (u'k%i' % rng.randrange( 100 ), random_document( rng, depth + 1 ))
+                                for _ in range( n ) )
+    else:
+        return rng.choice( leaves )( )
+
+
+class TestHashJson( TestCase ):
+    def digests( self, value ):
+        expected, actual = hashlib.md5( ), hashlib.md5( )
+        recursive_hash_json( expected, value )
+        hash_json( actual, value )
+        return expected.hexdigest( ), actual.hexdigest( )
+
+    def test_reference( self ):
+        for i in range( 1000 ):
+            # Generate each document twice since it may contain iterators that can only be
+            # consumed once
+            digests = [ ]
+            for f in (recursive_hash_json, hash_json):
+                h = hashlib.md5( )
+                f( h, random_document( random.Random( i ) ) )
+                digests.append( h.hexdigest( ) )
+            self.assertEqual( *digests )
+
+    def test_large( self ):
+        # Crosses the threshold at which the buffer is flushed several times
+        value = { u'x%i' % i: [ i, u'y', { u'z': [ [ ], 1.5 ] } ] for i in range( 10000 ) }
+        expected, actual = self.digests( value )
+        self.assertEqual( expected, actual )
+
+    def test_deep( self ):
+        depth = 100000
+        value = 0
+        for i in range( depth ):
+            value = [ value ] if i % 2 else { u'a': value }
+        h = hashlib.md5( )
+        hash_json( h, value )
+        expected = hashlib.md5( )
+        half = depth // 2
+        expected.update( (u'[{a:' * half + u'0' + u'}]' * half).encode( 'utf-8' ) )
+        self.assertEqual( h.hexdigest( ), expected.hexdigest( ) )
+
+    def test_invalid( self ):
+        for value in ( [ 1, object( ) ], { u'a': { 1: 2 } }, { u'a': None } ):
+            self.assertRaises( ValueError, hash_json, hashlib.md5( ), value )
+
+    def test_binary( self ):
+        def expected( prefix, b, suffix=b'' ):
+            h = hashlib.md5( )
+            h.update( prefix.encode( 'utf-8' ) + b + suffix )
+            return h.hexdigest( )
+
+        for value in (b'ab', bytearray( b'ab' ), memoryview( b'xaby' )[ 1:3 ]):
+            self.assertEqual( expected( u'{a:#|u1(2):', b'ab', b'}' ),
+                              self.digests( { u'a': value } )[ 1 ] )
+        # Not contiguous
+        self.assertEqual( expected( u'#|u1(2):', b'ab' ),
+                          self.digests( memoryview( b'xayb' )[ 1::2 ] )[ 1 ] )
+
+    @skipIf( numpy is None, 'NumPy is not installed' )
+    def test_numpy( self ):
+        def digest( value ):
+            h = hashlib.md5( )
+            hash_json( h, value )
+            return h.hexdigest( )
+
+        def expected( prefix, b ):
+            h = hashlib.md5( )
+            h.update( prefix.encode( 'utf-8' ) + b )
+            return h.hexdigest( )
+
+        a = numpy.arange( 6, dtype='<i4' ).reshape( 2, 3 )
+        self.assertEqual( expected( u'#<i4(2,3):', a.tobytes( ) ), digest( a ) )
+        # Memory layout and byte order don't matter, but the dtype and the shape do
+        for b in (numpy.asfortranarray( a ), a.astype( '>i4' ), a.T.copy( ).T,
+                  numpy.repeat( a.ravel( ), 2 )[ ::2 ].reshape( 2, 3 )):
+            self.assertEqual( digest( a ), digest( b ) )
+        for b in (a.astype( '<i8' ), a.reshape( 3, 2 ), a.reshape( 6 ), a.tolist( )):
+            self.assertNotEqual( digest( a ), digest( b ) )
+        self.assertEqual( expected( u'#<f8():', numpy.float64( 1.5 ).tobytes( ) ),
+                          digest( numpy.array( 1.5 ) ) )
+        self.assertEqual( expected( u'#|b1(2):', b'\x01\x00' ),
+                          digest( numpy.array( [ True, False ] ) ) )
+        self.assertEqual( expected( u'#<M8[s](1):', b'\x01' + b'\x00' * 7 ),
+                          digest( numpy.array( [ 1 ], dtype='datetime64[s]' ) ) )
+        self.assertEqual( expected( u'#<f4(0):', b'' ), digest( numpy.zeros( 0, dtype='f4' ) ) )
+        # Scalars hash like Python scalars
+        for x, y in ((numpy.float32( 0.5 ), 0.5), (numpy.int64( 3 ), 3),
+                     (numpy.bool_( True ), True), (numpy.str_( u'x' ), u'x'),
+                     (numpy.bytes_( b'x' ), b'x')):
+            self.assertEqual( digest( y ), digest( x ) )
+        for value in (numpy.array( [ None ] ), numpy.zeros( 1, dtype='i4,f8' ),
+                      numpy.datetime64( 1, 's' )):
+            self.assertRaises( ValueError, digest, value )
+
+
+class TestHashJsonFile( TestCase ):
+    def expected( self, s ):
+        h = hashlib.md5( )
+        hash_json( h, json.loads( s ) )
+        return h.hexdigest( )
+
+    def actual( self, s, binary=False, **kwargs ):
+        h = hashlib.md5( )
+        f = io.BytesIO( s.encode( 'utf-8' ) ) if binary else io.StringIO( s )
+        hash_json_file( h, f, **kwargs )
+        return h.hexdigest( )
+
+    def test_reference( self ):
+        rng = random.Random( 0 )
+        for i in range( 300 ):
+            # Iterators are serialized as lists
+            s = json.dumps( random_document( rng ), default=list, ensure_ascii=rng.random( ) < 0.5,
+                            indent=rng.choice( [ None, 1 ] ) )
+            expected = self.expected( s )
+            for bufsize in (1, 7, 1024 * 1024):
+                for max_object_size in (1, 1024 * 1024):
+                    for binary in (False, True):
+                        self.assertEqual( expected, self.actual( s,
+                                                                 binary=binary,
+                                                                 bufsize=bufsize,
+                                                                 max_object_size=max_object_size ) )
+
+    def test_duplicate_keys( self ):
+        s = u'{"a": 1, "b": 2, "a": 3}'
+        self.assertEqual( self.expected( s ), self.actual( s ) )
+
+    def test_invalid( self ):
+        for s in (u'', u'[', u'[1,]', u'{"a" 1}', u'{"a": 1,}', u'{1: 2}', u'[1 2]', u'[1]]',
+                  u'"a', u'["\\x"]', u'[tru]', u'[}', u'{]', u':', u'1 2'):
+            self.assertRaises( ValueError, json.loads, s )
+            self.assertRaises( ValueError, self.actual, s )
+        # Valid JSON but not supported by hash_json()
+        self.assertRaises( ValueError, self.actual, u'{"a": null}' )
+
+    def test_memory( self ):
+        # An object too large to be buffered in memory, and an array of many small objects
+        value = [ { u'x': u'y' * 1000, u'z': i } for i in range( 4000 ) ]
+        value = { u'a%i' % i: value[ i ] for i in range( 2000 ) }, value
+        s = json.dumps( value )
+        self.assertGreater( len( s ), 6 * 1000 * 1000 )
+        expected = self.expected( s )
+        f = io.BytesIO( s.encode( 'utf-8' ) )
+        del value, s
+        bufsize = 64 * 1024
+        tracemalloc.start( )
+        try:
+            h = hashlib.md5( )
+            hash_json_file( h, f, max_object_size=bufsize, bufsize=bufsize )
+            _, peak = tracemalloc.get_traced_memory( )
+        finally:
+            tracemalloc.stop( )
+        self.assertEqual( expected, h.hexdigest( ) )
+        self.assertLess( peak, 16 * bufsize )
+
+
+class TestHashJsonMerkle( TestCase ):
+    def digest( self, value, **kwargs ):
+        h = hashlib.sha256( )
+        hash_json_merkle( h, value, **kwargs )
+        return h.hexdigest( )
+
+    def documents( self, n ):
+        rng = random.Random( 0 )
+        # Iterators can only be hashed once
+        return [ json.loads( json.dumps( random_document( rng ), default=list ) )
+            for _ in range( n ) ]
+
+    def test_distinct( self ):
+        values = [ 1, 1.0, u'1', True, [ ], { }, [ 1 ], [ [ 1 ] ], [ 1, 2 ], [ u'1', u'2' ],
+                   [ u'12' ], { u'1': 2 }, { u'12': 2 }, { u'1': [ 2 ] }, [ { u'1': 2 } ] ]
+        digests = set( self.digest( value ) for value in values )
+        self.assertEqual( len( values ), len( digests ) )
+
+    def test_pool( self ):
+        values = self.documents( 200 )
+        expected = list( map( self.digest, values ) )
+        with ThreadPoolExecutor( 4 ) as executor:
+            for chunks in (1, 3, 64):
+                self.assertEqual( expected, [ self.digest( value, pool=executor, chunks=chunks )
+                                                for value in values ] )
+        pool = Pool( 2 )
+        try:
+            self.assertEqual( expected, [ self.digest( value, pool=pool ) for value in values ] )
+        finally:
+            pool.close( )
+            pool.join( )
+
+    def test_cache( self ):
+        for pool in (None, ThreadPoolExecutor( 2 )):
+            value = { u'a': [ 1, { u'b': [ 2, 3 ] } ], u'c': { u'd': [ 4 ] }, u'e': 5 }
+            cache = MerkleCache( )
+            digest = self.digest( value, cache=cache, pool=pool )
+            self.assertEqual( digest, self.digest( value ) )
+            # Without invalidation, the stale digests of the modified children are used
+            value[ u'a' ][ 1 ][ u'b' ].append( 6 )
+            self.assertEqual( digest, self.digest( value, cache=cache, pool=pool ) )
+            # The first change was made above
+            for path, change in [ ((u'a', 1, u'b'), lambda: None),
+                                  ((u'c', u'd', 0), lambda: value[ u'c' ][ u'd' ].insert( 0, 7 )),
+                                  ((u'c', u'x'), lambda: value[ u'c' ].update( x=[ 8 ] )),
+                                  ((u'a',), lambda: value.update( a=9 )),
+                                  ((u'f',), lambda: value.update( f=[ ] )),
+                                  ((u'e',), lambda: value.pop( u'e' )),
+                                  ((), lambda: value.update( e={ } )) ]:
+                change( )
+                cache.invalidate( path )
+                self.assertEqual( self.digest( value ),
+                                  self.digest( value, cache=cache, pool=pool ) )
+
+    def test_deep( self ):
+        value = 0
+        for i in range( 100000 ):
+            value = [ value ] if i % 2 else { u'a': value }
+        self.digest( value )
+
+    def test_invalid( self ):
+        for value in ([ 1, object( ) ], { u'a': { 1: 2 } }, { u'a': None }):
+            self.assertRaises( ValueError, self.digest, value )
+
+    @skipIf( numpy is None, 'NumPy is not installed' )
+    def test_numpy( self ):
+        a = numpy.arange( 6, dtype='<f8' )
+        self.assertEqual( self.digest( [ a ] ), self.digest( [ a.astype( '>f8' ) ] ) )
+        self.assertNotEqual( self.digest( [ a ] ), self.digest( [ a.tolist( ) ] ) )
+        self.assertEqual( self.digest( [ numpy.float64( 1.5 ) ] ), self.digest( [ 1.5 ] ) )
+        self.assertEqual( self.digest( { u'a': b'x' } ),
+                          self.digest( { u'a': bytearray( b'x' ) } ) )
@@ -0,0 +1,121 @@
+from __future__ import division
+from builtins import range
+import random
+from unittest import TestCase, skipIf
+
+from bd2k.util.humanize import (SYMBOLS, bytes2human, bytes2human_many, human2bytes,
+                                human2bytes_many)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def reference_bytes2human( n, fmt='%(value).1f %(symbol)s', symbols='customary' ):
+    """
+    The bytes2human() of old
+    """
+    n = int( n )
+    if n < 0:
+        raise ValueError( "n < 0" )
+    symbols = SYMBOLS[ symbols ]
+    prefix = { }
+    for i, s in enumerate( symbols[ 1: ] ):
+        prefix[ s ] = 1 << (i + 1) * 10
+    for symbol in reversed( symbols[ 1: ] ):
+        if n >= prefix[ symbol ]:
+            value = float( n ) / prefix[ symbol ]
+            return fmt % locals( )
+    return fmt % dict( symbol=symbols[ 0 ], value=n )
+
+
+def reference_human2bytes( s ):
+    """
+    The human2bytes() of old
+    """
+    init = s
+    num = ""
+    while s and s[ 0:1 ].isdigit( ) or s[ 0:1 ] == '.':
+        num += s[ 0 ]
+        s = s[ 1: ]
+    num = float( num )
+    letter = s.strip( )
+    for name in ('customary', 'customary_ext', 'iec', 'iec_ext'):
+        sset = SYMBOLS[ name ]
+        if letter in sset:
+            break
+    else:
+        if letter == 'k':
+            sset = SYMBOLS[ 'customary' ]
+            letter = letter.upper( )
+        else:
+            raise ValueError( "can't interpret %r" % init )
+    prefix = { sset[ 0 ]: 1 }
+    for i, s in enumerate( sset[ 1: ] ):
+        prefix[ s ] = 1 << (i + 1) * 10
+    return int( num * prefix[ letter ] )
+
+
+class TestHumanize( TestCase ):
+    def setUp( self ):
+        super( TestHumanize, self ).setUp( )
+        self.sizes = [ 0, 1, 1023, 1024, 1025, 2 ** 100 ] + [
+            random.randrange( 2 ** random.randrange( 1, 95 ) ) for _ in range( 1000 ) ]
+
+    def test_bytes2human( self ):
+        for symbols in ('customary', 'customary_ext', 'iec', 'iec_ext'):
+            for fmt in ('%(value).1f %(symbol)s', '%(value)s%(symbol)s'):
+                for n in self.sizes:
+                    self.assertEqual( reference_bytes2human( n, fmt, symbols ),
+                                      bytes2human( n, fmt, symbols ) )
+        self.assertRaises( ValueError, bytes2human, -1 )
+
+    def test_human2bytes( self ):
+        for symbols in ('customary', 'customary_ext', 'iec', 'iec_ext'):
+            for n in self.sizes:
+                for s in (bytes2human( n, symbols=symbols ),
+                          bytes2human( n, fmt='%(value).3f%(symbol)s', symbols=symbols )):
+                    self.assertEqual( reference_human2bytes( s ), human2bytes( s ) )
+        for s in ('', 'K', ' 1K', '1.2.3K', '12 foo', '1 kb'):
+            self.assertRaises( ValueError, human2bytes, s )
+
+    def test_si( self ):
+        self.assertEqual( bytes2human( 999, symbols='si' ), '999.0 B' )
+        self.assertEqual( bytes2human( 1000, symbols='si' ), '1.0 kB' )
+        self.assertEqual( bytes2human( 1500 * 1000 ** 2, symbols='si' ), '1.5 GB' )
+        self.assertEqual( human2bytes( '1 B' ), 1 )
+        self.assertEqual( human2bytes( '1.5 MB' ), 1500000 )
+        self.assertEqual( human2bytes( '2kB' ), 2000 )
+
+    def test_many( self ):
+        for symbols in ('customary', 'si'):
+            strings = bytes2human_many( self.sizes, symbols=symbols )
+            self.assertEqual( [ bytes2human( n, symbols=symbols ) for n in self.sizes ], strings )
+            self.assertEqual( list( map( human2bytes, strings ) ), human2bytes_many( strings ) )
+
+    @skipIf( numpy is None, 'NumPy is not installed' )
+    def test_many_array( self ):
+        for dtype in ('i8', 'u8', 'i2', 'f8'):
+            limit = numpy.finfo( dtype ).max if dtype == 'f8' else numpy.iinfo( dtype ).max
+            sizes = numpy.array( [ n for n in self.sizes if n <= limit ], dtype=dtype )
+            for symbols in ('customary', 'iec', 'si'):
+                strings = bytes2human_many( sizes, symbols=symbols )
+                self.assertIsInstance( strings, numpy.ndarray )
+                self.assertEqual( [ bytes2human( n, symbols=symbols ) for n in sizes.tolist( ) ],
+                                  strings.tolist( ) )
+                self.assertEqual( list( map( human2bytes, strings.tolist( ) ) ),
+                                  human2bytes_many( strings ).tolist( ) )
+        self.assertRaises( ValueError, bytes2human_many, numpy.array( [ 1, -1 ] ) )
+
+    @skipIf( numpy is None, 'NumPy is not installed' )
+    def test_many_shape( self ):
+        for dtype in ('i8', 'f8'):
+            for shape in ((2, 3), (0, 2), ()):
+                sizes = numpy.arange( int( numpy.prod( shape ) ), dtype=dtype ) * 1000
+                sizes = sizes.reshape( shape )
+                strings = bytes2human_many( sizes )
+                self.assertEqual( strings.shape, shape )
+                expected = [ bytes2human( int( n ) ) for n in sizes.ravel( ).tolist( ) ]
+                self.assertEqual( strings.ravel( ).tolist( ), expected )
+                self.assertEqual( human2bytes_many( strings ).shape, shape )
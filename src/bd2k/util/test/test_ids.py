@@ -0,0 +1,107 @@
+from builtins import range
+from collections import namedtuple
+from unittest import TestCase
+
+from mock import patch
+
+from bd2k.util import (_unknown_gids, _unknown_uids, gid_to_name, gids_to_names,
+                       id_enumeration_threshold, uid_to_name, uids_to_names)
+
+User = namedtuple( 'User', [ 'pw_name', 'pw_uid' ] )
+Group = namedtuple( 'Group', [ 'gr_name', 'gr_gid' ] )
+
+
+class FakeDatabase( object ):
+    """
+    A user database whose enumeration only lists some of the users it can look up, like a name
+    service that limits enumeration does, counting the lookups and enumerations made
+    """
+
+    def __init__( self, users, enumerated ):
+        super( FakeDatabase, self ).__init__( )
+        self.users = { uid: User( name, uid ) for uid, name in users.items( ) }
+        self.enumerated = enumerated
+        self.lookups = [ ]
+        self.enumerations = 0
+
+    def getpwuid( self, uid ):
+        self.lookups.append( uid )
+        return self.users[ uid ]
+
+    def getpwall( self ):
+        self.enumerations += 1
+        return [ self.users[ uid ] for uid in self.enumerated ]
+
+
+class TestIdResolution( TestCase ):
+    base = 1000000
+
+    def setUp( self ):
+        super( TestIdResolution, self ).setUp( )
+        self.clear( )
+
+    def tearDown( self ):
+        self.clear( )
+        super( TestIdResolution, self ).tearDown( )
+
+    def clear( self ):
+        for f in (uid_to_name, gid_to_name):
+            f.cache_clear( )
+        for cache in (_unknown_uids, _unknown_gids):
+            cache.clear( )
+
+    def resolve( self, db, uids ):
+        with patch( 'pwd.getpwuid', db.getpwuid ), patch( 'pwd.getpwall', db.getpwall ):
+            return uids_to_names( uids )
+
+    def test_enumeration( self ):
+        """
+        Many missing IDs are resolved by enumerating the database once, the IDs the enumeration
+        didn't list are looked up separately.
+        """
+        uids = list( range( self.base, self.base + 30 ) )
+        users = { uid: 'user%i' % uid for uid in uids[ :25 ] }
+        db = FakeDatabase( users, enumerated=uids[ :20 ] )
+        self.assertEqual( self.resolve( db, uids ), users )
+        self.assertEqual( db.enumerations, 1 )
+        self.assertEqual( sorted( db.lookups ), uids[ 20: ] )
+        info = uid_to_name.cache_info( )
+        self.assertEqual( (info.hits, info.misses, info.currsize), (0, 25, 25) )
+        # Both the results and the unknown IDs are cached now
+        self.assertEqual( self.resolve( db, uids ), users )
+        self.assertEqual( (db.enumerations, len( db.lookups )), (1, 10) )
+        info = uid_to_name.cache_info( )
+        self.assertEqual( (info.hits, info.misses), (30, 25) )
+        # Single lookups use the same cache
+        with patch( 'pwd.getpwuid', db.getpwuid ):
+            self.assertEqual( uid_to_name( uids[ 0 ] ), users[ uids[ 0 ] ] )
+        self.assertEqual( len( db.lookups ), 10 )
+
+    def test_few_missing( self ):
+        """
+        A few missing IDs are looked up separately, without enumerating the database.
+        """
+        uids = list( range( self.base, self.base + id_enumeration_threshold ) )
+        users = { uid: 'user%i' % uid for uid in uids }
+        db = FakeDatabase( users, enumerated=uids )
+        self.assertEqual( self.resolve( db, uids + uids ), users )
+        self.assertEqual( db.enumerations, 0 )
+        self.assertEqual( sorted( db.lookups ), uids )
+
+    def test_unknown_ids( self ):
+        """
+        Bulk lookups of unknown IDs don't repeat the individual lookups or the enumeration.
+        """
+        uids = list( range( self.base, self.base + 100 ) )
+        db = FakeDatabase( { }, enumerated=[ ] )
+        self.assertEqual( self.resolve( db, uids ), { } )
+        self.assertEqual( (len( db.lookups ), db.enumerations), (100, 1) )
+        self.assertEqual( self.resolve( db, uids ), { } )
+        self.assertEqual( (len( db.lookups ), db.enumerations), (100, 1) )
+
+    def test_groups( self ):
+        gids = list( range( self.base, self.base + 20 ) )
+        groups = [ Group( 'group%i' % gid, gid ) for gid in gids ]
+        with patch( 'grp.getgrall', lambda: groups ):
+            self.assertEqual( gids_to_names( gids ), { g.gr_gid: g.gr_name for g in groups } )
+        self.assertEqual( gid_to_name.cache_info( ).misses, 20 )
@@ -0,0 +1,48 @@
+from builtins import range
+import datetime
+import random
+from unittest import TestCase, skipIf
+
+from bd2k.util import parse_iso_utc, parse_iso_utc_many
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TestParseIsoUtc( TestCase ):
+    def setUp( self ):
+        super( TestParseIsoUtc, self ).setUp( )
+        start = datetime.datetime( 1970, 1, 1 )
+        self.times = [ start + datetime.timedelta( microseconds=random.randrange( 2 ** 52 ) )
+            for _ in range( 1000 ) ]
+
+    def test_utc( self ):
+        for t in self.times:
+            s = t.isoformat( ) + 'Z'
+            self.assertEqual( parse_iso_utc( s ), t )
+            self.assertEqual( parse_iso_utc( s ),
+                              datetime.datetime.strptime( s, '%Y-%m-%dT%H:%M:%S' +
+                                                          ('.%f' if t.microsecond else '') + 'Z' ) )
+
+    def test_offset( self ):
+        for t in self.times:
+            minutes = random.randrange( -24 * 60 + 1, 24 * 60 )
+            offset = datetime.timedelta( minutes=minutes )
+            s = (t + offset).isoformat( ) + '%s%02i:%02i' % ('-' if minutes < 0 else '+',
+                                                             abs( minutes ) // 60,
+                                                             abs( minutes ) % 60)
+            self.assertEqual( parse_iso_utc( s ), t )
+
+    def test_many( self ):
+        strings = [ t.isoformat( ) + 'Z' for t in self.times ]
+        self.assertEqual( parse_iso_utc_many( strings ), self.times )
+        self.assertEqual( parse_iso_utc_many( iter( strings ) ), self.times )
+
+    @skipIf( numpy is None, 'NumPy is not installed' )
+    def test_datetime64( self ):
+        strings = numpy.array( [ t.isoformat( ) + 'Z' for t in self.times ] )
+        array = parse_iso_utc_many( strings, datetime64=True )
+        self.assertEqual( array.dtype, numpy.dtype( 'datetime64[us]' ) )
+        self.assertEqual( array.tolist( ), self.times )
@@ -0,0 +1,100 @@
+from builtins import range
+import random
+import sys
+from unittest import TestCase
+
+from bd2k.util.d32 import standard as d32
+from bd2k.util.keys import decode, encode, pack, pack_int, unpack, unpack_int
+
+
+# The random keys in these tests are reproducible, each test reseeds this generator
+rng = random.Random( )
+
+
+def random_int( ):
+    bits = rng.choice( [ 1, 7, 8, 9, 63, 64, 65, 200 ] )
+    return rng.randrange( -2 ** bits, 2 ** bits )
+
+
+def random_float( ):
+    return rng.choice( [
+        lambda: rng.uniform( -1, 1 ),
+        lambda: rng.uniform( -1, 1 ) * 10 ** rng.randrange( -300, 300 ),
+        lambda: rng.choice( [ float( 'inf' ), float( '-inf' ), 0.0, sys.float_info.min ] ),
+        lambda: float( random_int( ) ) ] )( )
+
+
+def random_str( ):
+    return ''.join( rng.choice( [ '\0', 'a', 'b', u'é', u'￿', u'\U0001f600' ] )
+                    for _ in range( rng.randrange( 4 ) ) )
+
+
+def random_bytes( ):
+    return bytes( bytearray( rng.getrandbits( 8 ) for _ in range( rng.randrange( 4 ) ) )
+                  ).replace( b'\1', b'\0' )
+
+
+def random_tuple( ):
+    return tuple( rng.randrange( -1, 2 ) for _ in range( rng.randrange( 3 ) ) )
+
+
+def small_int( ):
+    # Makes for many keys with a common prefix
+    return rng.randrange( -2, 3 )
+
+
+class TestKeys( TestCase ):
+    def setUp( self ):
+        super( TestKeys, self ).setUp( )
+        rng.seed( 0 )
+
+    def test_order( self ):
+        """
+        The order of the encodings must match the native order for keys whose elements at each
+        position are of the same type.
+        """
+        schema = [ small_int, random_str, random_tuple, random_bytes, random_float, random_int ]
+        keys = [ tuple( f( ) for f in schema[ :rng.randrange( len( schema ) + 1 ) ] )
+            for _ in range( 10000 ) ]
+        expected = sorted( keys )
+        self.assertEqual( sorted( keys, key=pack ), expected )
+        self.assertEqual( sorted( keys, key=encode ), expected )
+        self.assertEqual( sorted( keys, key=lambda k: encode( k, codec=d32 ) ), expected )
+        for key in keys:
+            self.assertEqual( unpack( pack( key ) ), key )
+            self.assertEqual( decode( encode( key ) ), key )
+
+    def test_scalar_order( self ):
+        for f in (random_int, random_float, random_str, random_bytes):
+            values = [ f( ) for _ in range( 10000 ) ]
+            self.assertEqual( sorted( values, key=pack ), sorted( values ) )
+
+    def test_pack_int( self ):
+        for size in (2, 8, 16):
+            values = [ rng.randrange( 2 ** (8 * size) ) for _ in range( 1000 ) ]
+            packed = [ pack_int( value, size=size ) for value in values ]
+            self.assertEqual( set( map( len, packed ) ), { size } )
+            self.assertEqual( sorted( packed ), [ pack_int( v, size=size ) for v in sorted( values ) ] )
+            self.assertEqual( list( map( unpack_int, packed ) ), values )
+        self.assertRaises( ValueError, pack_int, 2 ** 16, size=2 )
+
+    def test_pack_signed_int( self ):
+        for size in (1, 2, 8, 16):
+            limit = 2 ** (8 * size - 1)
+            values = [ rng.randrange( -limit, limit ) for _ in range( 1000 ) ]
+            values += [ -limit, -1, 0, limit - 1 ]
+            packed = [ pack_int( value, size=size, signed=True ) for value in values ]
+            self.assertEqual( set( map( len, packed ) ), { size } )
+            self.assertEqual( sorted( packed ),
+                              [ pack_int( v, size=size, signed=True ) for v in sorted( values ) ] )
+            self.assertEqual( [ unpack_int( b, signed=True ) for b in packed ], values )
+            for value in (-limit - 1, limit):
+                self.assertRaises( ValueError, pack_int, value, size=size, signed=True )
+
+    def test_none( self ):
+        for key in ((None,), (1, None, 'a'), ((None, (None,)), None)):
+            self.assertEqual( unpack( pack( key ) ), key )
+
+    def test_invalid( self ):
+        for b in (b'\x15', b'\x21\x00', b'\x05\x14', b'\xff', b'\x1d\x09\x01'):
+            self.assertRaises( ValueError, unpack, b )
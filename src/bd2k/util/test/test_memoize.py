@@ -0,0 +1,441 @@
+from builtins import range
+import copy
+import gc
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from multiprocessing import Pool
+from unittest import TestCase
+
+from mock import patch
+
+from bd2k.util import disk_memoize, memoize, memoize_method, sync_memoize
+from bd2k.util.cache import Cache, DiskCache, all_cache_info, memoized_functions
+from bd2k.util.objects import InnerClass
+
+
+class Clock( object ):
+    """
+    A fake replacement for bd2k.util.cache.now()
+    """
+
+    def __init__( self ):
+        self.time = 1000.0
+
+    def __call__( self ):
+        return self.time
+
+
+class TestMemoize( TestCase ):
+    def setUp( self ):
+        super( TestMemoize, self ).setUp( )
+        self.clock = Clock( )
+        self.patch = patch( 'bd2k.util.cache.now', self.clock )
+        self.patch.start( )
+        self.calls = [ ]
+
+    def tearDown( self ):
+        self.patch.stop( )
+        super( TestMemoize, self ).tearDown( )
+
+    def f( self, x ):
+        self.calls.append( x )
+        return x
+
+    def test_unbounded( self ):
+        for decorator in (memoize, sync_memoize):
+            del self.calls[ : ]
+            f = decorator( self.f )
+            for i in range( 100 ):
+                f( i % 10 )
+            self.assertEqual( self.calls, list( range( 10 ) ) )
+
+    def test_lru( self ):
+        for decorator in (memoize, sync_memoize):
+            del self.calls[ : ]
+            f = decorator( self.f, maxsize=3 )
+            for i in [ 1, 2, 3, 1, 4, 1, 2 ]:
+                f( i )
+            self.assertEqual( self.calls, [ 1, 2, 3, 4, 2 ] )
+
+    def test_fifo( self ):
+        for decorator in (memoize, sync_memoize):
+            del self.calls[ : ]
+            f = decorator( self.f, maxsize=3, policy='fifo' )
+            for i in [ 1, 2, 3, 1, 4, 1, 2 ]:
+                f( i )
+            self.assertEqual( self.calls, [ 1, 2, 3, 4, 1, 2 ] )
+
+    def test_lru_without_move_to_end( self ):
+        """
+        The reordering of entries used on Python 2, whose OrderedDict lacks move_to_end().
+        """
+        with patch( 'bd2k.util.cache._atomic_move_to_end', False ):
+            self.test_lru( )
+            del self.calls[ : ]
+            self.test_lru_ttl( )
+            cache = Cache( maxsize=2 )
+            cache.put( 1, 1 )
+            cache.put( 2, 2 )
+            cache.put( 1, 3 )
+            self.assertEqual( list( cache.data.items( ) ), [ (2, 2), (1, 3) ] )
+
+    def test_zero_maxsize( self ):
+        f = memoize( self.f, maxsize=0 )
+        f( 1 )
+        f( 1 )
+        self.assertEqual( self.calls, [ 1, 1 ] )
+
+    def test_ttl( self ):
+        for decorator in (memoize, sync_memoize):
+            del self.calls[ : ]
+            f = decorator( self.f, ttl=10 )
+            f( 1 )
+            self.clock.time += 5
+            f( 2 )
+            f( 1 )
+            self.clock.time += 5
+            f( 1 )
+            f( 2 )
+            self.clock.time += 5
+            f( 2 )
+            self.assertEqual( self.calls, [ 1, 2, 1, 2 ] )
+
+    def test_purge( self ):
+        cache = Cache( ttl=10 )
+        for i in range( 100 ):
+            cache.put( i, i )
+        self.clock.time += 10
+        cache.put( 100, 100 )
+        # All but the most recent entry should have been purged
+        self.assertEqual( list( cache.data ), [ 100 ] )
+        self.assertEqual( cache.evictions, 100 )
+
+    def test_lru_ttl( self ):
+        f = memoize( self.f, maxsize=2, ttl=10 )
+        f( 1 )
+        f( 2 )
+        self.clock.time += 5
+        f( 1 )
+        f( 3 )
+        self.clock.time += 5
+        f( 1 )
+        self.assertEqual( self.calls, [ 1, 2, 3, 1 ] )
+
+
+    def test_cache_info( self ):
+        for decorator in (memoize, sync_memoize):
+            f = decorator( self.f, maxsize=2 )
+            for i in [ 1, 2, 1, 3, 2 ]:
+                f( i )
+            info = f.cache_info( )
+            self.assertEqual( (info.hits, info.misses, info.maxsize, info.currsize, info.evictions),
+                              (1, 4, 2, 2, 2) )
+            self.assertTrue( info.miss_time >= 0 )
+            self.assertIn( f, memoized_functions( ) )
+            f.cache_clear( )
+            self.assertEqual( f.cache_info( ).currsize, 0 )
+
+    def test_keyword_arguments( self ):
+        for decorator in (memoize, sync_memoize):
+            calls = [ ]
+
+            @decorator
+            def f( x, y=0, z=0 ):
+                calls.append( (x, y, z) )
+                return x + y + z
+
+            self.assertEqual( f( 1, y=2, z=3 ), 6 )
+            self.assertEqual( f( 1, z=3, y=2 ), 6 )
+            self.assertEqual( f( 1 ), 1 )
+            self.assertEqual( f( 1, y=0 ), 1 )
+            self.assertEqual( calls, [ (1, 2, 3), (1, 0, 0), (1, 0, 0) ] )
+
+    def test_typed( self ):
+        for decorator in (memoize, sync_memoize):
+            f = decorator( repr, typed=True )
+            self.assertEqual( [ f( 1 ), f( 1.0 ), f( True ) ], [ '1', '1.0', 'True' ] )
+            f = decorator( repr )
+            self.assertEqual( [ f( 1 ), f( 1.0 ), f( True ) ], [ '1', '1', '1' ] )
+
+    def test_freeze( self ):
+        for decorator in (memoize, sync_memoize):
+            del self.calls[ : ]
+            f = decorator( self.f )
+            self.assertRaises( TypeError, f, [ 1 ] )
+            f = decorator( self.f, freeze=True )
+            for x in ([ 1 ], { 'a': [ 1 ] }, { 1 }, [ 1 ], { 'a': [ 1 ] }, { 1 }, (1,), 1):
+                f( x )
+            self.assertEqual( self.calls, [ [ 1 ], { 'a': [ 1 ] }, { 1 }, (1,), 1 ] )
+
+    def test_registry( self ):
+        @memoize
+        def registered( x ):
+            return x
+
+        registered( 1 )
+        name = 'bd2k.util.test.test_memoize.TestMemoize.test_registry.<locals>.registered'
+        self.assertEqual( all_cache_info( )[ name ].misses, 1 )
+        del registered
+        self.assertNotIn( name, all_cache_info( ) )
+
+
+class TestSyncMemoize( TestCase ):
+    def test_single_flight( self ):
+        """
+        Concurrent callers with the same arguments share one invocation while a blocked
+        invocation doesn't block callers with other arguments.
+        """
+        calls = [ ]
+        release = threading.Event( )
+
+        @sync_memoize
+        def f( x ):
+            calls.append( x )
+            if x == 'slow':
+                assert release.wait( 10 )
+            return x.upper( )
+
+        results = [ ]
+        threads = [ threading.Thread( target=lambda: results.append( f( 'slow' ) ) )
+            for _ in range( 8 ) ]
+        for thread in threads:
+            thread.start( )
+        # This would block forever if the slow invocation held a global lock
+        self.assertEqual( f( 'fast' ), 'FAST' )
+        release.set( )
+        for thread in threads:
+            thread.join( )
+        self.assertEqual( results, [ 'SLOW' ] * 8 )
+        self.assertEqual( sorted( calls ), [ 'fast', 'slow' ] )
+
+    def test_exception( self ):
+        """
+        Waiting callers get the exception, the next caller tries again.
+        """
+        calls = [ ]
+        started, release = threading.Event( ), threading.Event( )
+
+        @sync_memoize
+        def f( x ):
+            calls.append( x )
+            if len( calls ) == 1:
+                started.set( )
+                assert release.wait( 10 )
+                raise RuntimeError( 'first' )
+            return x
+
+        errors = [ ]
+
+        def g( ):
+            try:
+                f( 1 )
+            except RuntimeError as e:
+                errors.append( str( e ) )
+
+        owner = threading.Thread( target=g )
+        owner.start( )
+        assert started.wait( 10 )
+        waiter = threading.Thread( target=g )
+        waiter.start( )
+        # Give the waiter a chance to join the flight before it crashes
+        time.sleep( .1 )
+        release.set( )
+        owner.join( )
+        waiter.join( )
+        self.assertEqual( errors, [ 'first' ] * 2 )
+        self.assertEqual( f( 1 ), 1 )
+        self.assertEqual( calls, [ 1, 1 ] )
+
+    def test_reentrant( self ):
+        depth = [ ]
+
+        @sync_memoize
+        def f( x ):
+            depth.append( x )
+            return f( x ) if len( depth ) < 3 else len( depth )
+
+        self.assertEqual( f( 0 ), 3 )
+        self.assertEqual( f( 0 ), 3 )
+
+
+def put_and_get( path, i ):
+    cache = DiskCache( path, max_bytes=1024 * 1024 )
+    key = ('key', i % 10)
+    value = str( i % 10 ) * 10000
+    try:
+        return cache.get( key ) == value
+    except KeyError:
+        cache.put( key, value )
+        return cache.get( key ) == value
+
+
+class TestDiskMemoize( TestCase ):
+    def setUp( self ):
+        super( TestDiskMemoize, self ).setUp( )
+        self.path = tempfile.mkdtemp( )
+
+    def tearDown( self ):
+        shutil.rmtree( self.path )
+        super( TestDiskMemoize, self ).tearDown( )
+
+    def test_memoize( self ):
+        calls = [ ]
+
+        def f( x, y=None ):
+            calls.append( x )
+            return [ x, y ]
+
+        g = disk_memoize( self.path, freeze=True )( f )
+        self.assertEqual( g( 1, y={ 'a': 2 } ), [ 1, { 'a': 2 } ] )
+        self.assertEqual( g( 1, y={ 'a': 2 } ), [ 1, { 'a': 2 } ] )
+        # Simulate a restart
+        g = disk_memoize( self.path, freeze=True )( f )
+        self.assertEqual( g( 1, y={ 'a': 2 } ), [ 1, { 'a': 2 } ] )
+        self.assertEqual( g( 2 ), [ 2, None ] )
+        self.assertEqual( calls, [ 1, 2 ] )
+        info = g.cache_info( )
+        self.assertEqual( (info.hits, info.misses, info.currsize), (1, 1, 2) )
+
+    def test_eviction( self ):
+        max_bytes = 64 * 1024
+        cache = DiskCache( self.path, max_bytes=max_bytes )
+        for i in range( 200 ):
+            cache.put( i, os.urandom( 1024 ) )
+        size = sum( os.path.getsize( path ) for path in cache._entries( ) )
+        self.assertTrue( size <= max_bytes + max_bytes // 16 + 1024 )
+        self.assertTrue( cache.evictions > 0 )
+        self.assertEqual( len( cache.get( 199 ) ), 1024 )
+
+    def test_concurrency( self ):
+        pool = Pool( 8 )
+        try:
+            results = pool.starmap( put_and_get, [ (self.path, i) for i in range( 400 ) ] )
+        finally:
+            pool.close( )
+            pool.join( )
+        self.assertTrue( all( results ) )
+        self.assertEqual( DiskCache( self.path ).info( ).currsize, 10 )
+
+
+class Foo( object ):
+    @memoize_method
+    def f( self, x ):
+        return [ x ]
+
+
+class Point( object ):
+    def __init__( self, x ):
+        self.x = x
+
+    def __eq__( self, other ):
+        return self.__dict__ == other.__dict__
+
+    @memoize_method
+    def scaled( self, factor ):
+        return self.x * factor
+
+
+class SlottedFoo( object ):
+    __slots__ = ('__weakref__',)
+
+    @memoize_method
+    def f( self, x ):
+        return [ x ]
+
+
+class Outer( object ):
+    def __init__( self ):
+        self.x = 1
+
+    def __eq__( self, other ):
+        return self.__dict__ == other.__dict__
+
+    @InnerClass
+    class Inner( object ):
+        pass
+
+
+class TestMemoizeMethod( TestCase ):
+    def test_memoize( self ):
+        for cls in (Foo, SlottedFoo):
+            foo, bar = cls( ), cls( )
+            self.assertIs( foo.f( 1 ), foo.f( 1 ) )
+            self.assertIsNot( foo.f( 1 ), bar.f( 1 ) )
+            self.assertEqual( foo.f( 1 ), bar.f( 1 ) )
+
+    def test_pickle( self ):
+        foo = Foo( )
+        result = foo.f( 1 )
+        self.assertIsNot( pickle.loads( pickle.dumps( foo ) ).f( 1 ), result )
+
+    def test_copy( self ):
+        """
+        A copy doesn't share the results of the original.
+        """
+        point = Point( 1 )
+        self.assertEqual( point.scaled( 2 ), 2 )
+        other = copy.copy( point )
+        other.x = 3
+        self.assertEqual( other.scaled( 2 ), 6 )
+        self.assertEqual( other.scaled( 3 ), 9 )
+        self.assertEqual( point.scaled( 2 ), 2 )
+        self.assertEqual( point.scaled( 3 ), 3 )
+
+    def test_state( self ):
+        """
+        The results aren't part of the instance's state.
+        """
+        point = Point( 1 )
+        point.scaled( 2 )
+        self.assertEqual( vars( point ), { 'x': 1 } )
+        other = pickle.loads( pickle.dumps( point ) )
+        self.assertEqual( vars( other ), { 'x': 1 } )
+        self.assertEqual( other, point )
+        self.assertEqual( other.scaled( 2 ), 2 )
+
+    def test_memory( self ):
+        """
+        Create and drop a million instances, expecting no significant growth in memory.
+        """
+        for cls in (Foo, SlottedFoo):
+            cls( ).f( 0 )
+            gc.collect( )
+            before = sys.getallocatedblocks( )
+            for i in range( 1000000 ):
+                cls( ).f( i )
+            gc.collect( )
+            self.assertLess( sys.getallocatedblocks( ) - before, 1000 )
+
+    def test_inner_class( self ):
+        """
+        Bound inner classes must not keep their outer instance alive.
+        """
+        outers = [ Outer( ) for _ in range( 100 ) ]
+        refs = [ weakref.ref( outer ) for outer in outers ]
+        for outer in outers:
+            self.assertIs( outer.Inner( ).__class__, outer.Inner( ).__class__ )
+        del outers, outer
+        gc.collect( )
+        self.assertEqual( [ ref( ) for ref in refs ], [ None ] * 100 )
+
+    def test_inner_class_state( self ):
+        """
+        Binding inner classes doesn't change the state of the outer instance.
+        """
+        outer = Outer( )
+        inner = outer.Inner( )
+        self.assertEqual( vars( outer ), { 'x': 1 } )
+        self.assertEqual( pickle.loads( pickle.dumps( outer ) ), outer )
+        other = copy.copy( outer )
+        self.assertEqual( other, outer )
+        self.assertIs( other.Inner( ).outer, other )
+        self.assertIsNot( other.Inner, outer.Inner )
+        self.assertIs( outer.Inner( ).__class__, inner.__class__ )
+        self.assertIs( inner.outer, outer )
+
@@ -0,0 +1,263 @@
+from __future__ import absolute_import
+
+import threading
+import time
+from builtins import range
+from unittest import TestCase
+
+from bd2k.util.retry import (CircuitBreaker, CircuitOpenError, RetryBudget, RetryMetrics,
+                             RetryObserver, retry)
+
+always = lambda _: True
+
+
+class Flaky( object ):
+    """
+    An operation that fails a given number of times, counting the attempts made at it
+    """
+
+    def __init__( self, failures ):
+        super( Flaky, self ).__init__( )
+        self.failures = failures
+        self.attempts = 0
+        self.lock = threading.Lock( )
+
+    def __call__( self ):
+        with self.lock:
+            self.attempts += 1
+            if self.attempts <= self.failures:
+                raise RuntimeError( 'attempt %i' % self.attempts )
+
+
+def run( operation, **kwargs ):
+    for attempt in retry( delays=[ 0 ], timeout=10, predicate=always, **kwargs ):
+        with attempt:
+            operation( )
+
+
+class TestRetryBudget( TestCase ):
+    def test_ratio( self ):
+        budget = RetryBudget( ratio=0.5, min_per_second=0 )
+        for _ in range( 9 ):
+            run( Flaky( 0 ), budget=budget )
+        # Ten operations, including the failing one, pay for five retries
+        operation = Flaky( 100 )
+        self.assertRaises( RuntimeError, run, operation, budget=budget )
+        self.assertEqual( operation.attempts, 6 )
+        # Eleven operations pay for five and a half, the twelfth is refused
+        operation = Flaky( 100 )
+        self.assertRaises( RuntimeError, run, operation, budget=budget )
+        self.assertEqual( operation.attempts, 2 )
+        operation = Flaky( 100 )
+        self.assertRaises( RuntimeError, run, operation, budget=budget )
+        self.assertEqual( operation.attempts, 1 )
+
+    def test_minimum( self ):
+        budget = RetryBudget( ratio=0, min_per_second=0.5, window=4 )
+        operation = Flaky( 1 )
+        run( operation, budget=budget )
+        self.assertEqual( operation.attempts, 2 )
+        operation = Flaky( 100 )
+        self.assertRaises( RuntimeError, run, operation, budget=budget )
+        self.assertEqual( operation.attempts, 2 )
+
+    def test_threads( self ):
+        """
+        The budget limits the retries made by all threads sharing it.
+        """
+        budget = RetryBudget( ratio=0.1, min_per_second=0 )
+        operations = [ Flaky( 100 ) for _ in range( 20 ) ]
+
+        def target( operation ):
+            try:
+                run( operation, budget=budget )
+            except RuntimeError:
+                pass
+
+        threads = [ threading.Thread( target=target, args=(operation,) )
+            for operation in operations ]
+        for thread in threads:
+            thread.start( )
+        for thread in threads:
+            thread.join( )
+        retries = sum( operation.attempts - 1 for operation in operations )
+        self.assertLessEqual( retries, 2 )
+
+    def test_window( self ):
+        budget = RetryBudget( ratio=0, min_per_second=1, window=1 )
+        self.assertTrue( budget.withdraw( ) )
+        self.assertFalse( budget.withdraw( ) )
+        time.sleep( 1 )
+        self.assertTrue( budget.withdraw( ) )
+
+
+class TestCircuitBreaker( TestCase ):
+    def test_open( self ):
+        breaker = CircuitBreaker( threshold=3, reset_timeout=60 )
+        operation = Flaky( 100 )
+        self.assertRaises( RuntimeError, run, operation, breaker=breaker )
+        # The retries stop once the circuit opens
+        self.assertEqual( operation.attempts, 3 )
+        self.assertFalse( breaker.closed( ) )
+        # Subsequent operations fail fast
+        operation = Flaky( 0 )
+        self.assertRaises( CircuitOpenError, run, operation, breaker=breaker )
+        self.assertEqual( operation.attempts, 0 )
+
+    def test_success_resets( self ):
+        breaker = CircuitBreaker( threshold=3, reset_timeout=60 )
+        for _ in range( 5 ):
+            run( Flaky( 2 ), breaker=breaker )
+        self.assertTrue( breaker.closed( ) )
+
+    def test_unretryable( self ):
+        """
+        Failures the predicate doesn't accept don't open the circuit.
+        """
+        breaker = CircuitBreaker( threshold=1, reset_timeout=60 )
+        for _ in range( 3 ):
+            try:
+                for attempt in retry( delays=[ 0 ], timeout=10, breaker=breaker ):
+                    with attempt:
+                        raise KeyError( )
+            except KeyError:
+                pass
+        self.assertTrue( breaker.closed( ) )
+
+    def test_probe( self ):
+        breaker = CircuitBreaker( threshold=1, reset_timeout=.2 )
+        self.assertRaises( RuntimeError, run, Flaky( 100 ), breaker=breaker )
+        self.assertRaises( CircuitOpenError, breaker.before )
+        time.sleep( .2 )
+        # A failed probe opens the circuit again
+        operation = Flaky( 100 )
+        self.assertRaises( RuntimeError, run, operation, breaker=breaker )
+        self.assertEqual( operation.attempts, 1 )
+        self.assertRaises( CircuitOpenError, breaker.before )
+        time.sleep( .2 )
+        # Only one probe at a time
+        breaker.before( )
+        self.assertRaises( CircuitOpenError, breaker.before )
+        # A successful probe closes the circuit
+        breaker.success( )
+        self.assertTrue( breaker.closed( ) )
+        run( Flaky( 0 ), breaker=breaker )
+
+    def test_lost_probe( self ):
+        """
+        If the outcome of a probe isn't reported, another probe is let through eventually.
+        """
+        breaker = CircuitBreaker( threshold=1, reset_timeout=.2 )
+        breaker.failure( )
+        time.sleep( .2 )
+        breaker.before( )
+        self.assertRaises( CircuitOpenError, breaker.before )
+        time.sleep( .2 )
+        breaker.before( )
+
+
+class Recorder( RetryObserver ):
+    def __init__( self ):
+        super( Recorder, self ).__init__( )
+        self.events = [ ]
+
+    def attempt_started( self, site, attempt ):
+        self.events.append( ('started', site, attempt) )
+
+    def attempt_failed( self, site, attempt, exception, duration ):
+        self.events.append( ('failed', site, attempt, str( exception )) )
+
+    def succeeded( self, site, attempt, duration, total ):
+        self.events.append( ('succeeded', site, attempt) )
+
+    def gave_up( self, site, attempts, exception, reason, total ):
+        self.events.append( ('gave_up', site, attempts, reason) )
+
+
+class TestRetryObserver( TestCase ):
+    def test_events( self ):
+        observer = Recorder( )
+        run( Flaky( 1 ), observer=observer, site='foo' )
+        self.assertEqual( observer.events, [ ('started', 'foo', 1),
+                                             ('failed', 'foo', 1, 'attempt 1'),
+                                             ('started', 'foo', 2),
+                                             ('succeeded', 'foo', 2) ] )
+
+    def test_reasons( self ):
+        observer = Recorder( )
+
+        def reasons( **kwargs ):
+            del observer.events[ : ]
+            try:
+                for attempt in retry( observer=observer, site='foo', **kwargs ):
+                    with attempt:
+                        raise RuntimeError( 'down' )
+            except (RuntimeError, CircuitOpenError):
+                pass
+            return [ e[ 2: ] for e in observer.events if e[ 0 ] == 'gave_up' ]
+
+        self.assertEqual( reasons( timeout=0 ), [ (1, 'timeout') ] )
+        self.assertEqual( reasons( delays=[ 0 ], timeout=10 ), [ (1, 'unretryable') ] )
+        self.assertEqual( reasons( delays=[ .1 ], timeout=.25, predicate=always ),
+                          [ (3, 'timeout') ] )
+        budget = RetryBudget( ratio=0, min_per_second=0.1, window=10 )
+        self.assertEqual( reasons( delays=[ 0 ], timeout=10, predicate=always, budget=budget ),
+                          [ (2, 'budget') ] )
+        breaker = CircuitBreaker( threshold=2, reset_timeout=60 )
+        self.assertEqual( reasons( delays=[ 0 ], timeout=10, predicate=always,
+                                   breaker=breaker ),
+                          [ (2, 'circuit_open') ] )
+        self.assertEqual( reasons( delays=[ 0 ], timeout=10, predicate=always,
+                                   breaker=breaker ),
+                          [ (0, 'circuit_open') ] )
+
+    def test_site( self ):
+        observer = Recorder( )
+        run( Flaky( 0 ), observer=observer )
+        site = observer.events[ 0 ][ 1 ]
+        self.assertTrue( site.startswith( __name__ + ':run:' ), site )
+
+
+class TestRetryMetrics( TestCase ):
+    def test_metrics( self ):
+        metrics = RetryMetrics( )
+
+        def slow( ):
+            for attempt in retry( delays=[ 0 ], timeout=10, observer=metrics, site='slow' ):
+                with attempt:
+                    time.sleep( .05 )
+                    raise RuntimeError( 'slow' )
+
+        for _ in range( 2 ):
+            run( Flaky( 2 ), observer=metrics, site='flaky' )
+        self.assertRaises( RuntimeError, slow )
+        metrics = metrics.as_dict( )
+        self.assertEqual( set( metrics ), { 'flaky', 'slow' } )
+        m = metrics[ 'flaky' ]
+        self.assertEqual( (m[ 'operations' ], m[ 'attempts' ], m[ 'failures' ], m[ 'successes' ]),
+                          (2, 6, 4, 2) )
+        self.assertEqual( m[ 'attempts_per_operation' ], { 3: 2 } )
+        self.assertEqual( m[ 'attempt_latency' ][ 'count' ], 6 )
+        self.assertEqual( m[ 'total_latency' ][ 'count' ], 2 )
+        self.assertEqual( sum( n for _, n in m[ 'total_latency' ][ 'buckets' ] ), 2 )
+        self.assertGreaterEqual( m[ 'retry_latency' ], 0 )
+        m = metrics[ 'slow' ]
+        self.assertEqual( m[ 'gave_up' ], { 'unretryable': 1 } )
+        self.assertEqual( m[ 'successes' ], 0 )
+        self.assertGreaterEqual( m[ 'gave_up_latency' ], .05 )
+        self.assertGreaterEqual( m[ 'attempt_latency' ][ 'max' ], .05 )
+
+    def test_threads( self ):
+        metrics = RetryMetrics( )
+
+        def target( ):
+            for _ in range( 100 ):
+                run( Flaky( 1 ), observer=metrics, site='foo' )
+
+        threads = [ threading.Thread( target=target ) for _ in range( 8 ) ]
+        for thread in threads:
+            thread.start( )
+        for thread in threads:
+            thread.join( )
+        m = metrics.as_dict( )[ 'foo' ]
+        self.assertEqual( (m[ 'operations' ], m[ 'attempts' ]), (800, 1600) )
@@ -1,6 +1,6 @@
 import unittest
 
-from bd2k.util.strings import interpolate
+from bd2k.util.strings import interpolate, interpolate_dict
 from bd2k.util.strings import to_english
 
 foo = 4
@@ -11,3 +11,27 @@ class TestStrings( unittest.TestCase ):
     def test_interpolate( self ):
         bar = 2  # should override the global foo
         self.assertEquals( interpolate( "{foo}{bar}" ), "42" )
+
+    def test_interpolate_precedence( self ):
+        foo = 5
+        self.assertEquals( interpolate( "{foo}{bar}" ), "51" )
+        self.assertEquals( interpolate( "{foo}{bar}", foo=6 ), "61" )
+        self.assertEquals( interpolate_dict( "{foo}{bar}", dict( bar=7 ) ), "57" )
+        # The same template again, now that its names are cached
+        self.assertEquals( interpolate( "{foo}{bar}", bar=8 ), "58" )
+
+    def test_interpolate_fields( self ):
+        xs = [ 1, 2 ]
+        width = 4
+        self.assertEquals( interpolate( "{xs[1]}{foo.real}{{foo}}" ), "24{foo}" )
+        self.assertEquals( interpolate( "{foo:>{width}}|{bar!r}" ), "   4|1" )
+        self.assertRaises( KeyError, interpolate, "{missing}" )
+        self.assertRaises( IndexError, interpolate, "{}" )
+
+    def test_interpolate_skip_frames( self ):
+        def log( template ):
+            foo = 0
+            return interpolate( template, skip_frames=1 )
+
+        foo = 3
+        self.assertEquals( log( "{foo}" ), "3" )
@@ -0,0 +1,104 @@
+from builtins import range
+import itertools
+import multiprocessing
+import threading
+import time
+from unittest import TestCase
+
+from mock import patch
+
+from bd2k.util.d32 import standard as d32
+from bd2k.util.ulid import timestamp, ulid, ulids
+
+
+def random_part( s ):
+    return d32.decode( s )[ 6:10 ]
+
+
+class TestUlid( TestCase ):
+    def test_encoding( self ):
+        for s in [ ulid( ) for _ in range( 100 ) ] + ulids( 100 ):
+            self.assertEqual( d32.encode( d32.decode( s ) ), s )
+            self.assertEqual( len( d32.decode( s ) ), 16 )
+
+    def test_threads( self ):
+        """
+        IDs are unique across threads and ascending within each thread.
+        """
+        results = [ ]
+
+        def generate( ):
+            ids = [ ]
+            for i in range( 1000 ):
+                if i % 100:
+                    ids.append( ulid( ) )
+                else:
+                    ids.extend( ulids( 100 ) )
+            results.append( ids )
+
+        threads = [ threading.Thread( target=generate ) for _ in range( 8 ) ]
+        for thread in threads:
+            thread.start( )
+        for thread in threads:
+            thread.join( )
+        for ids in results:
+            self.assertEqual( ids, sorted( ids ) )
+        all_ids = sum( results, [ ] )
+        self.assertEqual( len( set( all_ids ) ), len( all_ids ) )
+        self.assertEqual( len( set( map( random_part, all_ids ) ) ), 1 )
+
+    def test_order_across_threads( self ):
+        """
+        An ID is greater than all IDs returned to any thread before the call creating it started.
+        """
+        calls = [ ]
+        start = threading.Event( )
+
+        def generate( ):
+            start.wait( )
+            for i in range( 1000 ):
+                # A global counter that each call reads before and after, to tell which calls
+                # finished before which other calls started
+                before = next( sequence )
+                ids = ulids( 10 ) if i % 10 else [ ulid( ) ]
+                after = next( sequence )
+                calls.append( (before, after, ids) )
+
+        sequence = itertools.count( )
+        threads = [ threading.Thread( target=generate ) for _ in range( 8 ) ]
+        for thread in threads:
+            thread.start( )
+        start.set( )
+        for thread in threads:
+            thread.join( )
+        calls.sort( )
+        # For each call, the greatest ID returned by any call that finished before it started
+        finished = sorted( (after, max( ids )) for before, after, ids in calls )
+        greatest, j = None, 0
+        for before, after, ids in calls:
+            while j < len( finished ) and finished[ j ][ 0 ] < before:
+                if greatest is None or finished[ j ][ 1 ] > greatest:
+                    greatest = finished[ j ][ 1 ]
+                j += 1
+            if greatest is not None:
+                self.assertLess( greatest, min( ids ) )
+        all_ids = [ x for _, _, ids in calls for x in ids ]
+        self.assertEqual( len( set( all_ids ) ), len( all_ids ) )
+
+    def test_clock_adjustment( self ):
+        before = ulid( )
+        with patch( 'time.time', lambda: 0.0 ):
+            after = ulid( )
+        self.assertLess( before, after )
+        self.assertLess( abs( timestamp( after ) - time.time( ) ), 60 )
+
+    def test_fork( self ):
+        context = multiprocessing.get_context( 'fork' )
+        pool = context.Pool( 2 )
+        try:
+            ids = pool.map( ulids, [ 10 ] * 4 )
+        finally:
+            pool.close( )
+            pool.join( )
+        children = set( map( random_part, sum( ids, [ ] ) ) )
+        self.assertNotIn( random_part( ulid( ) ), children )
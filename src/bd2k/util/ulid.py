@@ -0,0 +1,103 @@
+"""
+Unique identifiers that sort by the time they were created at, similar to ULIDs. Each ID has
+128 bits: a 48-bit timestamp in milliseconds since the epoch, 32 random bits that are fixed per
+process and a 48-bit counter that starts at a random value in each process. The bits are encoded
+with bd2k.util.d32.standard, resulting in 26 characters that sort like the IDs they represent.
+
+Within a process, IDs are unique, even across threads, and an ID is greater than any ID
+returned before the call that created it started, even if that ID was returned to another
+thread, and even if the system clock is adjusted. The IDs of calls that overlap in time, in
+different threads, may sort in either order. Getting the next counter value is an atomic
+operation, so no lock is needed. The timestamps are derived from a monotonic clock that is
+synchronized with the system clock once, when this module is imported. Child processes created
+with fork use a different random part and counter.
+
+>>> a, b = ulid( ), ulid( )
+>>> len( a ), a < b
+(26, True)
+>>> ids = ulids( 1000 )
+>>> ids == sorted( ids ) and b < ids[ 0 ]
+True
+>>> abs( timestamp( a ) - time.time( ) ) < 60
+True
+"""
+from __future__ import absolute_import
+from __future__ import division
+
+import itertools
+import os
+import random
+import time
+from builtins import int
+from builtins import range
+
+from bd2k.util.d32 import standard as d32
+
+try:
+    _monotonic = time.monotonic
+except AttributeError:
+    _monotonic = time.time
+
+_rng = random.SystemRandom( )
+
+# The system clock in milliseconds, at the time the monotonic clock had the value
+# _monotonic_start in seconds
+_wall_start = int( time.time( ) * 1000 )
+_monotonic_start = _monotonic( )
+
+# Set by _reseed()
+_random_bits = None
+_counter = None
+
+
+def _reseed( ):
+    global _random_bits, _counter
+    _random_bits = _rng.getrandbits( 32 ) << 48
+    # Leave plenty of room before the counter overflows into the random bits
+    _counter = itertools.count( _rng.getrandbits( 47 ) )
+
+
+_reseed( )
+
+try:
+    os.register_at_fork( after_in_child=_reseed )
+except AttributeError:
+    pass
+
+# Each 10-bit value encoded as two D32 characters
+_pairs = [ chr( d32.alphabet[ i >> 5 ] ) + chr( d32.alphabet[ i & 31 ] ) for i in range( 1024 ) ]
+
+# 128 bits shifted left by two bits make for 13 groups of 10 bits
+_shifts = tuple( range( 120, -10, -10 ) )
+
+
+def _now( ):
+    """
+    The current time in milliseconds since the epoch, never going backwards
+    """
+    return _wall_start + int( (_monotonic( ) - _monotonic_start) * 1000 )
+
+
+def ulid( ):
+    """
+    Return a new ID.
+    """
+    x = (_now( ) << 80 | _random_bits | next( _counter )) << 2
+    return ''.join( [ _pairs[ x >> shift & 1023 ] for shift in _shifts ] )
+
+
+def ulids( n ):
+    """
+    Return a list of the given number of new IDs, in ascending order. This is considerably faster
+    than invoking ulid() the given number of times.
+    """
+    prefix = _now( ) << 80 | _random_bits
+    counts = list( itertools.islice( _counter, n ) )
+    return d32.encode_many( [ (prefix | count).to_bytes( 16, 'big' ) for count in counts ] )
+
+
+def timestamp( s ):
+    """
+    Return the time at which the given ID was created, in seconds since the epoch.
+    """
+    return (int.from_bytes( d32.decode( s ), 'big' ) >> 80) / 1000